@@ -0,0 +1,168 @@
+import json
+import time
+from typing import TYPE_CHECKING, Callable, Optional
+from philo.clients import get_openai_client
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+
+class OpenAIBatchClient:
+    """Submit request files to the OpenAI Batch API and download their results."""
+
+    def __init__(self, client: Optional["OpenAI"] = None):
+        # Share the connections of the chatbots unless given a client
+        self.client = client if client is not None else get_openai_client()
+
+    def submit(self, request_file_path: str) -> str:
+        """Upload a request file and start a batch.
+
+        Args:
+            request_file_path (str): The JSONL file of requests.
+
+        Returns:
+            str: The batch id.
+        """
+        with open(request_file_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window="24h",
+        )
+        return batch.id
+
+    def status(self, batch_id: str) -> str:
+        """Get the status of a batch.
+
+        Args:
+            batch_id (str): The batch id.
+
+        Returns:
+            str: The status, e.g. "in_progress" or "completed".
+        """
+        return self.client.batches.retrieve(batch_id).status
+
+    def download(self, batch_id: str, result_file_path: str) -> None:
+        """Download the results of a completed batch.
+
+        Args:
+            batch_id (str): The batch id.
+            result_file_path (str): Where to write the JSONL file of results.
+
+        Raises:
+            ValueError: The batch has not completed.
+        """
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status != "completed":
+            raise ValueError(f"Batch {batch_id} is {batch.status}, not completed.")
+        content = self.client.files.content(batch.output_file_id)
+        with open(result_file_path, "wb") as f:
+            f.write(content.read())
+
+
+class LocalBatchClient:
+    """A stand-in for OpenAIBatchClient that answers every request in-process.
+
+    Results are written in the same format as the Batch API output files.
+    """
+
+    def __init__(self, respond: Callable[[dict], str]):
+        """Create the client.
+
+        Args:
+            respond (Callable[[dict], str]): Maps a request body to the response content.
+        """
+        self.respond = respond
+        self.batches = {}
+
+    def submit(self, request_file_path: str) -> str:
+        """Answer every request in a request file.
+
+        Args:
+            request_file_path (str): The JSONL file of requests.
+
+        Returns:
+            str: The batch id.
+        """
+        batch_id = f"batch_local_{len(self.batches)}"
+        collect = []
+        with open(request_file_path, "r") as f:
+            for line in f:
+                request = json.loads(line)
+                content = self.respond(request["body"])
+                collect.append(
+                    {
+                        "id": f"{batch_id}_{len(collect)}",
+                        "custom_id": request["custom_id"],
+                        "response": {
+                            "status_code": 200,
+                            "body": {"choices": [{"message": {"content": content}}]},
+                        },
+                        "error": None,
+                    }
+                )
+        self.batches[batch_id] = collect
+        return batch_id
+
+    def status(self, batch_id: str) -> str:
+        """Local batches complete on submission.
+
+        Args:
+            batch_id (str): The batch id.
+
+        Returns:
+            str: Always "completed".
+        """
+        return "completed"
+
+    def download(self, batch_id: str, result_file_path: str) -> None:
+        """Write the results of a batch.
+
+        Args:
+            batch_id (str): The batch id.
+            result_file_path (str): Where to write the JSONL file of results.
+        """
+        with open(result_file_path, "w") as f:
+            for result in self.batches[batch_id]:
+                f.write(json.dumps(result) + "\n")
+
+
+def wait_for_batch(client, batch_id: str, poll_seconds: float = 60.0) -> str:
+    """Wait until a batch is no longer running.
+
+    Args:
+        client (OpenAIBatchClient | LocalBatchClient): The batch client.
+        batch_id (str): The batch id.
+        poll_seconds (float, optional): Time between status checks. Defaults to 60.0.
+
+    Returns:
+        str: The final status of the batch.
+    """
+    while True:
+        status = client.status(batch_id)
+        if status not in ["validating", "in_progress", "finalizing"]:
+            return status
+        time.sleep(poll_seconds)
+
+
+def read_batch_results(result_file_path: str) -> dict:
+    """Read the successful responses from a Batch API output file.
+
+    Args:
+        result_file_path (str): The JSONL file of results.
+
+    Returns:
+        dict: Maps each request's custom_id to the response content.
+    """
+    collect = {}
+    with open(result_file_path, "r") as f:
+        for line in f:
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") is not None or response.get("status_code") != 200:
+                continue
+            collect[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return collect
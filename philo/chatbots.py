@@ -1,22 +1,107 @@
-from openai import OpenAI
+import os
+import threading
+from typing import Iterator, List, Optional, Protocol
+from philo.clients import get_openai_client
 from philo.utils import MessageType
 
+# The models OpenAIChat accepts when it talks to the OpenAI API itself
+OPENAI_MODELS = ["gpt-4-1106-preview", "gpt-4", "gpt-3.5-turbo", "gpt-4o", "gpt-4o-mini"]
+# The model of every prompt of a run but the scores, and the faster model of the scores
+DEFAULT_MODEL = "gpt-4-1106-preview"
+DEFAULT_SCORE_MODEL = "gpt-3.5-turbo"
+
+
+class ChatBackend(Protocol):
+    """What Questioner needs from a chatbot, e.g. OpenAIChat or philo.fake_chat.FakeChat."""
+
+    model: str
+
+    def send_receive(
+        self,
+        user_question: str,
+        temperature: float = 0.0,
+        seed: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> str:
+        """Send a prompt and return the response text."""
+
+    def send_receive_candidates(
+        self,
+        user_question: str,
+        n: int,
+        temperature: float = 0.0,
+        seed: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> List[str]:
+        """Send a prompt once and return n candidate responses."""
+
+    def stream_response(
+        self, user_question: str, temperature: float = 0.0, seed: int = 1
+    ) -> Iterator[str]:
+        """Send a prompt and yield the response text as it is generated."""
+
+    def get_request_body(
+        self,
+        user_question: str,
+        temperature: float = 0.0,
+        seed: int = 1,
+        n: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> dict:
+        """Get the request a prompt is sent as, to hash it for the history."""
+
+    def get_last_usage(self) -> Optional[dict]:
+        """Get the token usage of the last response received by the calling thread."""
+
 
 class OpenAIChat:
     def __init__(
         self,
         model: str = "gpt-4-1106-preview",
         role_str: str = "You are a helpful assistant.",
+        stateless: bool = False,
+        client=None,
+        base_url: Optional[str] = None,
     ) -> None:
-        self.client = OpenAI()
+        # The OpenAI client; if not given, the shared client of the server (see philo.clients)
+        self._client = client
+        # An OpenAI-compatible server to send requests to instead of the OpenAI API, e.g. a local model
+        self.base_url = base_url
         self.role_str = role_str
-        if model not in ["gpt-4-1106-preview", "gpt-4", "gpt-3.5-turbo"]:
+        # If true, send_receive sends only the system role and the current question
+        self.stateless = stateless
+        # Other servers serve models of their own, so only OpenAI model names are checked
+        if base_url is None and model not in OPENAI_MODELS:
             raise ValueError(f"Model {model} not available for chat.")
         self.model = model
         self.current_answer = ""
         self.current_question = ""
+        # The usage of the last response, per thread
+        self.local = threading.local()
         self.reset_messages()
 
+    def get_api_key(self) -> Optional[str]:
+        """Get the API key of the server.
+
+        Returns:
+            Optional[str]: None to read OPENAI_API_KEY for the OpenAI API. Other servers usually
+                need no key, but the client requires one.
+        """
+        if self.base_url is None:
+            return None
+        return os.environ.get("OPENAI_API_KEY", "none")
+
+    @property
+    def client(self):
+        """The OpenAI client: the one given, or the process-wide client of the server.
+
+        Returns:
+            OpenAI: The client.
+        """
+        if self._client is not None:
+            return self._client
+        return get_openai_client(self.base_url, self.get_api_key())
+
     def reset_messages(self) -> None:
         """Reset the chat history to the initial state."""
         self.messages = [{"role": "system", "content": self.role_str}]
@@ -44,12 +129,15 @@ class OpenAIChat:
         messages = [
             {"role": message["role"], "content": message["content"]} for message in self.messages
         ]
+        # A failed request must not leave the usage of the one before it
+        self.local.usage = None
         response = self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             temperature=temperature,
-            seed=1,
+            seed=seed,
         )
+        self.set_last_usage(response)
         return response
 
     def set_messages_from(self, messages: MessageType) -> None:
@@ -68,17 +156,37 @@ class OpenAIChat:
         """
         return self.messages
 
-    def send_receive(self, user_question: str, temperature: float = 0.0, seed: int = 1) -> str:
+    def send_receive(
+        self,
+        user_question: str,
+        temperature: float = 0.0,
+        seed: int = 1,
+        stateless: Optional[bool] = None,
+        response_format: Optional[dict] = None,
+    ) -> str:
         """Send and receive a message from the chatbot
 
+        In conversation mode the question and answer are appended to the chat history,
+        and the whole history is sent with every question.
+        In stateless mode only the system role and the current question are sent.
+
         Args:
             user_question (str): The message to send to the chatbot.
             temperature (float, optional): The randomness of the response. Higher values are more random. Defaults to 0.0.
             seed (int, optional): The seed for the randomness. Defaults to 1.
+            stateless (Optional[bool], optional): Override the stateless mode of the chatbot. Defaults to None.
+            response_format (Optional[dict], optional): Constrain the response, e.g. to a JSON schema
+                (see philo.schemas). Only sent in stateless mode. Defaults to None (free text).
 
         Returns:
-            str: _description_
+            str: The response from the chatbot
         """
+        if stateless is None:
+            stateless = self.stateless
+        if stateless:
+            return self.get_single_response(
+                user_question, temperature=temperature, seed=seed, response_format=response_format
+            )
         self.current_question = user_question
         self.add_message("user", user_question)
         response = self.get_response(temperature=temperature, seed=seed)
@@ -86,3 +194,151 @@ class OpenAIChat:
         self.add_message("assistant", response)
         self.current_answer = response
         return response
+
+    def get_single_response(
+        self,
+        user_question: str,
+        temperature: float = 0.0,
+        seed: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> str:
+        """Send a single message without reading or updating the chat history.
+
+        This is the stateless mode of send_receive. Safe to call from several threads at once.
+
+        Args:
+            user_question (str): The message to send to the chatbot.
+            temperature (float, optional): The randomness of the response. Higher values are more random. Defaults to 0.0.
+            seed (int, optional): The seed for the randomness. Defaults to 1.
+            response_format (Optional[dict], optional): Constrain the response, e.g. to a JSON schema.
+                Defaults to None (free text).
+
+        Returns:
+            str: The response from the chatbot
+        """
+        request_body = self.get_request_body(
+            user_question, temperature=temperature, seed=seed, response_format=response_format
+        )
+        self.local.usage = None
+        response = self.client.chat.completions.create(**request_body)
+        self.set_last_usage(response)
+        return response.choices[0].message.content
+
+    def send_receive_candidates(
+        self,
+        user_question: str,
+        n: int,
+        temperature: float = 0.0,
+        seed: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> List[str]:
+        """Ask for several completions of a stateless message in a single request.
+
+        One round-trip returns n candidates, sampled at the same temperature, e.g. to keep the
+        first that parses or to vote between them. The prompt tokens are only paid once.
+
+        Args:
+            user_question (str): The message to send to the chatbot.
+            n (int): The number of candidates.
+            temperature (float, optional): The randomness of the candidates. Defaults to 0.0.
+            seed (int, optional): The seed for the randomness. Defaults to 1.
+            response_format (Optional[dict], optional): Constrain the candidates, e.g. to a JSON
+                schema. Defaults to None (free text).
+
+        Returns:
+            List[str]: The candidate responses, in the order of the choices.
+        """
+        request_body = self.get_request_body(
+            user_question, temperature=temperature, seed=seed, n=n, response_format=response_format
+        )
+        self.local.usage = None
+        response = self.client.chat.completions.create(**request_body)
+        self.set_last_usage(response)
+        return [choice.message.content for choice in response.choices]
+
+    def stream_response(
+        self, user_question: str, temperature: float = 0.0, seed: int = 1
+    ) -> Iterator[str]:
+        """Send a stateless message and yield the response text as it is generated.
+
+        The request is the same as get_single_response's, so its response is cached under the
+        same hash. Closing the generator early closes the connection, which stops reading,
+        and paying for, the rest of the generation.
+
+        Args:
+            user_question (str): The message to send to the chatbot.
+            temperature (float, optional): The randomness of the response. Higher values are more random. Defaults to 0.0.
+            seed (int, optional): The seed for the randomness. Defaults to 1.
+
+        Yields:
+            str: The parts of the response, in order.
+        """
+        request_body = self.get_request_body(user_question, temperature=temperature, seed=seed)
+        self.local.usage = None
+        stream = self.client.chat.completions.create(
+            **request_body, stream=True, stream_options={"include_usage": True}
+        )
+        try:
+            for chunk in stream:
+                # The usage comes last, in a chunk without choices
+                if chunk.usage is not None:
+                    self.local.usage = chunk.usage.model_dump()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            stream.close()
+
+    def set_last_usage(self, response) -> None:
+        """Keep the token usage of a response for get_last_usage.
+
+        Args:
+            response (ChatCompletion): The response.
+        """
+        usage = getattr(response, "usage", None)
+        self.local.usage = usage.model_dump() if usage is not None else None
+
+    def get_last_usage(self) -> Optional[dict]:
+        """Get the token usage of the last response received by the calling thread.
+
+        Returns:
+            Optional[dict]: The usage, with "prompt_tokens" and "completion_tokens", or None if unknown.
+        """
+        return getattr(self.local, "usage", None)
+
+    def get_request_body(
+        self,
+        user_question: str,
+        temperature: float = 0.0,
+        seed: int = 1,
+        n: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> dict:
+        """Get the body of a stateless chat completion request.
+
+        Args:
+            user_question (str): The message to send to the chatbot.
+            temperature (float, optional): The randomness of the response. Higher values are more random. Defaults to 0.0.
+            seed (int, optional): The seed for the randomness. Defaults to 1.
+            n (int, optional): The number of completions to ask for. Defaults to 1.
+            response_format (Optional[dict], optional): Constrain the response, e.g. to a JSON schema.
+                Defaults to None (free text).
+
+        Returns:
+            dict: The request body, as accepted by the chat completions endpoint.
+        """
+        messages = [
+            {"role": "system", "content": self.role_str},
+            {"role": "user", "content": user_question},
+        ]
+        body = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "seed": seed,
+        }
+        # Left out for a single completion, so that the hashes of earlier requests still match
+        if n > 1:
+            body["n"] = n
+        if response_format is not None:
+            body["response_format"] = response_format
+        return body
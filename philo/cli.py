@@ -0,0 +1,179 @@
+import argparse
+import os
+from typing import List, Optional
+from philo.chatbots import DEFAULT_MODEL, DEFAULT_SCORE_MODEL
+
+# The stages of get_questioner_stages, in order; each is a subcommand that runs it and the
+# stages it depends on
+STAGE_COMMANDS = [
+    "philosophies",
+    "actions",
+    "cluster_labels",
+    "action_clusters",
+    "action_scores",
+    "scorecard",
+]
+
+
+def get_parser() -> argparse.ArgumentParser:
+    """Build the parser of the philo command line.
+
+    Returns:
+        argparse.ArgumentParser: The parser, with a "run" subcommand for every stage and one per stage.
+    """
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument(
+        "--resume",
+        action="store_true",
+        help="Restore stages from results/checkpoints instead of running them.",
+    )
+    options.add_argument(
+        "--stream",
+        action="store_true",
+        help="Score every action as soon as its philosophy's actions arrive.",
+    )
+    options.add_argument(
+        "--dedup-threshold",
+        type=float,
+        default=None,
+        help="Merge actions at least this similar (0 to 1, e.g. 0.65) before scoring them.",
+    )
+    options.add_argument(
+        "--cluster-backend",
+        choices=["llm", "local"],
+        default="llm",
+        help="Assign actions to clusters with one prompt per action, or locally.",
+    )
+    options.add_argument(
+        "--model",
+        default=DEFAULT_MODEL,
+        help="The model of every prompt but the scores.",
+    )
+    options.add_argument(
+        "--score-model",
+        default=DEFAULT_SCORE_MODEL,
+        help="The model of the score_action prompts.",
+    )
+    options.add_argument(
+        "--base-url",
+        default=None,
+        help="An OpenAI-compatible server to use instead of the OpenAI API, e.g. a local model.",
+    )
+    options.add_argument(
+        "--candidates",
+        type=int,
+        default=1,
+        help="Retry unparsable responses by asking for this many candidates in one request.",
+    )
+    options.add_argument(
+        "--vote",
+        action="store_true",
+        help="Score every action with --candidates candidates and keep the majority label.",
+    )
+    options.add_argument(
+        "--stream-responses",
+        action="store_true",
+        help="Parse responses while they stream in, and retry a malformed one at once.",
+    )
+    options.add_argument(
+        "--structured-output",
+        action="store_true",
+        help="Ask for JSON constrained to every prompt's schema, and validate it strictly.",
+    )
+    options.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=8,
+        help="Maximum number of per-action requests in flight at once.",
+    )
+    options.add_argument(
+        "--max-rpm",
+        type=float,
+        default=None,
+        help="Send at most this many requests per minute, e.g. the account's limit.",
+    )
+    options.add_argument(
+        "--max-tpm",
+        type=float,
+        default=None,
+        help="Send at most this many prompt tokens per minute, e.g. the account's limit.",
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="philo", description="Score actions against philosophies."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "run", parents=[options], help="Run every stage, from philosophies to scorecard."
+    )
+    for name in STAGE_COMMANDS:
+        commands.add_parser(
+            name, parents=[options], help=f"Run the {name} stage and the stages it depends on."
+        )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the philo command line.
+
+    Args:
+        argv (Optional[List[str]], optional): The arguments. Defaults to None (sys.argv[1:]).
+    """
+    parser = get_parser()
+    args = parser.parse_args(argv)
+
+    # Imported after parsing so that --help and argument errors stay fast
+    from philo.clients import set_pool_limits
+    from philo.pipeline import Pipeline, get_questioner_stages
+    from philo.questioner import Questioner
+    from philo.rate_limit import RateLimiter
+
+    # Cluster assignment and scoring run at the same time, each with up to max_concurrency requests
+    n_connections = 2 * args.max_concurrency
+    set_pool_limits(max_connections=n_connections, max_keepalive_connections=n_connections)
+
+    if args.vote and args.candidates < 2:
+        parser.error("--vote needs --candidates 2 or more.")
+    if args.structured_output and args.stream_responses:
+        parser.error("--structured-output cannot be used with --stream-responses.")
+    q = Questioner(
+        max_concurrency=args.max_concurrency,
+        n_candidates=args.candidates,
+        majority_vote=args.vote,
+        stream_responses=args.stream_responses,
+        structured_output=args.structured_output,
+        rate_limiter=RateLimiter(args.max_rpm, args.max_tpm),
+    )
+    # Use a faster model for the scores, GPT-3.5-turbo by default
+    q.set_run_chatbots(model=args.model, score_model=args.score_model, base_url=args.base_url)
+    ### Run the stages as a dependency graph ###
+    ###
+    # philosophies -> actions -> cluster_labels -> action_clusters -> scorecard
+    #                         -> action_scores ----------------------^
+    pipeline = Pipeline(
+        get_questioner_stages(
+            q,
+            pbar=True,
+            verbose=True,
+            stream=args.stream,
+            dedup_threshold=args.dedup_threshold,
+            cluster_backend=args.cluster_backend,
+        ),
+        checkpoint_dir=os.path.join("results", "checkpoints"),
+    )
+    targets = None
+    if args.command != "run":
+        targets = [args.command]
+        if args.stream and args.command == "action_scores":
+            # Streamed scores are fed by the actions stage
+            targets.append("actions")
+        if args.command not in pipeline.stages:
+            parser.error(f"No {args.command} stage with --cluster-backend {args.cluster_backend}.")
+    pipeline.run(resume=args.resume, targets=targets)
+    for name, seconds in pipeline.timings.items():
+        print(f"{name}: {seconds:.1f}s")
+    ### Where the time and tokens went ###
+    ###
+    os.makedirs("results", exist_ok=True)
+    q.metrics.export(os.path.join("results", "metrics.jsonl"))
+    print(q.metrics.format_summary())
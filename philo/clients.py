@@ -0,0 +1,73 @@
+import threading
+from typing import Optional
+
+# Limits of the connection pool of every shared client. Idle connections are kept alive
+# between requests so that their TCP and TLS handshakes are reused.
+pool_limits = {"max_connections": 100, "max_keepalive_connections": 20, "keepalive_expiry": 30.0}
+# Shared clients by base URL and API key
+clients = {}
+clients_lock = threading.Lock()
+
+
+def set_pool_limits(
+    max_connections: Optional[int] = None,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None,
+) -> None:
+    """Set the connection pool limits of the shared clients.
+
+    Clients created before are dropped, not closed, since requests may still be using them;
+    the next request creates a client with the new limits.
+
+    Args:
+        max_connections (Optional[int], optional): The maximum number of open connections per client.
+            Defaults to None (unchanged).
+        max_keepalive_connections (Optional[int], optional): The maximum number of idle connections
+            kept alive per client. Defaults to None (unchanged).
+        keepalive_expiry (Optional[float], optional): How long idle connections are kept alive, in
+            seconds. Defaults to None (unchanged).
+    """
+    with clients_lock:
+        if max_connections is not None:
+            pool_limits["max_connections"] = max_connections
+        if max_keepalive_connections is not None:
+            pool_limits["max_keepalive_connections"] = max_keepalive_connections
+        if keepalive_expiry is not None:
+            pool_limits["keepalive_expiry"] = keepalive_expiry
+        clients.clear()
+
+
+def get_openai_client(base_url: Optional[str] = None, api_key: Optional[str] = None):
+    """Get the shared OpenAI client of a server, creating it on first use.
+
+    Every chatbot of the process talking to the same server shares one client, and so one
+    connection pool, whatever its model.
+
+    Args:
+        base_url (Optional[str], optional): The server. Defaults to None (the OpenAI API).
+        api_key (Optional[str], optional): The API key. Defaults to None (OPENAI_API_KEY).
+
+    Returns:
+        OpenAI: The client.
+    """
+    key = (base_url, api_key)
+    client = clients.get(key)
+    if client is None:
+        with clients_lock:
+            client = clients.get(key)
+            if client is None:
+                import httpx
+                import openai
+
+                http_client = openai.DefaultHttpxClient(limits=httpx.Limits(**pool_limits))
+                client = openai.OpenAI(base_url=base_url, api_key=api_key, http_client=http_client)
+                clients[key] = client
+    return client
+
+
+def close_clients() -> None:
+    """Close the connections of the shared clients and forget them."""
+    with clients_lock:
+        for client in clients.values():
+            client.close()
+        clients.clear()
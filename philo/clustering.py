@@ -0,0 +1,133 @@
+import math
+from collections import Counter
+from typing import List, Optional, Tuple
+import numpy as np
+from philo.dedup import normalize_action
+
+
+def get_ngram_counts(text: str, ngram: int = 3) -> Counter:
+    """Count the character n-grams of a text, after normalizing it.
+
+    Words are padded with spaces so that their first and last letters get n-grams of their own.
+
+    Args:
+        text (str): The text.
+        ngram (int, optional): The n-gram length. Defaults to 3.
+
+    Returns:
+        Counter: The n-gram counts.
+    """
+    text = f" {normalize_action(text)} "
+    return Counter(text[i : i + ngram] for i in range(max(1, len(text) - ngram + 1)))
+
+
+def get_tfidf_matrix(texts: List[str], ngram: int = 3, max_features: int = 2048) -> np.ndarray:
+    """Vectorize texts as L2-normalized TF-IDF vectors of character n-grams.
+
+    Args:
+        texts (List[str]): The texts.
+        ngram (int, optional): The n-gram length. Defaults to 3.
+        max_features (int, optional): Keep only the n-grams found in the most texts. Defaults to 2048.
+
+    Returns:
+        np.ndarray: An (n_texts, n_features) float32 array.
+    """
+    counts = [get_ngram_counts(text, ngram) for text in texts]
+    document_frequency = Counter(g for c in counts for g in c)
+    # Sort by frequency, then alphabetically so that ties do not depend on the input order
+    features = sorted(document_frequency, key=lambda g: (-document_frequency[g], g))[:max_features]
+    feature_index = {g: i for i, g in enumerate(features)}
+    matrix = np.zeros((len(texts), len(features)), dtype=np.float32)
+    for row, c in enumerate(counts):
+        for g, count in c.items():
+            if g in feature_index:
+                matrix[row, feature_index[g]] = count
+    # Smoothed inverse document frequency, as in scikit-learn
+    n = len(texts)
+    idf = np.array(
+        [math.log((1 + n) / (1 + document_frequency[g])) + 1 for g in features], dtype=np.float32
+    )
+    matrix *= idf
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    n_iter: int = 100,
+    seed: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means: k-means on unit vectors, by cosine similarity, with k-means++ seeding.
+
+    Args:
+        vectors (np.ndarray): (n, d) unit vectors.
+        n_clusters (int): The number of clusters, at most n.
+        n_iter (int, optional): The maximum number of iterations. Defaults to 100.
+        seed (int, optional): The seed of the initial centroids. Defaults to 1.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The cluster of every vector, and the unit centroids. Clusters
+            left empty, e.g. by duplicate vectors, are dropped, so there can be fewer than
+            n_clusters, numbered from 0 without gaps.
+    """
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    # k-means++: pick each next centroid with probability proportional to its distance
+    centroids = [vectors[rng.integers(n)]]
+    distances = 1 - vectors @ centroids[0]
+    for _ in range(1, n_clusters):
+        weights = np.maximum(distances, 0)
+        if weights.sum() <= 0:
+            index = rng.integers(n)
+        else:
+            index = rng.choice(n, p=weights / weights.sum())
+        centroids.append(vectors[index])
+        distances = np.minimum(distances, 1 - vectors @ vectors[index])
+    centroids = np.array(centroids)
+
+    labels = np.full(n, -1)
+    for _ in range(n_iter):
+        similarities = vectors @ centroids.T
+        new_labels = similarities.argmax(axis=1)
+        if (new_labels == labels).all():
+            break
+        labels = new_labels
+        for k in range(n_clusters):
+            members = vectors[labels == k]
+            if len(members) == 0:
+                # Restart an empty cluster from the vector furthest from its centroid
+                members = vectors[[similarities.max(axis=1).argmin()]]
+            centroid = members.sum(axis=0)
+            centroids[k] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    # Number the clusters that have members without gaps
+    used, labels = np.unique(labels, return_inverse=True)
+    return labels, centroids[used]
+
+
+def cluster_actions(
+    actions: List[str],
+    n_clusters: Optional[int] = None,
+    seed: int = 1,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Cluster actions locally, by the TF-IDF vectors of their character n-grams.
+
+    Args:
+        actions (List[str]): The actions.
+        n_clusters (Optional[int], optional): The number of clusters. Defaults to None
+            (the square root of half the number of actions).
+        seed (int, optional): The seed of k-means. Defaults to 1.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The cluster of every action, numbered from 0 without gaps,
+            and its cosine similarity to its cluster centroid.
+    """
+    if not actions:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    if n_clusters is None:
+        n_clusters = max(1, round(math.sqrt(len(actions) / 2)))
+    n_clusters = min(n_clusters, len(actions))
+    vectors = get_tfidf_matrix(actions)
+    labels, centroids = kmeans(vectors, n_clusters, seed=seed)
+    similarities = (vectors * centroids[labels]).sum(axis=1)
+    return labels, similarities
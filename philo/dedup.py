@@ -0,0 +1,295 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+# The modulus of the MinHash permutations, small enough for a * h + b to fit in 64 bits
+MERSENNE_PRIME = (1 << 31) - 1
+NON_WORD = re.compile(r"[^a-z0-9]+")
+# The Jaccard similarity of word stems from which actions are merged by default
+DEDUP_THRESHOLD = 0.65
+# Words are compared by their first letters, so that "charity" and "charitable" match
+STEM_LENGTH = 5
+# Words that do not tell actions apart
+STOP_WORDS = {
+    "a",
+    "an",
+    "the",
+    "any",
+    "and",
+    "or",
+    "to",
+    "of",
+    "for",
+    "from",
+    "in",
+    "into",
+    "on",
+    "at",
+    "by",
+    "as",
+    "during",
+    "out",
+}
+# Words that reverse an action; actions are only merged if they have the same ones
+NEGATIONS = {
+    "not",
+    "no",
+    "never",
+    "none",
+    "nobody",
+    "nothing",
+    "nor",
+    "neither",
+    "without",
+    "refuse",
+    "refuses",
+    "refused",
+    "refusing",
+    "fail",
+    "fails",
+    "failed",
+    "failing",
+    "avoid",
+    "avoids",
+    "avoided",
+    "avoiding",
+}
+
+
+def normalize_action(action: str) -> str:
+    """Normalize an action for comparison: lowercase, alphanumeric words separated by single spaces.
+
+    Args:
+        action (str): The action.
+
+    Returns:
+        str: The normalized action.
+    """
+    return NON_WORD.sub(" ", action.lower()).strip()
+
+
+def get_words(action: str) -> List[str]:
+    """Split an action into normalized words, with "n't" spelled out as "not".
+
+    Args:
+        action (str): The action.
+
+    Returns:
+        List[str]: The words.
+    """
+    return normalize_action(action.lower().replace("n't", " not")).split()
+
+
+def get_shingles(words: List[str]) -> set:
+    """Get the word stems of an action, without stop words.
+
+    Character n-grams of the whole action rate "Helping a friend" and "Not helping a friend"
+    as more similar than rewordings like "Donating to any charitable cause", so words are
+    compared instead, by their first STEM_LENGTH letters.
+
+    Args:
+        words (List[str]): The words, from get_words.
+
+    Returns:
+        set: The stems. An action of stop words only is its own single stem.
+    """
+    stems = {word[:STEM_LENGTH] for word in words if word not in STOP_WORDS}
+    return stems or {" ".join(words)}
+
+
+def get_guard(words: List[str]) -> Tuple[str, frozenset]:
+    """Get what two actions must have in common to be duplicates, however similar they are.
+
+    Actions usually start with their verb, and sharing everything else does not make
+    "Helping a family member" and "Lying to a family member" the same action. Neither are
+    "Helping a friend" and "Not helping a friend".
+
+    Args:
+        words (List[str]): The words, from get_words.
+
+    Returns:
+        Tuple[str, frozenset]: The stem of the first word that is neither a stop word nor a
+            negation, and the NEGATIONS among the words.
+    """
+    head = next((w for w in words if w not in STOP_WORDS and w not in NEGATIONS), "")
+    return head[:STEM_LENGTH], frozenset(word for word in words if word in NEGATIONS)
+
+
+def get_jaccard(a: set, b: set) -> float:
+    """Get the Jaccard similarity of two sets.
+
+    Args:
+        a (set): The first set.
+        b (set): The second set.
+
+    Returns:
+        float: The size of the intersection over the size of the union.
+    """
+    return len(a & b) / len(a | b)
+
+
+def get_lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Choose the number of LSH bands and rows per band for a similarity threshold.
+
+    Two sets of Jaccard similarity s share a band with probability 1 - (1 - s^rows)^bands,
+    an S-curve that rises around (1 / bands)^(1 / rows). The split whose rise is closest to,
+    but not above, the threshold is chosen, so that few similar pairs are missed.
+
+    Args:
+        threshold (float): The Jaccard similarity threshold.
+        num_perm (int): The number of MinHash permutations.
+
+    Returns:
+        Tuple[int, int]: The number of bands and of rows per band.
+    """
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows != 0:
+            continue
+        bands = num_perm // rows
+        rise = (1 / bands) ** (1 / rows)
+        if rise <= threshold and threshold - rise < best_error:
+            best, best_error = (bands, rows), threshold - rise
+    return best
+
+
+class MinHashLSH:
+    """An incremental near-duplicate index of texts, by MinHash signatures and LSH bands.
+
+    Candidates that share a band are checked against the exact Jaccard similarity of their
+    word stems, so the threshold is never crossed by an approximation. Texts with another
+    first word or other negations ("not", "never", "refuse"...) are never duplicates; see
+    get_guard.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = 128,
+        seed: int = 1,
+    ):
+        """Create an empty index.
+
+        Args:
+            threshold (float, optional): The Jaccard similarity from which texts are duplicates.
+                Defaults to DEDUP_THRESHOLD.
+            num_perm (int, optional): The number of MinHash permutations. Defaults to 128.
+            seed (int, optional): The seed of the permutations. Defaults to 1.
+        """
+        self.threshold = threshold
+        self.bands, self.rows = get_lsh_bands(threshold, num_perm)
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.buckets = [defaultdict(list) for _ in range(self.bands)]
+        self.shingles = {}
+        self.guards = {}
+
+    def get_signature(self, shingles: set) -> np.ndarray:
+        """Get the MinHash signature of a set of stems.
+
+        Args:
+            shingles (set): The stems.
+
+        Returns:
+            np.ndarray: num_perm minimum hashes.
+        """
+        p = np.uint64(MERSENNE_PRIME)
+        hashes = np.array([zlib.crc32(s.encode("utf-8")) for s in shingles], dtype=np.uint64) % p
+        # (a * h + b) mod p for every stem and permutation; a, b and h are below 2^31
+        return ((np.outer(hashes, self.a) + self.b) % p).min(axis=0)
+
+    def get_band_keys(self, signature: np.ndarray) -> List[bytes]:
+        """Split a signature into its LSH band keys.
+
+        Args:
+            signature (np.ndarray): The MinHash signature.
+
+        Returns:
+            List[bytes]: One key per band.
+        """
+        return [
+            signature[i * self.rows : (i + 1) * self.rows].tobytes() for i in range(self.bands)
+        ]
+
+    def query(self, text: str, add: bool = False) -> Optional[str]:
+        """Find the indexed text most similar to a text, if any is similar enough.
+
+        Args:
+            text (str): The text.
+            add (bool, optional): If true and no indexed text is similar enough, add the text. Defaults to False.
+
+        Returns:
+            Optional[str]: The indexed text, or None if none reaches the threshold.
+        """
+        words = get_words(text)
+        shingles = get_shingles(words)
+        guard = get_guard(words)
+        band_keys = self.get_band_keys(self.get_signature(shingles))
+        candidates = set()
+        for band, key in enumerate(band_keys):
+            candidates.update(self.buckets[band].get(key, []))
+        best, best_similarity = None, self.threshold
+        # Sort so that ties go to the same text whatever the set order
+        for candidate in sorted(candidates):
+            if self.guards[candidate] != guard:
+                continue
+            similarity = get_jaccard(shingles, self.shingles[candidate])
+            if similarity >= best_similarity and (best is None or similarity > best_similarity):
+                best, best_similarity = candidate, similarity
+        if best is None and add:
+            self.shingles[text] = shingles
+            self.guards[text] = guard
+            for band, key in enumerate(band_keys):
+                self.buckets[band][key].append(text)
+        return best
+
+    def add(self, text: str) -> None:
+        """Add a text to the index.
+
+        Args:
+            text (str): The text.
+        """
+        if text not in self.shingles:
+            words = get_words(text)
+            shingles = get_shingles(words)
+            self.shingles[text] = shingles
+            self.guards[text] = get_guard(words)
+            for band, key in enumerate(self.get_band_keys(self.get_signature(shingles))):
+                self.buckets[band][key].append(text)
+
+
+def deduplicate_actions(
+    actions: Iterable[str],
+    threshold: float = DEDUP_THRESHOLD,
+    num_perm: int = 128,
+) -> Tuple[List[str], Dict[str, str]]:
+    """Merge near-duplicate actions into the first action of their kind.
+
+    Actions with another first word or other negations, like "Helping a friend" and
+    "Not helping a friend", are never merged.
+
+    Args:
+        actions (Iterable[str]): The actions, in order of preference.
+        threshold (float, optional): The Jaccard similarity of word stems from which actions
+            are merged. Defaults to DEDUP_THRESHOLD.
+        num_perm (int, optional): The number of MinHash permutations. Defaults to 128.
+
+    Returns:
+        Tuple[List[str], Dict[str, str]]: The kept actions, and every merged action mapped to the kept one.
+    """
+    index = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    kept = []
+    aliases = {}
+    for action in actions:
+        if action in aliases or action in index.shingles:
+            continue
+        match = index.query(action, add=True)
+        if match is None:
+            kept.append(action)
+        else:
+            aliases[action] = match
+    return kept, aliases
@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Iterable, Iterator, List
+
+
+def progress_bar(*args, **kwargs):
+    """Create a tqdm progress bar, importing tqdm only when a bar is shown.
+
+    Args:
+        *args: Positional arguments of tqdm.
+        **kwargs: Keyword arguments of tqdm.
+
+    Returns:
+        tqdm: The progress bar.
+    """
+    from tqdm import tqdm
+
+    return tqdm(*args, **kwargs)
+
+
+async def gather_bounded(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_concurrency: int = 1,
+    pbar: bool = False,
+) -> List[Any]:
+    """Apply a blocking function to every item with a bounded number of calls in flight.
+
+    Args:
+        func (Callable[[Any], Any]): The blocking function to apply to each item.
+        items (Iterable[Any]): The items to process.
+        max_concurrency (int, optional): Maximum number of calls in flight. Defaults to 1.
+        pbar (bool, optional): If true, show a progress bar. Defaults to False.
+
+    Returns:
+        List[Any]: The results, in the same order as items.
+    """
+    items = list(items)
+    loop = asyncio.get_running_loop()
+    progress = progress_bar(total=len(items)) if pbar else None
+    # A dedicated pool so the default executor size does not cap max_concurrency
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+
+        async def run_one(item: Any) -> Any:
+            # Run in a copy of the caller's context, e.g. to keep metrics.current_stage
+            context = contextvars.copy_context()
+            out = await loop.run_in_executor(executor, context.run, func, item)
+            if progress is not None:
+                progress.update(1)
+            return out
+
+        try:
+            return await asyncio.gather(*(run_one(item) for item in items))
+        finally:
+            if progress is not None:
+                progress.close()
+
+
+def run_concurrently(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_concurrency: int = 1,
+    pbar: bool = False,
+) -> List[Any]:
+    """Apply a blocking function to every item with a bounded number of calls in flight.
+
+    With max_concurrency <= 1 the items are processed serially in the calling thread. Only
+    threads are used, so this is safe to call while an event loop is running, e.g. from
+    Jupyter; async callers can also await gather_bounded.
+
+    Args:
+        func (Callable[[Any], Any]): The blocking function to apply to each item.
+        items (Iterable[Any]): The items to process.
+        max_concurrency (int, optional): Maximum number of calls in flight. Defaults to 1.
+        pbar (bool, optional): If true, show a progress bar. Defaults to False.
+
+    Returns:
+        List[Any]: The results, in the same order as items.
+    """
+    if max_concurrency <= 1:
+        iterator = progress_bar(items) if pbar else items
+        return [func(item) for item in iterator]
+    items = list(items)
+    progress = progress_bar(total=len(items)) if pbar else None
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, func, item) for item in items
+        ]
+        try:
+            if progress is not None:
+                for _ in as_completed(futures):
+                    progress.update(1)
+            return [future.result() for future in futures]
+        finally:
+            if progress is not None:
+                progress.close()
+
+
+def iter_concurrently(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_concurrency: int = 1,
+) -> Iterator[Any]:
+    """Apply a blocking function to every item, yielding each result as soon as it is ready.
+
+    With max_concurrency <= 1 the items are processed serially, in order.
+
+    Args:
+        func (Callable[[Any], Any]): The blocking function to apply to each item.
+        items (Iterable[Any]): The items to process.
+        max_concurrency (int, optional): Maximum number of calls in flight. Defaults to 1.
+
+    Yields:
+        Any: The results, in the order they complete.
+    """
+    if max_concurrency <= 1:
+        for item in items:
+            yield func(item)
+        return
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, func, item) for item in items
+        ]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_streaming(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_concurrency: int = 1,
+    pbar: bool = False,
+) -> List[Any]:
+    """Like run_concurrently, but start on every item as soon as the iterable produces it.
+
+    items can be a generator that blocks until its next item is ready, e.g. one fed by
+    another stage; earlier items are processed while it waits.
+
+    Args:
+        func (Callable[[Any], Any]): The blocking function to apply to each item.
+        items (Iterable[Any]): The items to process.
+        max_concurrency (int, optional): Maximum number of calls in flight. Defaults to 1.
+        pbar (bool, optional): If true, show a progress bar. Defaults to False.
+
+    Returns:
+        List[Any]: The results, in the order the items were produced.
+    """
+    if max_concurrency <= 1:
+        iterator = progress_bar(items) if pbar else items
+        return [func(item) for item in iterator]
+    # The total is unknown until the iterable is exhausted
+    progress = progress_bar() if pbar else None
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        futures = []
+        for item in items:
+            future = executor.submit(contextvars.copy_context().run, func, item)
+            if progress is not None:
+                future.add_done_callback(lambda _: progress.update(1))
+            futures.append(future)
+        try:
+            return [future.result() for future in futures]
+        finally:
+            if progress is not None:
+                progress.close()
@@ -0,0 +1,421 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from ast import literal_eval
+from typing import Callable, Iterator, List, Optional, Tuple
+from philo.prompts import PromptConstructor
+from philo.rate_limit import estimate_tokens
+from philo.schemas import get_output_schema
+from philo.utils import get_repo_root, parse_structured_output
+
+MORALITIES = ["moral", "immoral", "undecided"]
+VERBS = ["Lying to", "Helping", "Stealing from", "Donating to", "Protecting", "Betraying"]
+OBJECTS = ["a friend", "a stranger", "a rival", "a charity", "the state", "a family member"]
+NUMBERED_ACTION = re.compile(r"^\t\t(\d+):'(.*)',$", re.MULTILINE)
+GROUP_NUMBER = re.compile(r"^\t(\d+): \[", re.MULTILINE)
+
+
+def get_hash(*parts) -> int:
+    """Hash some values to a deterministic integer, the same in every process.
+
+    Args:
+        *parts: The values, joined by their string forms.
+
+    Returns:
+        int: A 32-bit hash of the joined values.
+    """
+    # Unlike CRC32, a cryptographic hash gives independent draws for inputs that differ a little
+    text = "|".join(str(part) for part in parts).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(text, digest_size=4).digest(), "big")
+
+
+def get_prompt_templates() -> List[Tuple[str, str, str]]:
+    """Get the text around the user input of every prompt family and version.
+
+    Returns:
+        List[Tuple[str, str, str]]: The prompt name, the text before the user input and the
+            text after it, longest prefix first.
+    """
+    templates = []
+    prompts_path = os.path.join(get_repo_root(), "philo", "prompts")
+    for prompt_name in sorted(os.listdir(prompts_path)):
+        prompt_path = os.path.join(prompts_path, prompt_name)
+        if not os.path.isdir(prompt_path) or prompt_name.startswith("_"):
+            continue
+        for version in sorted(os.listdir(prompt_path)):
+            if not version.startswith("v"):
+                continue
+            pc = PromptConstructor(prompt_name, int(version[1:]))
+            segments = pc.get_compiled_prompt().segments
+            templates.append((prompt_name, segments[0], segments[-1] if len(segments) > 1 else ""))
+    return sorted(templates, key=lambda template: len(template[1]), reverse=True)
+
+
+class FakeResponder:
+    """Answers every prompt family with deterministic, well-formed responses.
+
+    The answer to a prompt only depends on the prompt, so that a fake run is reproducible
+    and its responses can be cached like real ones.
+    """
+
+    def __init__(self, n_philosophies: int = 5, n_actions_per_philosophy: int = 6):
+        """Create the responder.
+
+        Args:
+            n_philosophies (int, optional): The number of philosophies listed. Defaults to 5.
+            n_actions_per_philosophy (int, optional): The number of actions per philosophy. Defaults to 6.
+        """
+        self.n_philosophies = n_philosophies
+        self.n_actions_per_philosophy = n_actions_per_philosophy
+        self.templates = get_prompt_templates()
+
+    def __call__(self, prompt: str) -> str:
+        """Answer a prompt.
+
+        Args:
+            prompt (str): The prompt.
+
+        Raises:
+            ValueError: The prompt is not from any prompt family.
+
+        Returns:
+            str: The response, as JSON.
+        """
+        for prompt_name, prefix, suffix in self.templates:
+            if prompt.startswith(prefix) and prompt.endswith(suffix):
+                user_input = prompt[len(prefix) : len(prompt) - len(suffix)]
+                return json.dumps(getattr(self, f"get_{prompt_name}")(user_input))
+        raise ValueError("The prompt is not from any prompt family.")
+
+    def get_philosophies(self, user_input: str) -> list:
+        """List n_philosophies numbered philosophies."""
+        return [
+            {"name": f"Philosophy {i + 1}", "description": f"The philosophy number {i + 1}."}
+            for i in range(self.n_philosophies)
+        ]
+
+    def get_action_from_philosophy(self, user_input: str) -> list:
+        """Pick actions for the philosophy from a small vocabulary, so that philosophies share some."""
+        name = literal_eval(user_input)["name"]
+        out = []
+        for j in range(self.n_actions_per_philosophy):
+            h = get_hash(name, j)
+            action = f"{VERBS[h % len(VERBS)]} {OBJECTS[h // len(VERBS) % len(OBJECTS)]}"
+            out.append(
+                {"action": action, "morality": MORALITIES[j % 3], "reason": f"Because of {name}."}
+            )
+        return out
+
+    def get_determine_clusters(self, user_input: str) -> list:
+        """Make up cluster labels, about the square root of half the number of actions."""
+        n_clusters = max(1, round(math.sqrt(len(user_input.split("\n")) / 2)))
+        return [f"cluster {k + 1}" for k in range(n_clusters)]
+
+    def get_action_cluster(self, user_input: str) -> dict:
+        """Assign the action to a cluster by its hash."""
+        action, cluster_labels = user_input.rsplit("\n\t'cluster_labels':", 1)
+        action = action[len("{\n\t'action':") :]
+        cluster_labels = literal_eval(cluster_labels[: -len("\n}")])
+        h = get_hash(action)
+        return {
+            "cluster": cluster_labels[h % len(cluster_labels)],
+            "reason": "The action fits the cluster.",
+            "aligned": h % 2 == 0,
+        }
+
+    def get_scores(self, action: str, philosophies: list) -> list:
+        """Score an action against every philosophy by the hash of the pair."""
+        return [
+            {
+                "philosophy": p["name"],
+                "morality": MORALITIES[get_hash(p["name"], action) % 3],
+                "reason": f"{p['name']} says so.",
+            }
+            for p in philosophies
+        ]
+
+    def get_score_action(self, user_input: str) -> list:
+        """Score the action."""
+        action, philosophies = user_input.rsplit("\n\t'philosophies':", 1)
+        action = action[len("{\n\t'action':'") : -1]
+        return self.get_scores(action, literal_eval(philosophies[: -len("\n}")]))
+
+    def get_score_action_batch(self, user_input: str) -> dict:
+        """Score every numbered action."""
+        actions, philosophies = user_input.rsplit("\n\t'philosophies':", 1)
+        philosophies = literal_eval(philosophies[: -len("\n}")])
+        return {
+            int(number): self.get_scores(action, philosophies)
+            for number, action in NUMBERED_ACTION.findall(actions)
+        }
+
+    def get_name_clusters(self, user_input: str) -> dict:
+        """Name every group of actions after its number."""
+        return {int(k): f"cluster {k}" for k in GROUP_NUMBER.findall(user_input)}
+
+
+class FakeChat:
+    """An in-process chatbot for offline runs, load tests and benchmarks.
+
+    It answers after a configurable latency and can inject errors: transient errors, which
+    Questioner backs off from and retries, and malformed responses, which fail to parse.
+    Whether an attempt fails only depends on the prompt and the number of times it was sent,
+    so runs are reproducible whatever the thread scheduling. A request with a JSON schema
+    response_format gets a structured response, which is never malformed, as with constrained
+    decoding.
+    """
+
+    def __init__(
+        self,
+        model: str = "fake",
+        responder: Optional[Callable[[str], str]] = None,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        seed: int = 1,
+        role_str: str = "You are a helpful assistant.",
+        chunk_size: int = 16,
+        chunk_latency: float = 0.0,
+    ) -> None:
+        """Create the chatbot.
+
+        Args:
+            model (str, optional): The model name, part of the request hash. Defaults to "fake".
+            responder (Optional[Callable[[str], str]], optional): Maps a prompt to its response.
+                Defaults to None (a FakeResponder).
+            latency (float, optional): The mean time to answer, in seconds. Defaults to 0.0.
+            latency_jitter (float, optional): The answer time varies by up to this much either way,
+                in seconds. Defaults to 0.0.
+            error_rate (float, optional): The probability that an attempt raises ConnectionError.
+                Defaults to 0.0.
+            malformed_rate (float, optional): The probability that an attempt returns a truncated
+                response. Defaults to 0.0.
+            seed (int, optional): The seed of the latencies and errors. Defaults to 1.
+            role_str (str, optional): The system role, part of the request hash. Defaults to
+                "You are a helpful assistant.".
+            chunk_size (int, optional): The characters per chunk of a streamed response. Defaults to 16.
+            chunk_latency (float, optional): The time to generate every chunk of a streamed response,
+                in seconds. Defaults to 0.0.
+        """
+        self.model = model
+        self.responder = responder if responder is not None else FakeResponder()
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.seed = seed
+        self.role_str = role_str
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.lock = threading.Lock()
+        # Attempts per prompt, so that a retry can succeed where the last attempt failed
+        self.attempts = {}
+        self.calls = 0
+        # Chunks of streamed responses read, including those of aborted streams
+        self.chunks = 0
+        self.local = threading.local()
+
+    def get_random(self, prompt: str, attempt: int, purpose: str) -> float:
+        """Draw a deterministic number in [0, 1) for an attempt.
+
+        Args:
+            prompt (str): The prompt.
+            attempt (int): The number of times the prompt was sent, including this one.
+            purpose (str): What the number is for, so that draws for different purposes differ.
+
+        Returns:
+            float: The number.
+        """
+        return get_hash(self.seed, purpose, attempt, prompt) / 2**32
+
+    def send_receive(
+        self,
+        user_question: str,
+        temperature: float = 0.0,
+        seed: int = 1,
+        stateless: Optional[bool] = None,
+        response_format: Optional[dict] = None,
+    ) -> str:
+        """Answer a prompt after the configured latency, or fail as configured.
+
+        Args:
+            user_question (str): The prompt.
+            temperature (float, optional): Only part of the request. Defaults to 0.0.
+            seed (int, optional): Only part of the request. Defaults to 1.
+            stateless (Optional[bool], optional): Ignored; every prompt is answered on its own.
+                Defaults to None.
+            response_format (Optional[dict], optional): A JSON schema response format, see
+                philo.schemas. Defaults to None (free text).
+
+        Raises:
+            ConnectionError: An injected transient error.
+
+        Returns:
+            str: The response.
+        """
+        return self.send_receive_candidates(
+            user_question, 1, temperature=temperature, seed=seed, response_format=response_format
+        )[0]
+
+    def send_receive_candidates(
+        self,
+        user_question: str,
+        n: int,
+        temperature: float = 0.0,
+        seed: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> List[str]:
+        """Answer a prompt with n candidates in one call, each malformed or not on its own.
+
+        Args:
+            user_question (str): The prompt.
+            n (int): The number of candidates.
+            temperature (float, optional): Only part of the request. Defaults to 0.0.
+            seed (int, optional): Only part of the request. Defaults to 1.
+            response_format (Optional[dict], optional): A JSON schema response format, see
+                philo.schemas. Defaults to None (free text).
+
+        Raises:
+            ConnectionError: An injected transient error, failing the whole call.
+
+        Returns:
+            List[str]: The candidates.
+        """
+        attempt = self.start_attempt(user_question)
+        candidates = [
+            self.get_response(user_question, attempt, i, response_format) for i in range(n)
+        ]
+        self.set_usage(user_question, candidates)
+        return candidates
+
+    def stream_response(
+        self, user_question: str, temperature: float = 0.0, seed: int = 1
+    ) -> Iterator[str]:
+        """Answer a prompt in chunks of chunk_size characters, chunk_latency seconds apart.
+
+        The usage is only known once every chunk was read, as with OpenAIChat.
+
+        Args:
+            user_question (str): The prompt.
+            temperature (float, optional): Only part of the request. Defaults to 0.0.
+            seed (int, optional): Only part of the request. Defaults to 1.
+
+        Raises:
+            ConnectionError: An injected transient error, before the first chunk.
+
+        Yields:
+            str: The chunks of the response.
+        """
+        attempt = self.start_attempt(user_question)
+        response = self.get_response(user_question, attempt, 0)
+        for start in range(0, len(response), self.chunk_size):
+            if self.chunk_latency > 0:
+                time.sleep(self.chunk_latency)
+            with self.lock:
+                self.chunks += 1
+            yield response[start : start + self.chunk_size]
+        self.set_usage(user_question, [response])
+
+    def start_attempt(self, user_question: str) -> int:
+        """Count an attempt at a prompt, wait for its latency and fail it if it draws an error.
+
+        Args:
+            user_question (str): The prompt.
+
+        Raises:
+            ConnectionError: An injected transient error.
+
+        Returns:
+            int: The number of times the prompt was sent, including this one.
+        """
+        with self.lock:
+            self.calls += 1
+            attempt = self.attempts.get(user_question, 0) + 1
+            self.attempts[user_question] = attempt
+        jitter = (2 * self.get_random(user_question, attempt, "latency") - 1) * self.latency_jitter
+        if self.latency + jitter > 0:
+            time.sleep(self.latency + jitter)
+        self.local.usage = None
+        if self.get_random(user_question, attempt, "error") < self.error_rate:
+            raise ConnectionError("Injected transient error.")
+        return attempt
+
+    def get_response(
+        self, user_question: str, attempt: int, i: int, response_format: Optional[dict] = None
+    ) -> str:
+        """Answer a prompt, truncating the answer if the attempt draws a malformed response.
+
+        Args:
+            user_question (str): The prompt.
+            attempt (int): The number of times the prompt was sent, including this one.
+            i (int): The index of the candidate.
+            response_format (Optional[dict], optional): A JSON schema response format. Defaults to
+                None (free text).
+
+        Returns:
+            str: The response.
+        """
+        response = self.responder(user_question)
+        if response_format is not None and response_format.get("type") == "json_schema":
+            output_schema = get_output_schema(response_format["json_schema"]["name"])
+            try:
+                return output_schema.to_structured(parse_structured_output(response))
+            except Exception:
+                # A responder answering off the schema, as a model without constrained decoding may
+                return response
+        # The first candidate draws as a single response does
+        purpose = "malformed" if i == 0 else f"malformed {i}"
+        if self.get_random(user_question, attempt, purpose) < self.malformed_rate:
+            response = response[: len(response) // 2]
+        return response
+
+    def set_usage(self, user_question: str, responses: List[str]) -> None:
+        """Estimate the token usage of responses to a prompt, for get_last_usage."""
+        self.local.usage = {
+            "prompt_tokens": estimate_tokens(self.role_str) + estimate_tokens(user_question),
+            "completion_tokens": sum(estimate_tokens(response) for response in responses),
+        }
+
+    def get_last_usage(self) -> Optional[dict]:
+        """Get the estimated token usage of the last response received by the calling thread.
+
+        Returns:
+            Optional[dict]: The usage, with "prompt_tokens" and "completion_tokens", or None if unknown.
+        """
+        return getattr(self.local, "usage", None)
+
+    def get_request_body(
+        self,
+        user_question: str,
+        temperature: float = 0.0,
+        seed: int = 1,
+        n: int = 1,
+        response_format: Optional[dict] = None,
+    ) -> dict:
+        """Get the body of the request, as OpenAIChat would send it.
+
+        Args:
+            user_question (str): The prompt.
+            temperature (float, optional): The randomness of the response. Defaults to 0.0.
+            seed (int, optional): The seed for the randomness. Defaults to 1.
+            n (int, optional): The number of candidates. Defaults to 1.
+            response_format (Optional[dict], optional): The response format. Defaults to None.
+
+        Returns:
+            dict: The request body.
+        """
+        messages = [
+            {"role": "system", "content": self.role_str},
+            {"role": "user", "content": user_question},
+        ]
+        body = {"model": self.model, "messages": messages, "temperature": temperature, "seed": seed}
+        if n > 1:
+            body["n"] = n
+        if response_format is not None:
+            body["response_format"] = response_format
+        return body
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import os
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Iterator, Optional
+
+
+def atomic_write(path: str, text: str) -> None:
+    """Write text to a file so that readers see either the old or the new content.
+
+    Args:
+        path (str): The path of the file to write.
+        text (str): The content of the file.
+    """
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def hash_request(request_body: dict) -> str:
+    """Hash a request body, e.g. from OpenAIChat.get_request_body.
+
+    Two requests get the same hash if and only if they send the same model, messages
+    and sampling parameters, whatever the order of their keys.
+
+    Args:
+        request_body (dict): The request body.
+
+    Returns:
+        str: The hex digest of the SHA-256 hash of the body.
+    """
+    text = json.dumps(request_body, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def read_jsonl_history(path: str) -> dict:
+    """Replay an append-only history log into a dictionary.
+
+    A torn final line (e.g. from a crash mid-write) is skipped.
+
+    Args:
+        path (str): The path of the log.
+
+    Returns:
+        dict: The history, mapping history keys to their latest value.
+    """
+    history = {}
+    with open(path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("deleted", False):
+                history.pop(record["key"], None)
+            else:
+                history[record["key"]] = record["value"]
+    return history
+
+
+class JSONHistory(MutableMapping):
+    """History stored as a single JSON object, rewritten atomically on save."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {}
+            self.save()
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.data[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        with self.lock:
+            del self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.data))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def save(self) -> None:
+        """Write the whole history to disk."""
+        with self.lock:
+            atomic_write(self.path, json.dumps(self.data, indent=2))
+
+    def compact(self) -> None:
+        """Nothing to compact; the file only ever holds the current history."""
+        self.save()
+
+    def close(self) -> None:
+        """Nothing to close; the file is only open while saving."""
+
+
+class JSONLHistory(MutableMapping):
+    """History stored as an append-only JSON lines log.
+
+    Every set or delete appends one line, so a write costs the size of the record
+    rather than the size of the history. The log is replayed into an in-memory index
+    on open, and rewritten atomically without superseded records on compaction.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compact_min_stale: int = 1000,
+        fsync: bool = False,
+    ):
+        """Open the log, replaying it into memory.
+
+        Args:
+            path (str): The path of the log.
+            compact_min_stale (int, optional): Compact once the log holds at least this many
+                superseded records, and more superseded than live ones. Defaults to 1000.
+            fsync (bool, optional): If true, fsync after every record. Defaults to False.
+        """
+        self.path = path
+        self.compact_min_stale = compact_min_stale
+        self.fsync = fsync
+        self.lock = threading.RLock()
+        self.file = None
+        self.data = {}
+        self.n_records = 0
+        if os.path.exists(path):
+            self.data = read_jsonl_history(path)
+            with open(path, "r") as f:
+                self.n_records = sum(1 for _ in f)
+        self.file = open(path, "a")
+        # Terminate a torn final line so the next record starts on its own line
+        if self.file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+        self.maybe_compact()
+
+    @property
+    def n_stale(self) -> int:
+        """The number of records in the log that have been superseded."""
+        return self.n_records - len(self.data)
+
+    def append(self, record: dict) -> None:
+        """Append a record to the log.
+
+        Args:
+            record (dict): The record to append.
+        """
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.n_records += 1
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.append({"key": key, "value": value})
+            self.data[key] = value
+            self.maybe_compact()
+
+    def __delitem__(self, key: str) -> None:
+        with self.lock:
+            if key not in self.data:
+                raise KeyError(key)
+            self.append({"key": key, "deleted": True})
+            del self.data[key]
+            self.maybe_compact()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self.data))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def save(self) -> None:
+        """Records are appended as they are set, so there is nothing left to write."""
+        with self.lock:
+            self.file.flush()
+
+    def maybe_compact(self) -> None:
+        """Compact the log if it holds too many superseded records."""
+        if self.n_stale >= self.compact_min_stale and self.n_stale > len(self.data):
+            self.compact()
+
+    def compact(self) -> None:
+        """Rewrite the log atomically with one record per live history key."""
+        with self.lock:
+            self.file.close()
+            text = "".join(
+                json.dumps({"key": key, "value": value}) + "\n" for key, value in self.data.items()
+            )
+            atomic_write(self.path, text)
+            self.n_records = len(self.data)
+            self.file = open(self.path, "a")
+
+    def close(self) -> None:
+        """Close the log file."""
+        with self.lock:
+            if self.file is not None and not self.file.closed:
+                self.file.close()
+
+    def __del__(self):
+        self.close()
+
+
+HISTORY_BACKENDS = {"json": JSONHistory, "jsonl": JSONLHistory}
+
+
+def open_history(path: str, backend: str = "jsonl", legacy_path: Optional[str] = None):
+    """Open a history store.
+
+    Args:
+        path (str): The path of the history file.
+        backend (str, optional): One of "json" or "jsonl". Defaults to "jsonl".
+        legacy_path (Optional[str], optional): A history{suffix}.json file to import from
+            if path does not exist yet. Defaults to None.
+
+    Raises:
+        ValueError: Invalid backend.
+
+    Returns:
+        JSONHistory | JSONLHistory: The history store.
+    """
+    if backend not in HISTORY_BACKENDS:
+        raise ValueError(f"Invalid history backend: {backend}")
+    import_legacy = (
+        legacy_path is not None
+        and legacy_path != path
+        and not os.path.exists(path)
+        and os.path.exists(legacy_path)
+    )
+    history = HISTORY_BACKENDS[backend](path)
+    if import_legacy:
+        with open(legacy_path, "r") as f:
+            history.data.update(json.load(f))
+        history.compact()
+    return history
@@ -0,0 +1,117 @@
+import contextvars
+import json
+import threading
+from collections import defaultdict
+from typing import List, Optional
+
+# The pipeline stage the current code runs for. Worker threads started by philo.engine
+# and philo.pipeline run in a copy of their caller's context, so they inherit it.
+current_stage = contextvars.ContextVar("current_stage", default=None)
+
+SUMMARY_FIELDS = [
+    "calls",
+    "cache_hits",
+    "prompt_tokens",
+    "completion_tokens",
+    "retries",
+    "parse_failures",
+    "seconds",
+]
+
+
+class MetricsRecorder:
+    """Collects one record per chatbot prompt, for cost and latency accounting.
+
+    Every record has the stage and history key of the prompt, the prompt name (the
+    first part of the history key), the model, the prompt length in characters, the
+    prompt and completion tokens reported by the API, the wall time in seconds
+    including retries, the number of retries and parse failures, and whether the
+    response came from history.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = []
+
+    def record(self, **fields) -> dict:
+        """Add a record, tagged with the current stage.
+
+        Args:
+            **fields: The fields of the record.
+
+        Returns:
+            dict: The record.
+        """
+        record = {"stage": current_stage.get()}
+        record.update(fields)
+        with self.lock:
+            self.records.append(record)
+        return record
+
+    def export(self, path: str) -> None:
+        """Write every record to a JSON lines file.
+
+        Args:
+            path (str): The path of the file.
+        """
+        with self.lock:
+            records = list(self.records)
+        with open(path, "w") as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+
+    def get_summary(self) -> List[dict]:
+        """Sum the records per stage and prompt name.
+
+        Returns:
+            List[dict]: One row per stage and prompt name, with the SUMMARY_FIELDS totals,
+                sorted by prompt tokens, highest first.
+        """
+        totals = defaultdict(lambda: dict.fromkeys(SUMMARY_FIELDS, 0))
+        with self.lock:
+            records = list(self.records)
+        for record in records:
+            row = totals[(record["stage"], record["prompt_name"])]
+            row["calls"] += 1
+            row["cache_hits"] += int(record["cache_hit"])
+            row["prompt_tokens"] += record["prompt_tokens"]
+            row["completion_tokens"] += record["completion_tokens"]
+            row["retries"] += record["retries"]
+            row["parse_failures"] += record["parse_failures"]
+            row["seconds"] += record["seconds"]
+        rows = [
+            {"stage": stage, "prompt_name": prompt_name, **row}
+            for (stage, prompt_name), row in totals.items()
+        ]
+        return sorted(rows, key=lambda row: row["prompt_tokens"], reverse=True)
+
+    def format_summary(self) -> str:
+        """Format get_summary as a text table.
+
+        Returns:
+            str: The table.
+        """
+        header = ["stage", "prompt_name"] + SUMMARY_FIELDS
+        lines = [header]
+        for row in self.get_summary():
+            line = [str(row["stage"]), str(row["prompt_name"])]
+            line += [f"{row[k]:.1f}" if k == "seconds" else str(row[k]) for k in SUMMARY_FIELDS]
+            lines.append(line)
+        widths = [max(len(line[i]) for line in lines) for i in range(len(header))]
+        return "\n".join(
+            "  ".join(cell.ljust(width) for cell, width in zip(line, widths)) for line in lines
+        )
+
+
+def get_usage_tokens(usage: Optional[dict]) -> tuple:
+    """Read the token counts of a chat completion usage dictionary.
+
+    Args:
+        usage (Optional[dict]): The usage, e.g. from OpenAIChat.get_last_usage, or None.
+
+    Returns:
+        tuple: The prompt and completion tokens, 0 if unknown.
+    """
+    if not usage:
+        return 0, 0
+    return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
@@ -0,0 +1,407 @@
+import contextvars
+import json
+import os
+import queue
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, List, Optional
+from philo.history import atomic_write
+from philo.metrics import current_stage
+from philo.scores import ScoreStore
+
+
+class Stage:
+    """A step of a pipeline, run once every stage it depends on has finished."""
+
+    def __init__(
+        self,
+        name: str,
+        run: Callable[[], Any],
+        depends_on: Optional[List[str]] = None,
+        restore: Optional[Callable[[Any], None]] = None,
+    ):
+        """Create the stage.
+
+        Args:
+            name (str): The name of the stage, unique in its pipeline.
+            run (Callable[[], Any]): Runs the stage and returns its output.
+            depends_on (Optional[List[str]], optional): Names of the stages to run first. Defaults to None.
+            restore (Optional[Callable[[Any], None]], optional): Restores the state left by run from its
+                output. If set, the output is checkpointed as JSON and the stage can be resumed from it.
+                Defaults to None (the stage always runs).
+        """
+        self.name = name
+        self.run = run
+        self.depends_on = list(depends_on or [])
+        self.restore = restore
+
+
+class Pipeline:
+    """Runs a dependency graph of stages, with independent stages in parallel.
+
+    Stages share state through the objects their functions close over, e.g. a Questioner,
+    so stages that run at the same time must not set the same attributes.
+    """
+
+    def __init__(self, stages: List[Stage], checkpoint_dir: Optional[str] = None):
+        """Create the pipeline.
+
+        Args:
+            stages (List[Stage]): The stages.
+            checkpoint_dir (Optional[str], optional): Where to write stage outputs, as {name}.json.
+                Defaults to None (no checkpoints).
+
+        Raises:
+            ValueError: Duplicate stage names, unknown dependencies or a dependency cycle.
+        """
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage: {stage.name}")
+            self.stages[stage.name] = stage
+        for stage in stages:
+            for name in stage.depends_on:
+                if name not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {name}")
+        self.order = self.get_order()
+        self.checkpoint_dir = checkpoint_dir
+        # Wall time of every stage run in the last call to run, in seconds
+        self.timings = {}
+
+    def get_order(self) -> List[str]:
+        """Sort the stages so that every stage comes after its dependencies.
+
+        Raises:
+            ValueError: The dependencies have a cycle.
+
+        Returns:
+            List[str]: The stage names.
+        """
+        order = []
+        done = set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [n for n in remaining if all(d in done for d in self.stages[n].depends_on)]
+            if not ready:
+                raise ValueError(f"Dependency cycle between stages: {remaining}")
+            order.extend(ready)
+            done.update(ready)
+            remaining = [n for n in remaining if n not in done]
+        return order
+
+    def get_required(self, targets: List[str]) -> set:
+        """Get the stages to run to run some target stages.
+
+        Args:
+            targets (List[str]): The target stage names.
+
+        Raises:
+            ValueError: Unknown target.
+
+        Returns:
+            set: The targets and every stage they depend on, directly or not.
+        """
+        required = set()
+        remaining = list(targets)
+        while remaining:
+            name = remaining.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+            if name not in required:
+                required.add(name)
+                remaining.extend(self.stages[name].depends_on)
+        return required
+
+    def log(self, text: str) -> None:
+        """Log a message.
+
+        Args:
+            text (str): Message to log.
+        """
+        print(text)
+
+    def get_checkpoint_path(self, name: str) -> Optional[str]:
+        """Get the checkpoint file of a stage.
+
+        Args:
+            name (str): The stage name.
+
+        Returns:
+            Optional[str]: The path, or None if the pipeline has no checkpoint directory.
+        """
+        if self.checkpoint_dir is None:
+            return None
+        return os.path.join(self.checkpoint_dir, f"{name}.json")
+
+    def read_checkpoint(self, name: str) -> Any:
+        """Read the output of a stage from its checkpoint.
+
+        Args:
+            name (str): The stage name.
+
+        Raises:
+            FileNotFoundError: The stage has no checkpoint.
+
+        Returns:
+            Any: The output of the stage.
+        """
+        path = self.get_checkpoint_path(name)
+        if path is None or not os.path.exists(path):
+            raise FileNotFoundError(f"No checkpoint for stage {name}")
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def write_checkpoint(self, name: str, output: Any) -> None:
+        """Write the output of a stage to its checkpoint.
+
+        Args:
+            name (str): The stage name.
+            output (Any): The output of the stage, JSON serializable.
+        """
+        path = self.get_checkpoint_path(name)
+        if path is None:
+            return
+        if not os.path.exists(self.checkpoint_dir):
+            os.makedirs(self.checkpoint_dir)
+        atomic_write(path, json.dumps(output, indent=2))
+
+    def run_stage(self, name: str) -> Any:
+        """Run a stage and checkpoint its output.
+
+        Args:
+            name (str): The stage name.
+
+        Returns:
+            Any: The output of the stage.
+        """
+        stage = self.stages[name]
+        # Runs in its own copy of the context, so this does not leak into other stages
+        current_stage.set(name)
+        self.log(f"Running stage {name}...")
+        start = time.perf_counter()
+        output = stage.run()
+        self.timings[name] = time.perf_counter() - start
+        if stage.restore is not None:
+            self.write_checkpoint(name, output)
+        return output
+
+    def can_resume(self, name: str, resumed: set) -> bool:
+        """Check if a stage can be restored from its checkpoint instead of run.
+
+        A stage is only resumed if all its dependencies were resumed too, since a stage
+        that ran again may have changed the inputs of the ones after it.
+
+        Args:
+            name (str): The stage name.
+            resumed (set): The names of the stages resumed so far.
+
+        Returns:
+            bool: True if the stage can be resumed.
+        """
+        stage = self.stages[name]
+        path = self.get_checkpoint_path(name)
+        return (
+            stage.restore is not None
+            and path is not None
+            and os.path.exists(path)
+            and all(d in resumed for d in stage.depends_on)
+        )
+
+    def run(
+        self,
+        resume: bool = False,
+        max_workers: Optional[int] = None,
+        targets: Optional[List[str]] = None,
+    ) -> dict:
+        """Run every stage, each as soon as its dependencies have finished.
+
+        Args:
+            resume (bool, optional): If true, restore stages from their checkpoints where possible. Defaults to False.
+            max_workers (Optional[int], optional): Maximum number of stages running at once. Defaults to None
+                (every ready stage).
+            targets (Optional[List[str]], optional): Only run these stages and the stages they depend on.
+                Defaults to None (every stage).
+
+        Returns:
+            dict: The output of every stage run or resumed, by stage name.
+        """
+        order = self.order
+        if targets is not None:
+            required = self.get_required(targets)
+            order = [name for name in order if name in required]
+        self.timings = {}
+        outputs = {}
+        resumed = set()
+        done = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers or len(order)) as executor:
+            while len(done) < len(order):
+                for name in order:
+                    if name in done or name in running.values():
+                        continue
+                    if not all(d in done for d in self.stages[name].depends_on):
+                        continue
+                    if resume and self.can_resume(name, resumed):
+                        self.log(f"Resuming stage {name} from its checkpoint.")
+                        outputs[name] = self.read_checkpoint(name)
+                        self.stages[name].restore(outputs[name])
+                        resumed.add(name)
+                        done.add(name)
+                        continue
+                    context = contextvars.copy_context()
+                    running[executor.submit(context.run, self.run_stage, name)] = name
+                if not running:
+                    # Stages were resumed; look for the ones they unblocked
+                    continue
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        outputs[name] = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+                    done.add(name)
+        return outputs
+
+
+def get_questioner_stages(
+    q,
+    pbar: bool = False,
+    verbose: bool = False,
+    stream: bool = False,
+    dedup_threshold: Optional[float] = None,
+    cluster_backend: str = "llm",
+) -> List[Stage]:
+    """The stages of scripts/run_all.py.
+
+    Cluster assignment and action scoring only depend on the actions, so they run at the
+    same time; the scorecard waits for both.
+
+    With stream, action scoring starts with the philosophies instead: the actions stage
+    hands every action to it through a queue as soon as its philosophy's response is
+    parsed. Cluster labels still need every action, so cluster assignment waits for the
+    actions stage as before.
+
+    Args:
+        q (Questioner): The questioner to run the stages on.
+        pbar (bool, optional): If true, show progress bars. Defaults to False.
+        verbose (bool, optional): If true, log the cluster prompts and responses. Defaults to False.
+        stream (bool, optional): If true, score actions while they are generated. Defaults to False.
+        dedup_threshold (Optional[float], optional): If set, merge near-duplicate actions before
+            clustering and scoring them; see Questioner.set_deduplicated_actions. Defaults to None.
+        cluster_backend (str, optional): "llm" or "local"; see Questioner.set_clusters_to_actions.
+            The local backend needs no cluster_labels stage. Defaults to "llm".
+
+    Returns:
+        List[Stage]: The stages.
+    """
+
+    def run_philosophies():
+        q.set_philosophies(prompt_version_number=1)
+        return q.philosophies
+
+    # Actions from the actions stage to the action_scores stage, ended by None
+    action_queue = queue.Queue()
+
+    def get_actions_output():
+        return {
+            "all_actions_from_philosophies": q.all_actions_from_philosophies,
+            "all_actions": q.all_actions,
+            "action_aliases": q.action_aliases,
+        }
+
+    def run_actions():
+        if not stream:
+            q.set_all_actions_from_philosophies()
+            q.set_all_actions()
+            if dedup_threshold is not None:
+                q.set_deduplicated_actions(threshold=dedup_threshold)
+            return get_actions_output()
+        try:
+            for action in q.iter_actions_from_philosophies(dedup_threshold=dedup_threshold):
+                action_queue.put(action)
+        finally:
+            action_queue.put(None)
+        return get_actions_output()
+
+    def restore_actions(output):
+        # Restore the actions as they were, since streamed deduplication depends on arrival order
+        q.all_actions_from_philosophies = output["all_actions_from_philosophies"]
+        q.all_actions = output["all_actions"]
+        q.action_aliases = output["action_aliases"]
+        if stream:
+            for action in q.all_actions:
+                action_queue.put(action)
+            action_queue.put(None)
+
+    def run_cluster_labels():
+        q.set_cluster_labels(prompt_version_number=0, verbose=verbose)
+        return q.cluster_labels
+
+    def run_action_clusters():
+        if cluster_backend == "llm":
+            # The labels come from the cluster_labels stage, run or restored
+            q.set_action_clusters(prompt_version_number=0, pbar=pbar)
+        else:
+            q.set_clusters_to_actions(
+                prompt_version_number=0, pbar=pbar, verbose=verbose, backend=cluster_backend
+            )
+        return q.collect_action_clusters
+
+    def restore_action_clusters(output):
+        q.collect_action_clusters = output
+        q.set_cluster_to_actions_dict()
+        q.cluster_to_actions = q.cluster_to_actions_dict
+
+    def run_action_scores():
+        if stream:
+            actions = iter(action_queue.get, None)
+            q.set_action_scores_from_stream(actions, prompt_version_number=0, pbar=pbar)
+        else:
+            q.set_action_scores(prompt_version_number=0, pbar=pbar)
+        return q.score_store.to_columns()
+
+    def restore_action_scores(output):
+        if isinstance(output, list):
+            # A checkpoint written before the scores were stored by column
+            q.action_scores = output
+        else:
+            q.score_store = ScoreStore.from_columns(output)
+
+    def run_scorecard():
+        q.set_sorted_actions()
+        q.create_scorecard()
+
+    stages = [
+        Stage(
+            "philosophies",
+            run_philosophies,
+            restore=lambda output: setattr(q, "philosophies", output),
+        ),
+        Stage("actions", run_actions, ["philosophies"], restore=restore_actions),
+        Stage(
+            "cluster_labels",
+            run_cluster_labels,
+            ["actions"],
+            restore=lambda output: setattr(q, "cluster_labels", output),
+        ),
+        Stage(
+            "action_clusters",
+            run_action_clusters,
+            ["cluster_labels"] if cluster_backend == "llm" else ["actions"],
+            restore=restore_action_clusters,
+        ),
+        # Streamed scores are fed by the actions stage, so they always run (from history if cached)
+        Stage(
+            "action_scores",
+            run_action_scores,
+            ["philosophies"] if stream else ["actions"],
+            restore=None if stream else restore_action_scores,
+        ),
+        Stage("scorecard", run_scorecard, ["action_clusters", "action_scores"]),
+    ]
+    if cluster_backend != "llm":
+        stages = [stage for stage in stages if stage.name != "cluster_labels"]
+    return stages
@@ -1,7 +1,107 @@
 import os
-from typing import Optional
+import threading
+from typing import Dict, List, Optional, Tuple
+from philo.schemas import OutputSchema, get_output_schema
 from philo.utils import get_repo_root
 
+USER_INPUT_FLAG = "{{ USER_INPUT }}"
+
+# Compiled prompts by prompt folder and modifiers, with the signature of the files they were
+# compiled from. Shared by every PromptConstructor of the process.
+compiled_prompts = {}
+compiled_prompts_lock = threading.Lock()
+
+
+def get_prompt_signature(prompt_path: str) -> Tuple[Tuple[str, int], ...]:
+    """Get the names and modification times of the .prompt files of a prompt folder.
+
+    Args:
+        prompt_path (str): The prompt folder.
+
+    Returns:
+        Tuple[Tuple[str, int], ...]: The sorted file names with their mtime in nanoseconds.
+    """
+    with os.scandir(prompt_path) as entries:
+        return tuple(
+            sorted(
+                (entry.name, entry.stat().st_mtime_ns)
+                for entry in entries
+                if entry.name.endswith(".prompt")
+            )
+        )
+
+
+class CompiledPrompt:
+    """The prompt parts of a prompt folder, with the modifiers already substituted.
+
+    The template is stored split around the user input flag, so that rendering a prompt
+    is a single join.
+    """
+
+    def __init__(self, prompt_parts: Dict[str, str], prompt_modifiers: List[str]):
+        """Compile prompt parts.
+
+        Args:
+            prompt_parts (Dict[str, str]): The contents of the .prompt files, by file name.
+            prompt_modifiers (List[str]): The parts substituted into the base prompt, in order.
+        """
+        self.prompt_parts = prompt_parts
+        self.user_input_required = "user_string" in prompt_parts
+        template = prompt_parts["base"]
+        for prompt_modifier in prompt_modifiers:
+            if prompt_modifier in prompt_parts:
+                flag = "{{ " + prompt_modifier.upper() + " }}"
+                template = template.replace(flag, prompt_parts[prompt_modifier])
+        if self.user_input_required:
+            self.segments = template.split(USER_INPUT_FLAG)
+        else:
+            self.segments = [template]
+
+    def render(self, user_input: Optional[str] = None) -> str:
+        """Render the prompt.
+
+        Args:
+            user_input (Optional[str], optional): The user input, ignored if not required.
+                Defaults to None.
+
+        Returns:
+            str: The prompt.
+        """
+        if not self.user_input_required:
+            return self.segments[0]
+        return user_input.join(self.segments)
+
+
+def get_compiled_prompt(prompt_path: str, prompt_modifiers: List[str]) -> CompiledPrompt:
+    """Get the compiled prompt of a prompt folder, compiling it only if its files changed.
+
+    Args:
+        prompt_path (str): The prompt folder.
+        prompt_modifiers (List[str]): The parts substituted into the base prompt, in order.
+
+    Returns:
+        CompiledPrompt: The compiled prompt.
+    """
+    key = (prompt_path, tuple(prompt_modifiers))
+    signature = get_prompt_signature(prompt_path)
+    cached = compiled_prompts.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    prompt_parts = {}
+    for file, _ in signature:
+        with open(os.path.join(prompt_path, file), "r") as f:
+            prompt_parts[file.replace(".prompt", "")] = f.read()
+    compiled = CompiledPrompt(prompt_parts, prompt_modifiers)
+    with compiled_prompts_lock:
+        compiled_prompts[key] = (signature, compiled)
+    return compiled
+
+
+def clear_prompt_cache() -> None:
+    """Forget every compiled prompt."""
+    with compiled_prompts_lock:
+        compiled_prompts.clear()
+
 
 class PromptConstructor:
     def __init__(self, prompt_name: str, prompt_version_number: int = 0):
@@ -28,14 +128,17 @@ class PromptConstructor:
         if not os.path.isdir(self.full_prompt_path):
             raise ValueError(f"{self.prompt_name} is not a valid prompt.")
 
+    def get_compiled_prompt(self) -> CompiledPrompt:
+        """Get the compiled prompt, from the process-wide cache unless a file changed.
+
+        Returns:
+            CompiledPrompt: The compiled prompt.
+        """
+        return get_compiled_prompt(self.full_prompt_path, self.prompt_modifiers)
+
     def set_prompt_parts(self) -> None:
         """Set the prompt parts."""
-        # Set the prompt parts
-        self.prompt_parts = {}
-        for file in os.listdir(self.full_prompt_path):
-            if file.endswith(".prompt"):
-                with open(os.path.join(self.full_prompt_path, file), "r") as f:
-                    self.prompt_parts[file.replace(".prompt", "")] = f.read()
+        self.prompt_parts = self.get_compiled_prompt().prompt_parts
 
     def get_prompt(self, user_input: Optional[str] = None) -> str:
         """Get the prompt.
@@ -49,22 +152,16 @@ class PromptConstructor:
         Returns:
             str: The prompt.
         """
-        # Set the prompt parts
-        self.set_prompt_parts()
-        # Check if user_input is required
-        user_input_required = "user_string" in self.prompt_parts
-        if user_input is None and user_input_required:
+        compiled = self.get_compiled_prompt()
+        self.prompt_parts = compiled.prompt_parts
+        if user_input is None and compiled.user_input_required:
             raise ValueError("user_input is required for this prompt.")
-        # Get the base prompt
-        out = self.prompt_parts["base"]
-        # Modify the prompt according to the prompt modifiers
-        for prompt_modifier in self.prompt_modifiers:
-            if prompt_modifier not in self.prompt_parts:
-                continue
-            prompt_modifier_flag = prompt_modifier.upper()
-            prompt_modifier_flag = "{{ " + prompt_modifier_flag + " }}"
-            out = out.replace(prompt_modifier_flag, self.prompt_parts[prompt_modifier])
-        # Replace the user input
-        if user_input_required:
-            out = out.replace("{{ USER_INPUT }}", user_input)
-        return out
+        return compiled.render(user_input)
+
+    def get_output_schema(self) -> Optional[OutputSchema]:
+        """Get the output schema of the prompt family, the same for every version.
+
+        Returns:
+            Optional[OutputSchema]: The schema, or None if the family has no schema.json file.
+        """
+        return get_output_schema(self.prompt_name)
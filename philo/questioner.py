@@ -1,33 +1,192 @@
+import html
 import json
 import os
-from tqdm import tqdm
+import threading
 import time
 from collections import defaultdict
-from typing import Optional
-from philo.utils import get_repo_root, parse_structured_output
-from philo.chatbots import OpenAIChat
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from philo.utils import (
+    PARSE_ERRORS,
+    get_numbered_items,
+    get_repo_root,
+    parse_structured_output,
+)
+from philo.chatbots import DEFAULT_MODEL, DEFAULT_SCORE_MODEL, ChatBackend, OpenAIChat
+from philo.batch import BATCH_ENDPOINT, read_batch_results
+from philo.clustering import cluster_actions
+from philo.dedup import DEDUP_THRESHOLD, MinHashLSH, deduplicate_actions
+from philo.engine import iter_concurrently, run_concurrently, run_streaming
+from philo.history import hash_request, open_history
+from philo.metrics import MetricsRecorder, get_usage_tokens
 from philo.prompts import PromptConstructor
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.offline as ol
+from philo.schemas import OutputSchema, get_output_schema
+from philo.scores import ScoreMatrix, ScoreStore, get_majority_scores
+from philo.streaming import IncrementalParser
+from philo.rate_limit import (
+    RateLimiter,
+    estimate_tokens,
+    get_backoff_delay,
+    get_retry_after,
+    is_rate_limit_error,
+    is_transient_error,
+)
+import numpy as np
+
+# The temperature of the candidates of a majority vote, diverse enough to disagree
+VOTE_TEMPERATURE = 0.7
 
 
 class Questioner:
 
-    def __init__(self, history_filename_suffix: Optional[str] = "", fresh_start: bool = False):
-        history_filename = f"history{history_filename_suffix}.json"
+    def __init__(
+        self,
+        history_filename_suffix: Optional[str] = "",
+        fresh_start: bool = False,
+        max_concurrency: int = 1,
+        conversation: bool = False,
+        history_backend: str = "jsonl",
+        rate_limiter: Optional[RateLimiter] = None,
+        metrics: Optional[MetricsRecorder] = None,
+        n_candidates: int = 1,
+        majority_vote: bool = False,
+        stream_responses: bool = False,
+        structured_output: bool = False,
+    ):
+        # The history{suffix}.json file written by the "json" backend
+        self.legacy_history_file_path = os.path.join(
+            get_repo_root(), f"history{history_filename_suffix}.json"
+        )
+        self.history_backend = history_backend
+        history_filename = f"history{history_filename_suffix}.{history_backend}"
         self.history_file_path = os.path.join(get_repo_root(), history_filename)
+        # Maximum number of per-action requests in flight at once
+        self.max_concurrency = max_concurrency
+        # If true, every prompt is sent along with all previous prompts and responses
+        self.conversation = conversation
+        if self.conversation and self.max_concurrency > 1:
+            raise ValueError("Conversation mode cannot be used with max_concurrency > 1.")
+        # If greater than 1, a response that fails to parse is retried by asking for this many
+        # candidates in one request, at a temperature that rises with every failed candidate
+        self.n_candidates = n_candidates
+        # If true, score_action asks for n_candidates candidates from the start and keeps the
+        # label most of them give every philosophy
+        self.majority_vote = majority_vote
+        if self.conversation and self.n_candidates > 1:
+            raise ValueError("Conversation mode cannot be used with n_candidates > 1.")
+        if self.majority_vote and self.n_candidates < 2:
+            raise ValueError("Majority vote needs n_candidates > 1.")
+        # If true, responses are parsed while they stream in, and a response that stops being
+        # parsable is aborted and retried at once; see get_streamed_response
+        self.stream_responses = stream_responses
+        if self.conversation and self.stream_responses:
+            raise ValueError("Conversation mode cannot be used with stream_responses.")
+        # If true, every prompt family with a schema.json asks for JSON constrained to its schema,
+        # which is validated strictly instead of cleaned up and parsed; see get_output_schema
+        self.structured_output = structured_output
+        if self.conversation and self.structured_output:
+            raise ValueError("Conversation mode cannot be used with structured_output.")
+        if self.stream_responses and self.structured_output:
+            # The items of a structured response are nested under its "response" key
+            raise ValueError("Structured output cannot be used with stream_responses.")
+        # Share one limiter between questioners to keep them under the same limits
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        # One record per prompt sent or read from history
+        self.metrics = metrics if metrics is not None else MetricsRecorder()
+        # Chatbots for specific prompts, by prompt name; other prompts use self.chatbot
+        self.prompt_chatbots = {}
         self.set_chatbot()
         self.fresh_start = fresh_start
+        self.history_lock = threading.RLock()
+        # Parsed responses by history key, next to the raw response they were parsed from
+        self.parsed_responses = {}
+        # Near-duplicate actions merged away before scoring, mapped to the action kept
+        self.action_aliases = {}
+        # History keys by request hash, to reuse a response stored under another key
+        self.request_hash_to_key = {}
+        # Events of the requests being sent, by request hash, set once they are done
+        self.requests_in_flight = {}
+        # The action scores, stored by column; action_scores is its list of dictionaries view
+        self.score_store = ScoreStore()
         self.read_history()
 
-    def set_chatbot(self, model: str = "gpt-4-1106-preview") -> None:
+    @property
+    def action_scores(self) -> List[dict]:
+        """The action scores, as dictionaries with "action", "philosophy", "morality" and "reason" keys.
+
+        A copy of score_store: assign a new list, or add to score_store, to change the scores.
+        """
+        return self.score_store.to_dicts()
+
+    @action_scores.setter
+    def action_scores(self, action_scores: List[dict]) -> None:
+        self.score_store = ScoreStore.from_records(action_scores)
+
+    # The same scores, under the name the other collect_* attributes follow
+    collect_action_scores = action_scores
+
+    def set_chatbot(
+        self,
+        model: str = "gpt-4-1106-preview",
+        prompt_names: Optional[List[str]] = None,
+        base_url: Optional[str] = None,
+        chatbot: Optional[ChatBackend] = None,
+    ) -> None:
         """Set the chatbot to use for the questioner.
 
+        Routing prompts to their own chatbot lets stages that use different models
+        run at the same time.
+
         Args:
             model (str, optional): The model name. Defaults to "gpt-4-1106-preview".
+            prompt_names (Optional[List[str]], optional): Only use the chatbot for these prompts,
+                e.g. ["score_action"]. Defaults to None (every prompt without its own chatbot).
+            base_url (Optional[str], optional): An OpenAI-compatible server to use instead of the
+                OpenAI API, e.g. a local model. Defaults to None.
+            chatbot (Optional[ChatBackend], optional): Use this chatbot instead of an OpenAIChat,
+                e.g. a philo.fake_chat.FakeChat; model and base_url are then ignored. Defaults to None.
         """
-        self.chatbot = OpenAIChat(model=model)
+        if chatbot is None:
+            chatbot = OpenAIChat(model=model, stateless=not self.conversation, base_url=base_url)
+        if prompt_names is None:
+            self.chatbot = chatbot
+            return
+        for prompt_name in prompt_names:
+            self.prompt_chatbots[prompt_name] = chatbot
+
+    def set_run_chatbots(
+        self,
+        model: str = DEFAULT_MODEL,
+        score_model: str = DEFAULT_SCORE_MODEL,
+        base_url: Optional[str] = None,
+    ) -> None:
+        """Route the prompts of a run to their models, as every entry point does.
+
+        The model is part of the request hash, so prompts sent through another route, e.g.
+        in a batch, are only found in history if they were routed the same way.
+
+        Args:
+            model (str, optional): The model of every prompt but score_action. Defaults to DEFAULT_MODEL.
+            score_model (str, optional): The model of the score_action prompts. Defaults to
+                DEFAULT_SCORE_MODEL.
+            base_url (Optional[str], optional): An OpenAI-compatible server to use instead of the
+                OpenAI API. Defaults to None.
+        """
+        self.set_chatbot(model=model, base_url=base_url)
+        self.set_chatbot(model=score_model, prompt_names=["score_action"], base_url=base_url)
+
+    def get_chatbot(self, history_key: Optional[str] = None) -> ChatBackend:
+        """Get the chatbot answering a prompt.
+
+        Args:
+            history_key (Optional[str], optional): The history key of the prompt, from get_key.
+                Defaults to None (the default chatbot).
+
+        Returns:
+            ChatBackend: The chatbot set for the prompt name in the key, or the default chatbot.
+        """
+        if history_key is None:
+            return self.chatbot
+        return self.prompt_chatbots.get(history_key.split("||")[0], self.chatbot)
 
     def log(self, text: str) -> None:
         """Log a message.
@@ -56,85 +215,571 @@ class Questioner:
         self.log(f"=== End {type} ===")
 
     def read_history(self) -> None:
-        """Read the history file."""
-        try:
-            if self.fresh_start:
-                # Delete the history file
-                os.remove(self.history_file_path)
-            with open(self.history_file_path, "r") as f:
-                self.history = json.load(f)
-        except FileNotFoundError:
-            # Create the file if it doesn't exist
-            if not os.path.exists(self.history_file_path):
-                with open(self.history_file_path, "w") as f:
-                    f.write("{}")
-            self.history = {}
+        """Read the history file and index its request hashes.
+
+        With a fresh start the history file is deleted first. The jsonl backend imports
+        an existing history{suffix}.json file the first time it is opened.
+        """
+        if self.fresh_start:
+            # Delete the history files
+            for path in [self.history_file_path, self.legacy_history_file_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+        self.history = open_history(
+            self.history_file_path,
+            backend=self.history_backend,
+            legacy_path=self.legacy_history_file_path,
+        )
+        self.request_hash_to_key = {
+            record["request_hash"]: history_key
+            for history_key, record in self.history.items()
+            if "request_hash" in record
+        }
 
     def write_history(self) -> None:
         """Write the history file."""
-        with open(self.history_file_path, "w") as f:
-            json.dump(self.history, f, indent=2)
+        self.history.save()
 
     def send_receive(
         self,
         prompt: str,
-        history_key: str,
+        history_key: Optional[str],
         force_refresh: bool = False,
         max_retries: int = 15,
+        prompt_name: Optional[str] = None,
+        on_item: Optional[Callable[[int, Any], None]] = None,
     ) -> str:
         """Wrapper to send and receive messages from the chatbot.
 
+        Responses are cached by the hash of the request, see get_cached_response, so a
+        prompt is only re-sent if the prompt, the model or the sampling parameters change.
+        Network and rate limit errors are retried after an exponential backoff with jitter,
+        or after the time the API asks for. Unparsable responses are re-queried immediately,
+        with n_candidates candidates per request if it is greater than 1; see get_candidate.
+        With stream_responses, every item of the response is parsed as soon as it streams in.
+
         Args:
             prompt (str): The prompt to send to the chatbot.
-            history_key (str): The key to use for the history.
+            history_key (Optional[str]): The key to use for the history. If None, the response is not stored.
             force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
             max_retries (int, optional): Maximum number of retries. Defaults to 15.
+            prompt_name (Optional[str], optional): The prompt name for the metrics, if history_key is None.
+                Defaults to None.
+            on_item (Optional[Callable[[int, Any], None]], optional): Called with the index and value of
+                every item of the response, a list element or a dictionary (key, value) tuple. Streamed
+                items are handed over as soon as they are parsed; an aborted stream's retry hands
+                them over again from index 0. Defaults to None.
 
         Raises:
-            Exception: Failed after max_retries attempts.
+            Exception: Failed after max_retries attempts. Errors that are not retried, such as
+                authentication errors, bad requests and exceptions raised by on_item, are passed
+                on as is.
 
         Returns:
             str: The response from the chatbot.
         """
         retries = 0
-        while retries < max_retries:
-            seed = retries + 1
-            temperature = retries / max_retries
-            try:
-                # Check if we need to (re)send the message
-                if force_refresh or (history_key not in self.history):
-                    self.log("Sending message...")
-                    # Send the message and update history
-                    out = self.chatbot.send_receive(prompt, seed=seed, temperature=temperature)
-                    self.history[history_key] = {"prompt": prompt, "response": out}
-                    self.write_history()
-                else:
-                    # Retrieve response from history if available and no need to force refresh
-                    out = self.history[history_key]["response"]
+        parse_failures = 0
+        chatbot = self.get_chatbot(history_key)
+        request_hash = self.get_request_hash(prompt, history_key, prompt_name=prompt_name)
+        output_schema = self.get_output_schema(history_key, prompt_name)
+        format_kwargs = self.get_format_kwargs(output_schema)
+        start = time.perf_counter()
+        cache_hit = True
+        prompt_tokens, completion_tokens = 0, 0
+        vote = self.uses_vote(history_key)
+        first_item_time = None
+        # An exception raised by on_item, which is not retried
+        callback_error = None
 
-                # Attempt to parse the structured output
-                parse_structured_output(out)
-                return out  # Return successfully parsed output
+        def hand_over(index: int, item: Any) -> None:
+            nonlocal callback_error
+            try:
+                on_item(index, item)
             except Exception as e:
-                # Handle exceptions (both from sending/receiving and parsing)
-                self.log("An error occurred; attempting retry.")
-                self.log(f"T={temperature}, seed={seed}")
-                self.log(f"Error: {e}")
-                retries += 1
-                if history_key in self.history:
-                    time.sleep(5)  # Give the history time to update
-                    del self.history[history_key]  # Remove the history entry to force a refresh
-                    self.write_history()
-                    time.sleep(5)  # Give the history time to update
-                if retries < max_retries:
-                    # Optional: modify force_refresh or adjust logic if needed before retrying
-                    continue
-                else:
-                    # Handling case where max retries are reached
-                    break  # Break from the loop if max retries have been reached
+                callback_error = e
+                raise
+
+        def emit(index: int, item: Any) -> None:
+            nonlocal first_item_time
+            if first_item_time is None:
+                first_item_time = time.perf_counter()
+            if on_item is not None:
+                hand_over(index, item)
+
+        # True once this call sends the request, until it returns
+        claimed = False
+        # An error that sending again would not fix
+        error = None
+        try:
+            while retries < max_retries:
+                # Parse failures are retried with a new seed and a higher temperature
+                seed = parse_failures + 1
+                temperature = min(parse_failures / max_retries, 1.0)
+                parser = None
+                try:
+                    # Retrieve the response from history if available and no need to force refresh
+                    out = None if force_refresh else self.get_cached_response(history_key, prompt)
+                    while out is None and not (claimed or force_refresh or history_key is None):
+                        in_flight = self.claim_request(request_hash)
+                        claimed = in_flight is None
+                        if not claimed:
+                            # The same request is being sent: wait for it and read its response
+                            in_flight.wait()
+                            out = self.get_cached_response(history_key, prompt)
+                    if out is None:
+                        self.log("Sending message...")
+                        self.rate_limiter.acquire(estimate_tokens(prompt))
+                        # Send the message and update history
+                        cache_hit = False
+                        candidates = None
+                        try:
+                            if vote or (parse_failures > 0 and self.n_candidates > 1):
+                                candidates = chatbot.send_receive_candidates(
+                                    prompt,
+                                    n=self.n_candidates,
+                                    temperature=max(temperature, VOTE_TEMPERATURE if vote else 0.0),
+                                    seed=seed,
+                                    **format_kwargs,
+                                )
+                            elif self.stream_responses:
+                                parser = IncrementalParser()
+                                out = self.get_streamed_response(
+                                    chatbot,
+                                    prompt,
+                                    parser,
+                                    emit,
+                                    temperature=temperature,
+                                    seed=seed,
+                                )
+                            else:
+                                out = chatbot.send_receive(
+                                    prompt, seed=seed, temperature=temperature, **format_kwargs
+                                )
+                        finally:
+                            usage = chatbot.get_last_usage()
+                            if usage is None and parser is not None:
+                                # An aborted stream has no usage; count what it generated
+                                usage = {
+                                    "prompt_tokens": estimate_tokens(prompt),
+                                    "completion_tokens": estimate_tokens(parser.text),
+                                }
+                            usage_tokens = get_usage_tokens(usage)
+                            prompt_tokens += usage_tokens[0]
+                            completion_tokens += usage_tokens[1]
+                        agreement = None
+                        if candidates is not None:
+                            out, n_invalid, agreement = self.get_candidate(
+                                candidates, vote, output_schema
+                            )
+                            parse_failures += n_invalid
+                        elif output_schema is not None:
+                            # Store what the free text prompts parse to, without the scratchpad
+                            out = output_schema.get_response(out)
+                        self.store_response(
+                            history_key, prompt, out, request_hash, agreement=agreement
+                        )
+
+                    # Attempt to parse the structured output
+                    parsed = self.parse_response(history_key, out)
+                    if on_item is not None and parser is None:
+                        # Hand over the items of a response that was not streamed all at once
+                        items = parsed.items() if isinstance(parsed, dict) else parsed
+                        for index, item in enumerate(items if isinstance(items, Iterable) else []):
+                            hand_over(index, item)
+                    self.record_metrics(
+                        history_key=history_key,
+                        prompt_name=prompt_name,
+                        prompt=prompt,
+                        chatbot=chatbot,
+                        start=start,
+                        cache_hit=cache_hit,
+                        prompt_tokens=prompt_tokens,
+                        completion_tokens=completion_tokens,
+                        retries=retries,
+                        parse_failures=parse_failures,
+                        first_item_seconds=(
+                            None if first_item_time is None else first_item_time - start
+                        ),
+                    )
+                    return out  # Return successfully parsed output
+                except Exception as e:
+                    if e is callback_error:
+                        # The caller failed, not the request: don't send the prompt again
+                        raise
+                    if not (is_transient_error(e) or isinstance(e, PARSE_ERRORS)):
+                        # Neither the network nor the response, e.g. an invalid API key, a bad
+                        # request or a bug: the same request would fail again
+                        error = e
+                        break
+                    # Handle exceptions (both from sending/receiving and parsing)
+                    self.log("An error occurred; attempting retry.")
+                    self.log(f"T={temperature}, seed={seed}")
+                    self.log(f"Error: {e}")
+                    retries += 1
+                    if is_transient_error(e):
+                        # Back off before sending again; rate limits hold back every caller
+                        delay = get_retry_after(e) or get_backoff_delay(retries)
+                        if is_rate_limit_error(e):
+                            self.rate_limiter.pause(delay)
+                        elif retries < max_retries:
+                            time.sleep(delay)
+                        continue
+                    # The response itself is bad: drop it and re-query right away
+                    parse_failures += 1
+                    # Don't pick the same response up again under another key
+                    force_refresh = True
+                    if history_key in self.history:
+                        with self.history_lock:
+                            # Remove the history entry to force a refresh
+                            self.history.pop(history_key, None)
+                            self.write_history()
+
+            # After exhausting max_retries or on an error that is not retried, handle the failure
+            self.record_metrics(
+                history_key=history_key,
+                prompt_name=prompt_name,
+                prompt=prompt,
+                chatbot=chatbot,
+                start=start,
+                cache_hit=cache_hit,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                retries=retries,
+                parse_failures=parse_failures,
+                failed=True,
+            )
+            if error is not None:
+                raise error
+            raise Exception(f"Failed after {max_retries} attempts.")
+        finally:
+            if claimed:
+                self.release_request(request_hash)
+
+    def get_streamed_response(
+        self,
+        chatbot: ChatBackend,
+        prompt: str,
+        parser: IncrementalParser,
+        on_item: Callable[[int, Any], None],
+        temperature: float = 0.0,
+        seed: int = 1,
+    ) -> str:
+        """Stream a response, handing over every item as soon as it is parsed.
+
+        The stream is closed as soon as the response can no longer be parsed, so a malformed
+        response costs the time and tokens up to the first bad item, not the whole generation.
+
+        Args:
+            chatbot (ChatBackend): The chatbot.
+            prompt (str): The prompt.
+            parser (IncrementalParser): A new parser, holding the text received once this returns.
+            on_item (Callable[[int, Any], None]): Called with the index and value of every item.
+            temperature (float, optional): The randomness of the response. Defaults to 0.0.
+            seed (int, optional): The seed for the randomness. Defaults to 1.
+
+        Raises:
+            ValueError: The response stopped being parsable.
+
+        Returns:
+            str: The response.
+        """
+        chunks = chatbot.stream_response(prompt, temperature=temperature, seed=seed)
+
+        def iter_items():
+            for chunk in chunks:
+                yield from parser.feed(chunk)
+            yield from parser.close()
+
+        try:
+            for index, item in enumerate(iter_items()):
+                on_item(index, item)
+        finally:
+            # Stop the generation if the response was aborted
+            chunks.close()
+        return parser.text
 
-        # After exhausting max_retries, handle the failure case
-        raise Exception(f"Failed after {max_retries} attempts.")
+    def get_candidate(
+        self,
+        candidates: List[str],
+        vote: bool = False,
+        output_schema: Optional[OutputSchema] = None,
+    ) -> Tuple[str, int, Optional[List[float]]]:
+        """Pick the response to keep among candidates sent back in one request.
+
+        Args:
+            candidates (List[str]): The candidate responses.
+            vote (bool, optional): If true, the candidates are score_action responses; keep the
+                label most of the candidates that parse give every philosophy, see
+                get_majority_scores. Defaults to False (keep the first candidate that parses).
+            output_schema (Optional[OutputSchema], optional): The schema the candidates were
+                constrained to; candidates that do not match it are invalid. Defaults to None
+                (free text candidates).
+
+        Raises:
+            ValueError: No candidate could be parsed.
+
+        Returns:
+            Tuple[str, int, Optional[List[float]]]: The response, the number of candidates that
+                could not be parsed before it, or in all if voting, and the share of the votes
+                the label of every philosophy got if voting, None otherwise.
+        """
+        parsed_candidates = []
+        n_invalid = 0
+        for candidate in candidates:
+            try:
+                if output_schema is not None:
+                    candidate = output_schema.get_response(candidate)
+                parsed = parse_structured_output(candidate)
+            except Exception:
+                n_invalid += 1
+                continue
+            if not vote:
+                return candidate, n_invalid, None
+            if isinstance(parsed, list):
+                parsed_candidates.append(parsed)
+            else:
+                n_invalid += 1
+        if not parsed_candidates:
+            raise ValueError(f"None of the {len(candidates)} candidates could be parsed.")
+        scores, agreement = get_majority_scores(parsed_candidates)
+        return json.dumps(scores), n_invalid, agreement
+
+    def record_metrics(
+        self,
+        history_key: Optional[str],
+        prompt_name: Optional[str],
+        prompt: str,
+        chatbot: ChatBackend,
+        start: float,
+        cache_hit: bool,
+        prompt_tokens: int,
+        completion_tokens: int,
+        retries: int,
+        parse_failures: int,
+        failed: bool = False,
+        first_item_seconds: Optional[float] = None,
+    ) -> None:
+        """Record the cost of a send_receive call; see MetricsRecorder.
+
+        Args:
+            history_key (Optional[str]): The history key of the prompt.
+            prompt_name (Optional[str]): The name of the prompt. If None, read from history_key.
+            prompt (str): The prompt.
+            chatbot (ChatBackend): The chatbot the prompt was sent to.
+            start (float): The time.perf_counter() at the start of the call.
+            cache_hit (bool): True if the response was read from history.
+            prompt_tokens (int): The prompt tokens of every attempt.
+            completion_tokens (int): The completion tokens of every attempt.
+            retries (int): The number of retries.
+            parse_failures (int): The number of unparsable responses.
+            failed (bool, optional): True if the call failed after every retry. Defaults to False.
+            first_item_seconds (Optional[float], optional): The time from the start of the call to
+                the first streamed item. Defaults to None (not streamed).
+        """
+        self.metrics.record(
+            history_key=history_key,
+            prompt_name=prompt_name or (history_key.split("||")[0] if history_key else None),
+            model=chatbot.model,
+            prompt_chars=len(prompt),
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            seconds=time.perf_counter() - start,
+            retries=retries,
+            parse_failures=parse_failures,
+            cache_hit=cache_hit,
+            failed=failed,
+            first_item_seconds=first_item_seconds,
+        )
+
+    def get_request_hash(
+        self, prompt: str, history_key: Optional[str] = None, prompt_name: Optional[str] = None
+    ) -> str:
+        """Hash the request sending a prompt: the model, system role, prompt and sampling parameters.
+
+        Retries with a new seed or temperature are attempts at the same request, so the
+        hash is taken over the first attempt. In conversation mode the earlier messages
+        are not part of the hash. The response format is, so that structured and free text
+        responses are cached apart.
+
+        Args:
+            prompt (str): The prompt.
+            history_key (Optional[str], optional): The history key of the prompt, to pick its chatbot. Defaults to None.
+            prompt_name (Optional[str], optional): The prompt name, if history_key is None. Defaults to None.
+
+        Returns:
+            str: The request hash.
+        """
+        chatbot = self.get_chatbot(history_key)
+        format_kwargs = self.get_format_kwargs(self.get_output_schema(history_key, prompt_name))
+        if self.uses_vote(history_key):
+            # A voted response answers a different request than a single response
+            return hash_request(
+                chatbot.get_request_body(
+                    prompt, temperature=VOTE_TEMPERATURE, n=self.n_candidates, **format_kwargs
+                )
+            )
+        return hash_request(chatbot.get_request_body(prompt, **format_kwargs))
+
+    def get_output_schema(
+        self, history_key: Optional[str], prompt_name: Optional[str] = None
+    ) -> Optional[OutputSchema]:
+        """Get the schema responses to a prompt are constrained to; see structured_output.
+
+        Args:
+            history_key (Optional[str]): The history key of the prompt.
+            prompt_name (Optional[str], optional): The prompt name, if history_key is None.
+                Defaults to None.
+
+        Returns:
+            Optional[OutputSchema]: The schema of the prompt family, or None for free text responses.
+        """
+        if not self.structured_output:
+            return None
+        prompt_name = prompt_name or (history_key.split("||")[0] if history_key else None)
+        if prompt_name is None:
+            return None
+        return get_output_schema(prompt_name)
+
+    def get_format_kwargs(self, output_schema: Optional[OutputSchema]) -> dict:
+        """Get the keyword arguments constraining a chatbot's response to a schema.
+
+        Free text requests pass no response_format at all, so chatbots written before
+        structured output keep working.
+
+        Args:
+            output_schema (Optional[OutputSchema]): The schema, from get_output_schema.
+
+        Returns:
+            dict: The response_format argument, or nothing for free text responses.
+        """
+        if output_schema is None:
+            return {}
+        return {"response_format": output_schema.get_response_format()}
+
+    def uses_vote(self, history_key: Optional[str]) -> bool:
+        """Whether the response to a prompt is voted between candidates; see majority_vote.
+
+        Args:
+            history_key (Optional[str]): The history key of the prompt.
+
+        Returns:
+            bool: True for score_action prompts with majority_vote.
+        """
+        if not self.majority_vote or history_key is None:
+            return False
+        return history_key.startswith("score_action||")
+
+    def claim_request(self, request_hash: str) -> Optional[threading.Event]:
+        """Claim a request to send it, unless the same request is already being sent.
+
+        Args:
+            request_hash (str): The request hash.
+
+        Returns:
+            Optional[threading.Event]: None if the caller now sends the request and has to call
+                release_request once done, or the event set once the request being sent is done.
+        """
+        with self.history_lock:
+            in_flight = self.requests_in_flight.get(request_hash)
+            if in_flight is None:
+                self.requests_in_flight[request_hash] = threading.Event()
+            return in_flight
+
+    def release_request(self, request_hash: str) -> None:
+        """Release a request claimed with claim_request, waking the callers waiting for it.
+
+        Args:
+            request_hash (str): The request hash.
+        """
+        with self.history_lock:
+            in_flight = self.requests_in_flight.pop(request_hash, None)
+        if in_flight is not None:
+            in_flight.set()
+
+    def get_cached_response(self, history_key: Optional[str], prompt: str) -> Optional[str]:
+        """Get the stored response to a prompt, if it is still valid.
+
+        The record under history_key is valid if its request hash matches the current
+        request. Records written before hashes were stored are valid if their prompt
+        matches. Otherwise a response stored under any other key for the same request
+        hash is reused, and copied under history_key.
+
+        Args:
+            history_key (Optional[str]): The history key of the prompt.
+            prompt (str): The prompt.
+
+        Returns:
+            Optional[str]: The response, or None if the prompt has to be sent.
+        """
+        request_hash = self.get_request_hash(prompt, history_key)
+        record = self.history.get(history_key) if history_key is not None else None
+        if record is not None:
+            if record.get("request_hash", None) == request_hash:
+                return record["response"]
+            if "request_hash" not in record and record["prompt"] == prompt:
+                return record["response"]
+        other_key = self.request_hash_to_key.get(request_hash)
+        other_record = self.history.get(other_key) if other_key is not None else None
+        if other_record is None or other_record.get("request_hash") != request_hash:
+            return None
+        if history_key is not None and history_key != other_key:
+            self.store_response(
+                history_key, other_record["prompt"], other_record["response"], request_hash
+            )
+        return other_record["response"]
+
+    def store_response(
+        self,
+        history_key: Optional[str],
+        prompt: str,
+        out: str,
+        request_hash: str,
+        write: bool = True,
+        agreement: Optional[List[float]] = None,
+    ) -> None:
+        """Store a response in history, with the hash of the request it answers.
+
+        Args:
+            history_key (Optional[str]): The history key. If None, the response is not stored.
+            prompt (str): The prompt that was sent.
+            out (str): The response.
+            request_hash (str): The hash of the request, from get_request_hash.
+            write (bool, optional): If true, write the history file. Defaults to True.
+            agreement (Optional[List[float]], optional): For a voted response, the share of the
+                votes every label got, a cheap self-consistency signal. Defaults to None.
+        """
+        if history_key is None:
+            return
+        record = {"prompt": prompt, "response": out, "request_hash": request_hash}
+        if agreement is not None:
+            record["agreement"] = agreement
+        with self.history_lock:
+            self.history[history_key] = record
+            self.request_hash_to_key[request_hash] = history_key
+            if write:
+                self.write_history()
+
+    def parse_response(self, history_key: Optional[str], out: str) -> any:
+        """Parse a response, reusing the result if the response was parsed before.
+
+        send_receive parses every response to validate it, so callers get the parsed
+        object from here without parsing it a second time. The object is shared between
+        callers and should not be modified.
+
+        Args:
+            history_key (Optional[str]): The history key of the response.
+            out (str): The response.
+
+        Returns:
+            any: The parsed response.
+        """
+        cached = self.parsed_responses.get(history_key)
+        if cached is not None and cached[0] == out:
+            return cached[1]
+        parsed = parse_structured_output(out)
+        self.parsed_responses[history_key] = (out, parsed)
+        return parsed
 
     def get_key(self, prompt_name: str, prompt_version_number: int, *args) -> str:
         """Automatically generate a history key.
@@ -165,7 +810,7 @@ class Questioner:
         prompt = pc.get_prompt()
         history_key = self.get_key(prompt_name, pc.prompt_version_number)
         out = self.send_receive(prompt, history_key, force_refresh)
-        self.philosophies = parse_structured_output(out)
+        self.philosophies = self.parse_response(history_key, out)
 
     def set_actions_from_philosophies(
         self,
@@ -180,12 +825,34 @@ class Questioner:
             prompt_version_number (int): The version number of the prompt.
             force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
         """
+        self.actions_from_philosophies = self.get_actions_from_philosophy(
+            philosophy_dict,
+            prompt_version_number=prompt_version_number,
+            force_refresh=force_refresh,
+        )
+
+    def get_actions_from_philosophy(
+        self,
+        philosophy_dict: dict,
+        prompt_version_number: int,
+        force_refresh: bool = False,
+    ) -> list:
+        """Get the actions from a philosophy without setting any attribute.
+
+        Args:
+            philosophy_dict (dict): A dictionary representing a philosophy.
+            prompt_version_number (int): The version number of the prompt.
+            force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
+
+        Returns:
+            list: Dictionaries with an "action" key.
+        """
         prompt_name = "action_from_philosophy"
         pc = PromptConstructor(prompt_name=prompt_name, prompt_version_number=prompt_version_number)
         prompt = pc.get_prompt(user_input=str(philosophy_dict))
         history_key = self.get_key(prompt_name, pc.prompt_version_number, philosophy_dict["name"])
         out = self.send_receive(prompt, history_key, force_refresh)
-        self.actions_from_philosophies = parse_structured_output(out)
+        return self.parse_response(history_key, out)
 
     def set_all_actions_from_philosophies(self) -> None:
         """Set all actions from all philosophies."""
@@ -203,6 +870,70 @@ class Questioner:
             )
         self.all_actions_from_philosophies = collect_actions_from_philosophies
 
+    def iter_actions_from_philosophies(
+        self,
+        prompt_version_number: int = 0,
+        dedup_threshold: Optional[float] = None,
+    ) -> Iterator[str]:
+        """Stream the actions of all philosophies, as each philosophy's response arrives.
+
+        Actions are yielded once, the first time any philosophy names them. Once the
+        stream is exhausted, all_actions_from_philosophies and all_actions are set as by
+        set_all_actions_from_philosophies and set_all_actions, but without duplicate actions.
+
+        Args:
+            prompt_version_number (int, optional): The version number of the prompt. Defaults to 0.
+            dedup_threshold (Optional[float], optional): If set, also drop near-duplicates of the actions
+                yielded so far, as set_deduplicated_actions does, and set action_aliases. Defaults to None.
+
+        Yields:
+            str: The actions.
+        """
+        seen = set()
+        aliases = {}
+        index = MinHashLSH(threshold=dedup_threshold) if dedup_threshold is not None else None
+
+        def get_actions(philosophy_dict):
+            actions = self.get_actions_from_philosophy(
+                philosophy_dict,
+                prompt_version_number=prompt_version_number,
+            )
+            return philosophy_dict, actions
+
+        actions_by_philosophy = {}
+        for philosophy_dict, actions in iter_concurrently(
+            get_actions,
+            self.philosophies,
+            max_concurrency=self.max_concurrency,
+        ):
+            actions_by_philosophy[philosophy_dict["name"]] = actions
+            for action_dict in actions:
+                action = action_dict["action"]
+                if action in seen:
+                    continue
+                seen.add(action)
+                if index is not None:
+                    match = index.query(action, add=True)
+                    if match is not None:
+                        aliases[action] = match
+                        continue
+                yield action
+        # Responses arrive in any order; keep the attributes in philosophy order
+        self.all_actions_from_philosophies = [
+            {"philo": philosophy_dict, "actions": actions_by_philosophy[philosophy_dict["name"]]}
+            for philosophy_dict in self.philosophies
+        ]
+        self.all_actions = [
+            action
+            for action in dict.fromkeys(
+                action_dict["action"]
+                for d in self.all_actions_from_philosophies
+                for action_dict in d["actions"]
+            )
+            if action not in aliases
+        ]
+        self.action_aliases = aliases
+
     def set_all_actions(self) -> None:
         """Collect all actions into a list."""
         collect_all_actions = []
@@ -211,19 +942,43 @@ class Questioner:
                 collect_all_actions.append(action_dict["action"])
         self.all_actions = collect_all_actions
 
-    def set_clusters_to_actions(
+    def set_deduplicated_actions(self, threshold: float = DEDUP_THRESHOLD) -> None:
+        """Merge near-duplicate actions, so that only one of them is clustered and scored.
+
+        Actions are compared by the Jaccard similarity of their word stems, found with a
+        MinHash LSH index, and never merged if their negations differ. The first action of each group is kept, and the
+        others are recorded in action_aliases and listed next to it in the scorecard.
+
+        Args:
+            threshold (float, optional): The similarity from which actions are merged. Defaults to
+                DEDUP_THRESHOLD.
+        """
+        self.all_actions, self.action_aliases = deduplicate_actions(
+            self.all_actions, threshold=threshold
+        )
+
+    def get_action_alias_notes(self) -> dict:
+        """Get the scorecard note listing the actions merged into each kept action.
+
+        Returns:
+            dict: Kept actions to their note.
+        """
+        merged = defaultdict(list)
+        for alias, action in self.action_aliases.items():
+            merged[action].append(alias)
+        return {action: f"<br>merged: {'; '.join(aliases)}" for action, aliases in merged.items()}
+
+    def set_cluster_labels(
         self,
         prompt_version_number: int,
         force_refresh: bool = False,
-        pbar: bool = False,
         verbose: bool = False,
     ) -> None:
-        """Create a dictionary of clusters to actions.
+        """Determine the cluster labels from all actions.
 
         Args:
             prompt_version_number (int): The version number of the prompt.
             force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
-            pbar (bool, optional): If true, show a progress bar. Defaults to False.
             verbose (bool, optional): If true, log the prompt and response. Defaults to False.
         """
         prompt_name = "determine_clusters"
@@ -235,30 +990,190 @@ class Questioner:
         out = self.send_receive(prompt, history_key, force_refresh)
         if verbose:
             self.log_chatbot(out, "response")
-        self.cluster_labels = parse_structured_output(out)
+        self.cluster_labels = self.parse_response(history_key, out)
+
+    def set_clusters_to_actions(
+        self,
+        prompt_version_number: int,
+        force_refresh: bool = False,
+        pbar: bool = False,
+        verbose: bool = False,
+        backend: str = "llm",
+        n_clusters: Optional[int] = None,
+    ) -> None:
+        """Create a dictionary of clusters to actions.
+
+        Args:
+            prompt_version_number (int): The version number of the prompt.
+            force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
+            pbar (bool, optional): If true, show a progress bar. Defaults to False.
+            verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+            backend (str, optional): "llm" to ask for the cluster labels and then for the cluster of every
+                action, or "local" to cluster the actions on the CPU and only ask for the cluster names.
+                Defaults to "llm".
+            n_clusters (Optional[int], optional): The number of clusters of the local backend. Defaults to None
+                (see clustering.cluster_actions).
+
+        Raises:
+            ValueError: Invalid backend.
+        """
+        if backend == "local":
+            self.set_local_clusters_to_actions(
+                prompt_version_number=prompt_version_number,
+                n_clusters=n_clusters,
+                force_refresh=force_refresh,
+                verbose=verbose,
+            )
+            return
+        if backend != "llm":
+            raise ValueError(f"Invalid clustering backend: {backend}")
+        self.set_cluster_labels(
+            prompt_version_number=prompt_version_number,
+            force_refresh=force_refresh,
+            verbose=verbose,
+        )
+        self.set_action_clusters(
+            prompt_version_number=prompt_version_number, force_refresh=force_refresh, pbar=pbar
+        )
+
+    def set_action_clusters(
+        self, prompt_version_number: int, force_refresh: bool = False, pbar: bool = False
+    ) -> None:
+        """Ask for the cluster of every action, among the cluster_labels already set.
+
+        This is the "llm" backend of set_clusters_to_actions without asking for the labels
+        again, e.g. for a pipeline stage that runs after the cluster_labels stage.
+
+        Args:
+            prompt_version_number (int): The version number of the prompt.
+            force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
+            pbar (bool, optional): If true, show a progress bar. Defaults to False.
+        """
         prompt_name = "action_cluster"
         action_cluster_pc = PromptConstructor(
             prompt_name=prompt_name,
             prompt_version_number=prompt_version_number,
         )
-        self.collect_action_clusters = []
-        iterator = self.all_actions
-        if pbar:
-            iterator = tqdm(self.all_actions)
-        for action in iterator:
-            user_input = "{\n\t'action':{{ ACTION }}\n\t'cluster_labels':{{ CLUSTER_LABELS }}\n}"
-            user_input = user_input.replace("{{ ACTION }}", action)
-            user_input = user_input.replace("{{ CLUSTER_LABELS }}", str(self.cluster_labels))
-            prompt = action_cluster_pc.get_prompt(user_input=user_input)
-            history_key = self.get_key(prompt_name, pc.prompt_version_number, action)
-            out = self.send_receive(prompt, history_key, force_refresh)
-            out = parse_structured_output(out)
-            out_dict = {"action": action}
-            out_dict.update(out)
-            self.collect_action_clusters.append(out_dict)
+        self.collect_action_clusters = run_concurrently(
+            lambda action: self.get_action_cluster(action, action_cluster_pc, force_refresh),
+            self.all_actions,
+            max_concurrency=self.max_concurrency,
+            pbar=pbar,
+        )
+        self.set_cluster_to_actions_dict()
+        self.cluster_to_actions = self.cluster_to_actions_dict
+
+    def set_local_clusters_to_actions(
+        self,
+        prompt_version_number: int,
+        n_clusters: Optional[int] = None,
+        force_refresh: bool = False,
+        verbose: bool = False,
+        max_examples: int = 10,
+    ) -> None:
+        """Cluster the actions locally and ask the chatbot to name the clusters, in a single prompt.
+
+        Actions are clustered by k-means on the TF-IDF vectors of their character n-grams.
+        No chatbot judges the assignments, so "reason" and "aligned" are None; "similarity" holds
+        the cosine similarity of the action to its cluster centroid instead.
+
+        Args:
+            prompt_version_number (int): The version number of the prompt.
+            n_clusters (Optional[int], optional): The number of clusters. Defaults to None (see clustering.cluster_actions).
+            force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
+            verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+            max_examples (int, optional): The number of actions per cluster, closest to the centroid first,
+                shown to the chatbot. Defaults to 10.
+        """
+        labels, similarities = cluster_actions(self.all_actions, n_clusters=n_clusters)
+        # Clusters are numbered without gaps, so every cluster named below has actions
+        n_clusters = int(labels.max()) + 1 if len(labels) else 0
+        examples = {}
+        for k in range(n_clusters):
+            members = np.flatnonzero(labels == k)
+            closest = members[np.argsort(-similarities[members], kind="stable")][:max_examples]
+            examples[k + 1] = [self.all_actions[i] for i in closest]
+
+        if n_clusters == 0:
+            self.cluster_labels = []
+            self.collect_action_clusters = []
+            self.set_cluster_to_actions_dict()
+            self.cluster_to_actions = self.cluster_to_actions_dict
+            return
+
+        prompt_name = "name_clusters"
+        pc = PromptConstructor(prompt_name=prompt_name, prompt_version_number=prompt_version_number)
+        user_input = ",\n".join(
+            f"\t{k}: " + json.dumps(actions, indent="\t").replace("\n", "\n\t")
+            for k, actions in examples.items()
+        )
+        prompt = pc.get_prompt(user_input="{\n" + user_input + "\n}")
+        if verbose:
+            self.log_chatbot(prompt, "prompt")
+        history_key = self.get_key(prompt_name, pc.prompt_version_number)
+        out = self.send_receive(prompt, history_key, force_refresh)
+        if verbose:
+            self.log_chatbot(out, "response")
+        names = self.parse_response(history_key, out)
+        if isinstance(names, list):
+            names = dict(enumerate(names, start=1))
+        names = get_numbered_items(names)
+        # Fall back to the cluster number for clusters the response leaves out
+        names = [str(names.get(k + 1, f"cluster {k + 1}")) for k in range(n_clusters)]
+
+        self.cluster_labels = list(dict.fromkeys(names))
+        self.collect_action_clusters = [
+            {
+                "action": action,
+                "cluster": names[label],
+                "reason": None,
+                "aligned": None,
+                "similarity": float(similarity),
+            }
+            for action, label, similarity in zip(self.all_actions, labels, similarities)
+        ]
         self.set_cluster_to_actions_dict()
         self.cluster_to_actions = self.cluster_to_actions_dict
 
+    def get_action_cluster(
+        self,
+        action: str,
+        pc: PromptConstructor,
+        force_refresh: bool = False,
+    ) -> dict:
+        """Assign a single action to one of the cluster labels.
+
+        Args:
+            action (str): The action to assign.
+            pc (PromptConstructor): The action_cluster prompt constructor.
+            force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
+
+        Returns:
+            dict: The action, with its "cluster", "reason" and "aligned" values.
+        """
+        prompt = self.get_action_cluster_prompt(action, pc)
+        history_key = self.get_key(pc.prompt_name, pc.prompt_version_number, action)
+        out = self.send_receive(prompt, history_key, force_refresh)
+        out = self.parse_response(history_key, out)
+        out_dict = {"action": action}
+        out_dict.update(out)
+        return out_dict
+
+    def get_action_cluster_prompt(self, action: str, pc: PromptConstructor) -> str:
+        """Get the prompt assigning an action to one of the cluster labels.
+
+        Args:
+            action (str): The action to assign.
+            pc (PromptConstructor): The action_cluster prompt constructor.
+
+        Returns:
+            str: The prompt.
+        """
+        user_input = "{\n\t'action':{{ ACTION }}\n\t'cluster_labels':{{ CLUSTER_LABELS }}\n}"
+        user_input = user_input.replace("{{ ACTION }}", action)
+        user_input = user_input.replace("{{ CLUSTER_LABELS }}", str(self.cluster_labels))
+        return pc.get_prompt(user_input=user_input)
+
     def set_cluster_to_actions_dict(self) -> None:
         """Create a dictionary of clusters to actions."""
         collect = defaultdict(list)
@@ -272,6 +1187,8 @@ class Questioner:
                 "reason": reason,
                 "aligned": aligned,
             }
+            if "similarity" in ac:
+                to_attach["similarity"] = ac["similarity"]
             if cluster in collect:
                 # Put aligned actions at the beginning of the list
                 if aligned:
@@ -281,6 +1198,10 @@ class Questioner:
                     collect[cluster].append(to_attach)
             else:
                 collect[cluster] = [to_attach]
+        # Local clusters have no aligned flag: put the actions closest to the centroid first
+        for actions in collect.values():
+            if all("similarity" in d for d in actions):
+                actions.sort(key=lambda d: -d["similarity"])
         # Sort by the number of actions in each cluster
         collect = dict(sorted(collect.items(), key=lambda item: len(item[1]), reverse=True))
         self.cluster_to_actions_dict = collect
@@ -299,6 +1220,8 @@ class Questioner:
         force_refresh: bool = False,
         pbar: bool = False,
         verbose: bool = False,
+        batch_size: int = 1,
+        incremental: bool = False,
     ):
         """Create a list of action scores.
 
@@ -307,114 +1230,607 @@ class Questioner:
             force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
             pbar (bool, optional): If true, show a progress bar. Defaults to False.
             verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+            batch_size (int, optional): If greater than 1, score this many actions per prompt. Defaults to 1.
+            incremental (bool, optional): If true, only score the (philosophy, action) cells that no
+                score_action response in history has scored yet. Defaults to False.
+
+        Raises:
+            ValueError: incremental is used with batch_size > 1 or force_refresh, or majority_vote
+                with batch_size > 1.
         """
         prompt_name = "score_action"
         pc = PromptConstructor(prompt_name=prompt_name, prompt_version_number=prompt_version_number)
-        self.collect_action_scores = []
-        iterator = self.all_actions
-        if pbar:
-            iterator = tqdm(self.all_actions)
-        for action in iterator:
-            user_input = "{\n\t'action':'{{ ACTION }}'\n\t'philosophies':{{ PHILOSOPHIES }}\n}"
-            user_input = user_input.replace("{{ ACTION }}", action)
-            pl = str(self.philosophies)
-            pl = pl.replace("[{'", "[\n\t{'")
-            pl = pl.replace("'}, {'", "'},\n\t{'")
-            pl = pl.replace("'}]", "'}\n\t\t]")
-            user_input = user_input.replace("{{ PHILOSOPHIES }}", pl)
-            prompt = pc.get_prompt(user_input=user_input)
-            if verbose:
-                self.log_chatbot(prompt, "prompt")
-            history_key = self.get_key(prompt_name, pc.prompt_version_number, action)
-            out = self.send_receive(prompt, history_key, force_refresh)
-            if verbose:
-                self.log_chatbot(out, "response")
-            for d in parse_structured_output(out):
-                d_out = {"action": action}
-                d_out.update(d)
-                self.collect_action_scores.append(d_out)
-        self.action_scores = self.collect_action_scores
-
-    def create_scorecard(self) -> None:
-        """Create a scorecard of the action scores."""
-        # Convert the list of dictionaries into a DataFrame
-        df = pd.DataFrame(self.action_scores)
-
-        # Map morality to numerical values
-        morality_map = {"moral": 1, "undecided": 0, "immoral": -1}
-        df["morality_value"] = df["morality"].map(morality_map)
-        df_pivot = df.pivot_table(
-            values="morality_value",
-            index="philosophy",
-            columns="action",
-            fill_value=-10,
+        if batch_size > 1 and self.majority_vote:
+            raise ValueError("Majority vote cannot be used with batch_size > 1.")
+        if incremental:
+            if batch_size > 1 or force_refresh:
+                raise ValueError(
+                    "Incremental scoring cannot be used with batch_size > 1 or force_refresh."
+                )
+            scored_cells = self.get_scored_cells(pc.prompt_version_number)
+            scores_per_action = run_concurrently(
+                lambda action: self.get_incremental_action_scores(
+                    action, pc, scored_cells, verbose
+                ),
+                self.all_actions,
+                max_concurrency=self.max_concurrency,
+                pbar=pbar,
+            )
+            self.score_store = ScoreStore.from_records(
+                d for scores in scores_per_action for d in scores
+            )
+            return
+        if batch_size > 1:
+            self.set_batched_action_scores(
+                prompt_version_number=prompt_version_number,
+                batch_size=batch_size,
+                force_refresh=force_refresh,
+                pbar=pbar,
+                verbose=verbose,
+            )
+            # Every action is now in history, or is scored on its own below
+            force_refresh = False
+        scores_per_action = run_concurrently(
+            lambda action: self.get_action_scores(action, pc, force_refresh, verbose),
+            self.all_actions,
+            max_concurrency=self.max_concurrency,
+            pbar=pbar and batch_size <= 1,
+        )
+        # Flatten in the order of self.all_actions
+        self.score_store = ScoreStore.from_records(
+            d for scores in scores_per_action for d in scores
+        )
+
+    def set_action_scores_from_stream(
+        self,
+        actions: Iterable[str],
+        prompt_version_number: int,
+        pbar: bool = False,
+        verbose: bool = False,
+    ) -> None:
+        """Create the list of action scores, scoring each action as soon as it is produced.
+
+        Args:
+            actions (Iterable[str]): The actions, e.g. from iter_actions_from_philosophies.
+            prompt_version_number (int): The version number of the prompt.
+            pbar (bool, optional): If true, show a progress bar. Defaults to False.
+            verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+        """
+        prompt_name = "score_action"
+        pc = PromptConstructor(prompt_name=prompt_name, prompt_version_number=prompt_version_number)
+        scores_per_action = run_streaming(
+            lambda action: (action, self.get_action_scores(action, pc, verbose=verbose)),
+            actions,
+            max_concurrency=self.max_concurrency,
+            pbar=pbar,
+        )
+        # Follow the order of self.all_actions if the stream set it
+        scores_per_action = dict(scores_per_action)
+        order = getattr(self, "all_actions", None) or list(scores_per_action)
+        self.score_store = ScoreStore.from_records(
+            d for action in order if action in scores_per_action for d in scores_per_action[action]
         )
 
-        # Sort philosophies by number of 1's, then by number of 0's, then by number of -1's
-        philosophy_reindex = (
-            df_pivot.apply(
-                lambda r: ((r == 1).sum(), (r == 0).sum(), (r == -1).sum()),
-                axis=1,
+    def set_batched_action_scores(
+        self,
+        prompt_version_number: int,
+        batch_size: int,
+        force_refresh: bool = False,
+        pbar: bool = False,
+        verbose: bool = False,
+    ) -> None:
+        """Score the actions missing from history in chunks of batch_size actions per prompt.
+
+        The response to each chunk is split per action and stored under the same history key
+        as set_action_scores uses, so later runs read it back one action at a time.
+
+        Args:
+            prompt_version_number (int): The version number of the prompt.
+            batch_size (int): The number of actions to score per prompt.
+            force_refresh (bool, optional): If true, rescore actions that are in history. Defaults to False.
+            pbar (bool, optional): If true, show a progress bar. Defaults to False.
+            verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+        """
+        pc = PromptConstructor(
+            prompt_name="score_action_batch",
+            prompt_version_number=prompt_version_number,
+        )
+        score_action_pc = PromptConstructor(
+            prompt_name="score_action",
+            prompt_version_number=prompt_version_number,
+        )
+        pending_actions = [
+            action
+            for action in self.all_actions
+            if force_refresh
+            or self.get_cached_response(
+                self.get_key("score_action", pc.prompt_version_number, action),
+                self.get_action_score_prompt(action, score_action_pc),
             )
-            .sort_values(ascending=False)
-            .index
+            is None
+        ]
+        chunks = [
+            pending_actions[i : i + batch_size] for i in range(0, len(pending_actions), batch_size)
+        ]
+        run_concurrently(
+            lambda chunk: self.set_action_scores_from_batch(chunk, pc, score_action_pc, verbose),
+            chunks,
+            max_concurrency=self.max_concurrency,
+            pbar=pbar,
         )
-        df_pivot = df_pivot.reindex(philosophy_reindex)
 
-        df_pivot = df_pivot[self.sorted_actions]
+    def set_action_scores_from_batch(
+        self,
+        actions: list,
+        pc: PromptConstructor,
+        score_action_pc: PromptConstructor,
+        verbose: bool = False,
+    ) -> None:
+        """Score a chunk of actions with one prompt and store each action in history.
 
-        cluster_to_int = {k: e + 1 for e, k in enumerate(self.cluster_to_actions_dict.keys())}
+        Each action is stored with the request hash of its own score_action prompt, so that
+        get_action_scores finds it. Actions missing from the response are left out of history.
 
-        action_to_cluster = {
-            d["action"]: f'{cluster_to_int[d["cluster"]]:2d}' for d in self.collect_action_clusters
-        }
+        Args:
+            actions (list): The actions to score.
+            pc (PromptConstructor): The score_action_batch prompt constructor.
+            score_action_pc (PromptConstructor): The score_action prompt constructor.
+            verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+        """
+        numbered_actions = "\n".join(
+            f"\t\t{e + 1}:'{action}'," for e, action in enumerate(actions)
+        )
+        user_input = "{\n\t'actions':{\n{{ ACTIONS }}\n\t}\n\t'philosophies':{{ PHILOSOPHIES }}\n}"
+        user_input = user_input.replace("{{ ACTIONS }}", numbered_actions)
+        user_input = user_input.replace("{{ PHILOSOPHIES }}", self.get_philosophies_string())
+        prompt = pc.get_prompt(user_input=user_input)
+        if verbose:
+            self.log_chatbot(prompt, "prompt")
+        # The chunk is cached per action below, not as a whole
+        out = self.send_receive(prompt, history_key=None, prompt_name=pc.prompt_name)
+        if verbose:
+            self.log_chatbot(out, "response")
+        scores = self.parse_response(None, out)
+        if not isinstance(scores, dict):
+            self.log("Batched response is not a dictionary; scoring the actions one by one.")
+            return
+        scores = get_numbered_items(scores)
+        with self.history_lock:
+            for e, action in enumerate(actions):
+                action_scores = scores.get(e + 1)
+                if not isinstance(action_scores, list):
+                    continue
+                history_key = self.get_key("score_action", pc.prompt_version_number, action)
+                request_hash = self.get_request_hash(
+                    self.get_action_score_prompt(action, score_action_pc), history_key
+                )
+                self.store_response(
+                    history_key, prompt, json.dumps(action_scores), request_hash, write=False
+                )
+            self.write_history()
 
-        actions = df_pivot.columns.to_list()
-        actions = [f"{action_to_cluster[a]} | {a}" for a in actions]
-        philosophies = df_pivot.index.to_list()
+    def get_action_score_prompt(
+        self,
+        action: str,
+        pc: PromptConstructor,
+        philosophies: Optional[list] = None,
+    ) -> str:
+        """Get the prompt scoring an action against every philosophy.
 
-        # Custom hover data
-        # Assuming df is your original DataFrame
-        hover_data = df.pivot_table(
-            values="reason",
-            index="philosophy",
-            columns="action",
-            aggfunc=lambda x: ", ".join(x),  # Aggregate reasons, if necessary
-        ).fillna("")
+        Args:
+            action (str): The action to score.
+            pc (PromptConstructor): The score_action prompt constructor.
+            philosophies (Optional[list], optional): Score against these philosophies only. Defaults to None (all).
 
-        hover_data = hover_data[self.sorted_actions]
-        hover_data = hover_data.reindex(philosophy_reindex)
+        Returns:
+            str: The prompt.
+        """
+        user_input = "{\n\t'action':'{{ ACTION }}'\n\t'philosophies':{{ PHILOSOPHIES }}\n}"
+        user_input = user_input.replace("{{ ACTION }}", action)
+        user_input = user_input.replace(
+            "{{ PHILOSOPHIES }}", self.get_philosophies_string(philosophies)
+        )
+        return pc.get_prompt(user_input=user_input)
 
-        philosophy_to_description = {row["name"]: row["description"] for row in self.philosophies}
+    def get_philosophies_string(self, philosophies: Optional[list] = None) -> str:
+        """Format the philosophies for the score_action prompts.
+
+        Args:
+            philosophies (Optional[list], optional): The philosophies to format. Defaults to None (all).
+
+        Returns:
+            str: The philosophies, one per line.
+        """
+        pl = str(self.philosophies if philosophies is None else philosophies)
+        pl = pl.replace("[{'", "[\n\t{'")
+        pl = pl.replace("'}, {'", "'},\n\t{'")
+        pl = pl.replace("'}]", "'}\n\t\t]")
+        return pl
+
+    def get_action_scores(
+        self,
+        action: str,
+        pc: PromptConstructor,
+        force_refresh: bool = False,
+        verbose: bool = False,
+        philosophies: Optional[list] = None,
+        on_score: Optional[Callable[[int, dict], None]] = None,
+    ) -> list:
+        """Score a single action against every philosophy.
+
+        Args:
+            action (str): The action to score.
+            pc (PromptConstructor): The score_action prompt constructor.
+            force_refresh (bool, optional): If true, rerun even if history_key is in history. Defaults to False.
+            verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+            philosophies (Optional[list], optional): Score against these philosophies only; their names
+                are added to the history key. Defaults to None (all).
+            on_score (Optional[Callable[[int, dict], None]], optional): Called with the index and
+                dictionary of every philosophy score, including the action, as soon as it is parsed;
+                see send_receive. Defaults to None.
+
+        Returns:
+            list: One dictionary per philosophy, each including the action.
+        """
+        prompt = self.get_action_score_prompt(action, pc, philosophies)
+        if verbose:
+            self.log_chatbot(prompt, "prompt")
+        if philosophies is None:
+            history_key = self.get_key(pc.prompt_name, pc.prompt_version_number, action)
+        else:
+            philosophy_names = [p["name"] for p in philosophies]
+            history_key = self.get_key(
+                pc.prompt_name, pc.prompt_version_number, action, *philosophy_names
+            )
+        on_item = None
+        if on_score is not None:
+
+            def on_item(index: int, d: Any) -> None:
+                if isinstance(d, dict):
+                    on_score(index, {"action": action, **d})
+
+        out = self.send_receive(prompt, history_key, force_refresh, on_item=on_item)
+        if verbose:
+            self.log_chatbot(out, "response")
+        collect = []
+        for d in self.parse_response(history_key, out):
+            d_out = {"action": action}
+            d_out.update(d)
+            collect.append(d_out)
+        return collect
+
+    def get_scored_cells(self, prompt_version_number: int) -> dict:
+        """Index the (philosophy, action) cells scored by the score_action responses in history.
+
+        Responses are read whatever philosophies their prompt listed, including the partial
+        ones written by incremental scoring. Unparsable responses are skipped.
 
-        def hover_str(row, col):
-            out = f"philosophy: {row.name}<br>"
-            philosophy_description = philosophy_to_description[row.name]
-            out += f"philosophy description: {philosophy_description}<br>"
-            out += f"action: {col}<br>"
-            out += f"reason: {row[col]}"
-            return out
-
-        # Format hover_data with philosophy, action, and reason
-        hover_data = hover_data.apply(
-            lambda row: row.index.map(lambda col: hover_str(row=row, col=col)),
-            axis=1,
+        Args:
+            prompt_version_number (int): The version number of the prompt.
+
+        Returns:
+            dict: Maps each action to a dictionary of philosophy names to their score.
+        """
+        prefix = self.get_key("score_action", prompt_version_number)
+        collect = defaultdict(dict)
+        for history_key, record in self.history.items():
+            if not history_key.startswith(prefix):
+                continue
+            action = history_key[len(prefix) :].split("||")[0]
+            try:
+                scores = self.parse_response(history_key, record["response"])
+            except Exception:
+                continue
+            if not isinstance(scores, list):
+                continue
+            for d in scores:
+                if isinstance(d, dict) and "philosophy" in d:
+                    collect[action][d["philosophy"]] = d
+        return dict(collect)
+
+    def get_incremental_action_scores(
+        self,
+        action: str,
+        pc: PromptConstructor,
+        scored_cells: dict,
+        verbose: bool = False,
+    ) -> list:
+        """Score an action against the philosophies it has not been scored against yet.
+
+        A new action is scored against every philosophy with the usual history key. Otherwise
+        only the missing philosophies are sent. Philosophies the response leaves out stay unscored.
+
+        Args:
+            action (str): The action to score.
+            pc (PromptConstructor): The score_action prompt constructor.
+            scored_cells (dict): The scored cells, from get_scored_cells.
+            verbose (bool, optional): If true, log the prompt and response. Defaults to False.
+
+        Returns:
+            list: One dictionary per scored philosophy, in the order of self.philosophies, each including the action.
+        """
+        action_cells = dict(scored_cells.get(action, {}))
+        missing = [p for p in self.philosophies if p["name"] not in action_cells]
+        if missing:
+            philosophies = None if len(missing) == len(self.philosophies) else missing
+            for d in self.get_action_scores(action, pc, verbose=verbose, philosophies=philosophies):
+                action_cells[d.get("philosophy")] = d
+        collect = []
+        for p in self.philosophies:
+            if p["name"] not in action_cells:
+                continue
+            d_out = {"action": action}
+            d_out.update(action_cells[p["name"]])
+            collect.append(d_out)
+        return collect
+
+    def get_pending_batch_requests(self, prompt_version_number: int) -> list:
+        """List the score_action and action_cluster prompts that are missing from history or stale.
+
+        action_cluster prompts are only listed once cluster_labels are set.
+
+        Args:
+            prompt_version_number (int): The version number of the prompts.
+
+        Returns:
+            list: (history_key, prompt) pairs.
+        """
+        collect = []
+        prompt_builders = [("score_action", self.get_action_score_prompt)]
+        if hasattr(self, "cluster_labels"):
+            prompt_builders.append(("action_cluster", self.get_action_cluster_prompt))
+        for prompt_name, get_prompt in prompt_builders:
+            pc = PromptConstructor(prompt_name=prompt_name, prompt_version_number=prompt_version_number)
+            for action in self.all_actions:
+                history_key = self.get_key(prompt_name, pc.prompt_version_number, action)
+                prompt = get_prompt(action, pc)
+                if self.get_cached_response(history_key, prompt) is None:
+                    collect.append((history_key, prompt))
+        return collect
+
+    def write_batch_file(self, request_file_path: str, prompt_version_number: int) -> int:
+        """Write every pending prompt to a Batch API request file.
+
+        A manifest mapping each request's custom_id to its history key and prompt is
+        written next to it, as request_file_path + ".manifest.json".
+
+        Args:
+            request_file_path (str): Where to write the JSONL file of requests.
+            prompt_version_number (int): The version number of the prompts.
+
+        Returns:
+            int: The number of requests written.
+        """
+        manifest = {}
+        with open(request_file_path, "w") as f:
+            for e, (history_key, prompt) in enumerate(
+                self.get_pending_batch_requests(prompt_version_number)
+            ):
+                custom_id = f"request-{e}"
+                format_kwargs = self.get_format_kwargs(self.get_output_schema(history_key))
+                request = {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": BATCH_ENDPOINT,
+                    "body": self.get_chatbot(history_key).get_request_body(prompt, **format_kwargs),
+                }
+                f.write(json.dumps(request) + "\n")
+                manifest[custom_id] = {"history_key": history_key, "prompt": prompt}
+        with open(f"{request_file_path}.manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+        return len(manifest)
+
+    def submit_batch(self, client, request_file_path: str) -> str:
+        """Submit a request file written by write_batch_file.
+
+        Args:
+            client (OpenAIBatchClient | LocalBatchClient): The batch client.
+            request_file_path (str): The JSONL file of requests.
+
+        Returns:
+            str: The batch id.
+        """
+        return client.submit(request_file_path)
+
+    def ingest_batch_results(self, request_file_path: str, result_file_path: str) -> int:
+        """Store the responses in a Batch API output file in history.
+
+        Responses that fail or cannot be parsed are skipped, and will be sent
+        again by the regular per-action methods.
+
+        Args:
+            request_file_path (str): The JSONL file of requests, next to its manifest.
+            result_file_path (str): The JSONL file of results.
+
+        Returns:
+            int: The number of responses stored.
+        """
+        with open(f"{request_file_path}.manifest.json", "r") as f:
+            manifest = json.load(f)
+        n_stored = 0
+        with self.history_lock:
+            for custom_id, out in read_batch_results(result_file_path).items():
+                request = manifest[custom_id]
+                output_schema = self.get_output_schema(request["history_key"])
+                try:
+                    if output_schema is not None:
+                        out = output_schema.get_response(out)
+                    self.parse_response(request["history_key"], out)
+                except Exception as e:
+                    self.log(f"Skipping unparsable batch response {custom_id}: {e}")
+                    continue
+                self.store_response(
+                    request["history_key"],
+                    request["prompt"],
+                    out,
+                    self.get_request_hash(request["prompt"], request["history_key"]),
+                    write=False,
+                )
+                n_stored += 1
+            self.write_history()
+        return n_stored
+
+    def save_score_store(self, path: str) -> None:
+        """Write the action scores, with the cluster of every action, as Parquet or Arrow.
+
+        Load them back with ScoreStore.load, or memory-map them for analysis with
+        ScoreStore.read_table. Needs pyarrow.
+
+        Args:
+            path (str): The file to write, ending in ".parquet", ".arrow" or ".feather".
+        """
+        action_clusters = getattr(self, "collect_action_clusters", [])
+        self.score_store.set_action_clusters({d["action"]: d["cluster"] for d in action_clusters})
+        self.score_store.save(path)
+
+    def get_score_matrix(self) -> ScoreMatrix:
+        """Get the integer-coded philosophy x action score matrix.
+
+        Philosophies are ranked by number of moral, then undecided, then immoral actions.
+        Actions follow sorted_actions if it is set, and are sorted alphabetically otherwise.
+
+        Returns:
+            ScoreMatrix: The score matrix.
+        """
+        score_matrix = self.score_store.get_score_matrix()
+        return score_matrix.reorder(
+            philosophy_order=score_matrix.get_philosophy_ranking(),
+            actions=getattr(self, "sorted_actions", None),
         )
 
+    def create_scorecard(
+        self,
+        compact: bool = False,
+        include_plotlyjs: Union[bool, str] = True,
+        max_actions_per_page: Optional[int] = None,
+        export_formats: Tuple[str, ...] = (),
+        output_dir: str = "results",
+    ) -> None:
+        """Create a scorecard of the action scores.
+
+        Args:
+            compact (bool, optional): If true, the HTML stores every distinct reason once and builds the
+                hover text in the browser. Defaults to False.
+            include_plotlyjs (Union[bool, str], optional): As in plotly.io.write_html: True to inline plotly.js,
+                "cdn" to load it from the CDN, "directory" to share one plotly.min.js file. Defaults to True.
+            max_actions_per_page (Optional[int], optional): If set, write one page per cluster, split into
+                pages of at most this many actions, and an index page linking them. Defaults to None.
+            export_formats (Tuple[str, ...], optional): Also write the scores as "csv" and/or "parquet". Defaults to ().
+            output_dir (str, optional): The directory to write to. Defaults to "results".
+        """
+        score_matrix = self.get_score_matrix()
+
+        cluster_to_int = {k: e + 1 for e, k in enumerate(self.cluster_to_actions_dict.keys())}
+
+        action_to_cluster = {d["action"]: d["cluster"] for d in self.collect_action_clusters}
+
+        # Save the figure
+        # If the path doesn't exist, create it
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        for export_format in export_formats:
+            self.export_score_matrix(score_matrix, action_to_cluster, output_dir, export_format)
+
+        heatmap_path = os.path.join(output_dir, "action_scores_heatmap.html")
+        if max_actions_per_page is None:
+            fig = self.get_scorecard_figure(score_matrix, cluster_to_int, action_to_cluster, compact)
+            self.write_scorecard_figure(fig, score_matrix, heatmap_path, compact, include_plotlyjs)
+            return
+
+        # One page per cluster, or per part of a cluster
+        links = []
+        for cluster, action_dicts in self.cluster_to_actions_dict.items():
+            cluster_actions = [d["action"] for d in action_dicts]
+            n_parts = -(-len(cluster_actions) // max_actions_per_page)
+            for part in range(n_parts):
+                actions = cluster_actions[
+                    part * max_actions_per_page : (part + 1) * max_actions_per_page
+                ]
+                title = f"Action Scores Heatmap: {cluster_to_int[cluster]:2d} | {cluster}"
+                if n_parts > 1:
+                    title += f" ({part + 1}/{n_parts})"
+                page_matrix = score_matrix.reorder(actions=actions)
+                fig = self.get_scorecard_figure(
+                    page_matrix, cluster_to_int, action_to_cluster, compact, title=title
+                )
+                page_filename = f"action_scores_heatmap_{len(links) + 1:03d}.html"
+                self.write_scorecard_figure(
+                    fig,
+                    page_matrix,
+                    os.path.join(output_dir, page_filename),
+                    compact,
+                    include_plotlyjs,
+                )
+                links.append(f'<li><a href="{page_filename}">{html.escape(title)}</a></li>')
+        with open(heatmap_path, "w") as f:
+            f.write(
+                "<html><head><meta charset='utf-8'><title>Action Scores Heatmap</title></head>"
+                f"<body><h1>Action Scores Heatmap</h1><ul>{''.join(links)}</ul></body></html>"
+            )
+
+    def get_scorecard_figure(
+        self,
+        score_matrix: ScoreMatrix,
+        cluster_to_int: dict,
+        action_to_cluster: dict,
+        compact: bool = False,
+        title: str = "Action Scores Heatmap",
+    ):
+        """Create the scorecard heatmap.
+
+        Args:
+            score_matrix (ScoreMatrix): The scores to plot.
+            cluster_to_int (dict): Cluster labels to cluster numbers.
+            action_to_cluster (dict): Actions to cluster labels.
+            compact (bool, optional): If true, store reason codes in customdata; see create_scorecard. Defaults to False.
+            title (str, optional): The title of the figure. Defaults to "Action Scores Heatmap".
+
+        Returns:
+            go.Figure: The figure.
+        """
+        # Imported here so that runs without a scorecard never load plotly
+        import plotly.graph_objects as go
+
+        actions = [
+            f"{cluster_to_int[action_to_cluster[a]]:2d} | {a}" for a in score_matrix.actions
+        ]
+        philosophies = score_matrix.philosophies.tolist()
+
         # Create the heatmap
-        fig = go.Figure(
-            data=go.Heatmap(
-                z=df_pivot.values,
+        if compact:
+            # Codes into the distinct reasons of this figure, expanded by compact_hover_script
+            reason_codes = np.unique(score_matrix.reason_codes, return_inverse=True)[1]
+            heatmap = go.Heatmap(
+                z=score_matrix.values,
                 x=actions,
                 y=philosophies,
-                hoverinfo="text",
-                hovertext=hover_data.values,
+                customdata=reason_codes.reshape(score_matrix.reason_codes.shape).tolist(),
+                hovertemplate="%{customdata}<extra></extra>",
                 showscale=False,
                 colorscale="Blues_r",
             )
-        )
+            fig = go.Figure(data=heatmap)
+        else:
+            # Hover text with philosophy, action, and reason
+            philosophy_to_description = {
+                row["name"]: row["description"] for row in self.philosophies
+            }
+            hover_data = score_matrix.get_hover_text(
+                philosophy_to_description, self.get_action_alias_notes()
+            )
+            fig = go.Figure(
+                data=go.Heatmap(
+                    z=score_matrix.values,
+                    x=actions,
+                    y=philosophies,
+                    hoverinfo="text",
+                    hovertext=hover_data,
+                    showscale=False,
+                    colorscale="Blues_r",
+                )
+            )
 
-        fig.update_traces(text=hover_data.values, hoverinfo="text")
+            fig.update_traces(text=hover_data, hoverinfo="text")
 
         cluster_to_int_str = (
             "<b><span style='text-decoration:underline;'>Cluster Labels</span></b><br>"
@@ -434,7 +1850,7 @@ class Questioner:
         )
 
         # Update layout for better readability
-        fig.update_layout(title="Action Scores Heatmap", margin_r=275)
+        fig.update_layout(title=title, margin_r=275)
 
         fig.update_yaxes(autorange="reversed")
 
@@ -461,9 +1877,93 @@ class Questioner:
 
         # Adjust layout if necessary
         fig.update_layout(legend_title_text="Category")
+        return fig
 
-        # Save the figure
-        # If the path doesn't exist, create it
-        if not os.path.exists("results"):
-            os.makedirs("results")
-        ol.plot(fig, filename="results/action_scores_heatmap.html", auto_open=False)
+    def get_compact_hover_script(self, score_matrix: ScoreMatrix) -> str:
+        """Get the script that builds the hover text of a compact scorecard in the browser.
+
+        Args:
+            score_matrix (ScoreMatrix): The scores in the figure.
+
+        Returns:
+            str: The script, for plotly.io.write_html's post_script.
+        """
+        philosophies = score_matrix.philosophies.tolist()
+        philosophy_to_description = {row["name"]: row["description"] for row in self.philosophies}
+        notes = self.get_action_alias_notes()
+        lookup = {
+            "philosophies": philosophies,
+            "descriptions": [philosophy_to_description.get(p, "") for p in philosophies],
+            "actions": [a + notes.get(a, "") for a in score_matrix.actions],
+            "reasons": score_matrix.reasons[np.unique(score_matrix.reason_codes)].tolist(),
+        }
+        # Keep "</script>" in a reason from closing the script tag
+        lookup = json.dumps(lookup).replace("</", "<\\/")
+        return (
+            "var gd = document.getElementById('{plot_id}');\n"
+            f"var lookup = {lookup};\n"
+            "var hovertext = gd.data[0].customdata.map(function (row, i) {\n"
+            "    var prefix = 'philosophy: ' + lookup.philosophies[i]\n"
+            "        + '<br>philosophy description: ' + lookup.descriptions[i] + '<br>action: ';\n"
+            "    return row.map(function (code, j) {\n"
+            "        return prefix + lookup.actions[j] + '<br>reason: ' + lookup.reasons[code];\n"
+            "    });\n"
+            "});\n"
+            "Plotly.restyle(gd, {customdata: [hovertext]}, [0]);\n"
+        )
+
+    def write_scorecard_figure(
+        self,
+        fig,
+        score_matrix: ScoreMatrix,
+        path: str,
+        compact: bool = False,
+        include_plotlyjs: Union[bool, str] = True,
+    ) -> None:
+        """Write a scorecard figure to an HTML file.
+
+        Args:
+            fig (go.Figure): The figure, from get_scorecard_figure.
+            score_matrix (ScoreMatrix): The scores in the figure.
+            path (str): The HTML file to write.
+            compact (bool, optional): If true, add the compact hover script. Defaults to False.
+            include_plotlyjs (Union[bool, str], optional): See create_scorecard. Defaults to True.
+        """
+        import plotly.io as pio
+
+        post_script = self.get_compact_hover_script(score_matrix) if compact else None
+        pio.write_html(
+            fig,
+            file=path,
+            include_plotlyjs=include_plotlyjs,
+            post_script=post_script,
+            auto_open=False,
+        )
+
+    def export_score_matrix(
+        self,
+        score_matrix: ScoreMatrix,
+        action_to_cluster: dict,
+        output_dir: str,
+        export_format: str,
+    ) -> None:
+        """Write every scored cell, with its cluster, as action_scores.csv or action_scores.parquet.
+
+        Args:
+            score_matrix (ScoreMatrix): The scores to write.
+            action_to_cluster (dict): Actions to cluster labels.
+            output_dir (str): The directory to write to.
+            export_format (str): "csv" or "parquet". Parquet needs pyarrow.
+
+        Raises:
+            ValueError: Invalid export format.
+        """
+        df = score_matrix.to_long_frame()
+        df.insert(2, "cluster", df["action"].map(action_to_cluster))
+        path = os.path.join(output_dir, f"action_scores.{export_format}")
+        if export_format == "csv":
+            df.to_csv(path, index=False)
+        elif export_format == "parquet":
+            df.to_parquet(path, index=False)
+        else:
+            raise ValueError(f"Invalid export format: {export_format}")
@@ -0,0 +1,186 @@
+import random
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Token buckets for requests per minute and tokens per minute.
+
+    One limiter can be shared by every thread and every Questioner talking to the same
+    account, so that concurrent callers stay under the limits together.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        """Create the limiter with full buckets.
+
+        Args:
+            requests_per_minute (Optional[float], optional): Request limit. Defaults to None (no limit).
+            tokens_per_minute (Optional[float], optional): Token limit. Defaults to None (no limit).
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.lock = threading.Lock()
+        self.available_requests = requests_per_minute or 0.0
+        self.available_tokens = tokens_per_minute or 0.0
+        self.last_refill = time.monotonic()
+        self.paused_until = 0.0
+
+    def refill(self, now: float) -> None:
+        """Refill both buckets for the time elapsed since the last refill.
+
+        Args:
+            now (float): The current time.monotonic().
+        """
+        elapsed_minutes = (now - self.last_refill) / 60
+        if self.requests_per_minute is not None:
+            self.available_requests = min(
+                self.requests_per_minute,
+                self.available_requests + elapsed_minutes * self.requests_per_minute,
+            )
+        if self.tokens_per_minute is not None:
+            self.available_tokens = min(
+                self.tokens_per_minute,
+                self.available_tokens + elapsed_minutes * self.tokens_per_minute,
+            )
+        self.last_refill = now
+
+    def get_wait(self, n_tokens: int, now: float) -> float:
+        """Get the time until a request of n_tokens fits in both buckets.
+
+        Args:
+            n_tokens (int): The number of tokens the request will use.
+            now (float): The current time.monotonic().
+
+        Returns:
+            float: The time to wait, in seconds.
+        """
+        wait = max(0.0, self.paused_until - now)
+        if self.requests_per_minute is not None and self.available_requests < 1:
+            missing = 1 - self.available_requests
+            wait = max(wait, 60 * missing / self.requests_per_minute)
+        if self.tokens_per_minute is not None:
+            # A request larger than the bucket only has to wait for a full bucket
+            n_tokens = min(n_tokens, self.tokens_per_minute)
+            if self.available_tokens < n_tokens:
+                missing = n_tokens - self.available_tokens
+                wait = max(wait, 60 * missing / self.tokens_per_minute)
+        return wait
+
+    def acquire(self, n_tokens: int = 0) -> None:
+        """Block until a request of n_tokens can be sent, then take it from the buckets.
+
+        Args:
+            n_tokens (int, optional): The number of tokens the request will use. Defaults to 0.
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.refill(now)
+                wait = self.get_wait(n_tokens, now)
+                if wait <= 0:
+                    if self.requests_per_minute is not None:
+                        self.available_requests -= 1
+                    if self.tokens_per_minute is not None:
+                        self.available_tokens -= min(n_tokens, self.tokens_per_minute)
+                    return
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for a while, e.g. after a rate limit error.
+
+        Args:
+            seconds (float): The time to pause for.
+        """
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimate the number of tokens in a text, at four characters per token.
+
+    Args:
+        text (str): The text.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return len(text) // 4 + 1
+
+
+def get_backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter.
+
+    Args:
+        attempt (int): The number of failed attempts so far, starting at 1.
+        base (float, optional): The delay scale, in seconds. Defaults to 1.0.
+        cap (float, optional): The maximum delay, in seconds. Defaults to 60.0.
+
+    Returns:
+        float: The time to wait, in seconds.
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Check if an error comes from the network or the API rather than the response.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        bool: True for rate limits, timeouts, connection errors and server errors.
+    """
+    import openai
+
+    return isinstance(
+        error,
+        (
+            ConnectionError,
+            TimeoutError,
+            openai.RateLimitError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+        ),
+    )
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Check if an error is a rate limit response of the API.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        bool: True for rate limits.
+    """
+    import openai
+
+    return isinstance(error, openai.RateLimitError)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the time the API asks us to wait from the headers of an error response.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        Optional[float]: The time to wait, in seconds, or None if the API did not say.
+    """
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
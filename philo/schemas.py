@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+from philo.utils import get_repo_root
+
+# The Python types of the JSON schema types
+JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "array": list,
+    "object": dict,
+    "null": type(None),
+}
+
+# Output schemas by prompt name, None for prompt families without one
+output_schemas = {}
+output_schemas_lock = threading.Lock()
+
+
+def compile_validator(schema: dict) -> Callable[[Any, str], None]:
+    """Compile a JSON schema into a function checking a value against it.
+
+    Supports the subset of JSON schema allowed by strict structured outputs: type, enum,
+    properties, required, additionalProperties and items. The schema is walked once, here,
+    so validating a value only runs isinstance checks.
+
+    Args:
+        schema (dict): The JSON schema.
+
+    Returns:
+        Callable[[Any, str], None]: Takes a value and its path, for error messages, and raises
+            ValueError if the value does not match the schema.
+    """
+    names = schema.get("type")
+    names = [names] if isinstance(names, str) else names
+    types = tuple(JSON_TYPES[name] for name in names) if names else None
+    # True passes isinstance(value, int), so booleans are rejected unless the schema allows them
+    rejects_bool = bool(names) and "boolean" not in names
+    enum = schema.get("enum")
+    properties = {
+        key: compile_validator(value) for key, value in schema.get("properties", {}).items()
+    }
+    required = schema.get("required", [])
+    closed = schema.get("additionalProperties", True) is False
+    items = compile_validator(schema["items"]) if "items" in schema else None
+
+    def validate(value: Any, path: str) -> None:
+        if types is not None and (
+            not isinstance(value, types) or (rejects_bool and isinstance(value, bool))
+        ):
+            raise ValueError(f"{path} should be of type {' or '.join(names)}: {value!r}")
+        if enum is not None and value not in enum:
+            raise ValueError(f"{path} should be one of {enum}: {value!r}")
+        if isinstance(value, dict):
+            for key in required:
+                if key not in value:
+                    raise ValueError(f"{path} is missing {key!r}.")
+            for key, item in value.items():
+                if key in properties:
+                    properties[key](item, f"{path}.{key}")
+                elif closed:
+                    raise ValueError(f"{path} has an unexpected key {key!r}.")
+        elif items is not None and isinstance(value, list):
+            for i, item in enumerate(value):
+                items(item, f"{path}[{i}]")
+
+    return validate
+
+
+class OutputSchema:
+    """The JSON schema of the responses of a prompt family, from its schema.json file.
+
+    Strict structured outputs need an object at the root, so the parsed response sits under
+    its "response" key, after a "scratchpad" for the prompts that ask for one. Dictionaries
+    keyed by numbers cannot be described strictly either, so the schema gives them as a list of
+    key and value objects, named by "dictionary", which parse turns back into a dictionary.
+    """
+
+    def __init__(self, name: str, schema: dict, dictionary: Optional[Dict[str, str]] = None):
+        """Create the output schema.
+
+        Args:
+            name (str): The prompt name.
+            schema (dict): The JSON schema of the whole structured response.
+            dictionary (Optional[Dict[str, str]], optional): The "key" and "value" properties of the
+                list items if the response is a dictionary. Defaults to None (not a dictionary).
+        """
+        self.name = name
+        self.schema = schema
+        self.dictionary = dictionary
+        self.validator = compile_validator(schema)
+
+    def get_response_format(self) -> dict:
+        """Get the response_format of a chat completion request constrained to the schema.
+
+        Returns:
+            dict: The response format.
+        """
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": self.name, "strict": True, "schema": self.schema},
+        }
+
+    def parse(self, text: str) -> Any:
+        """Parse and validate a structured response.
+
+        Unlike parse_structured_output, nothing is cleaned up or evaluated as a python literal:
+        the response is valid JSON matching the schema, or it is rejected.
+
+        Args:
+            text (str): The structured response.
+
+        Raises:
+            ValueError: The response is not JSON or does not match the schema.
+
+        Returns:
+            Any: The response, as the free text prompts would parse to.
+        """
+        # json.JSONDecodeError is a ValueError
+        value = json.loads(text)
+        self.validator(value, self.name)
+        response = value["response"]
+        if self.dictionary is not None:
+            key, item = self.dictionary["key"], self.dictionary["value"]
+            response = {element[key]: element[item] for element in response}
+        return response
+
+    def get_response(self, text: str) -> str:
+        """Turn a structured response into the JSON the history stores.
+
+        The scratchpad is dropped, so that the stored response parses to the same objects as a
+        free text response, on parse_structured_output's fast path.
+
+        Args:
+            text (str): The structured response.
+
+        Raises:
+            ValueError: The response is not JSON or does not match the schema.
+
+        Returns:
+            str: The parsed response, as JSON.
+        """
+        return json.dumps(self.parse(text))
+
+    def to_structured(self, response: Any) -> str:
+        """Write a parsed response as a schema-constrained model would, e.g. for FakeChat.
+
+        Args:
+            response (Any): The response, as the free text prompts would parse to.
+
+        Returns:
+            str: The structured response.
+        """
+        if self.dictionary is not None:
+            key, item = self.dictionary["key"], self.dictionary["value"]
+            response = [{key: int(k), item: v} for k, v in response.items()]
+        value = {}
+        for name in self.schema["properties"]:
+            value[name] = response if name == "response" else "# Thinking it through."
+        return json.dumps(value)
+
+
+def get_output_schema(prompt_name: str) -> Optional[OutputSchema]:
+    """Get the output schema of a prompt family, loading it on first use.
+
+    Args:
+        prompt_name (str): The prompt name.
+
+    Returns:
+        Optional[OutputSchema]: The schema, or None if the family has no schema.json file.
+    """
+    if prompt_name in output_schemas:
+        return output_schemas[prompt_name]
+    path = os.path.join(get_repo_root(), "philo", "prompts", prompt_name, "schema.json")
+    output_schema = None
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            spec = json.load(f)
+        output_schema = OutputSchema(spec["name"], spec["schema"], spec.get("dictionary"))
+    with output_schemas_lock:
+        output_schemas[prompt_name] = output_schema
+    return output_schema
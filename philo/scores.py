@@ -0,0 +1,615 @@
+import json
+import sys
+from array import array
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+MORALITY_TO_VALUE = {"moral": 1, "undecided": 0, "immoral": -1}
+VALUE_TO_MORALITY = {v: k for k, v in MORALITY_TO_VALUE.items()}
+# The value of a (philosophy, action) cell that was never scored
+MISSING_VALUE = -10
+# The ID of a string field a score record does not have
+ABSENT = -1
+# The fields of a score record that are stored as columns
+SCORE_FIELDS = ("action", "philosophy", "morality", "reason")
+
+
+class ScoreMatrix:
+    """The philosophy x action morality matrix, integer coded.
+
+    values[i, j] is the morality of actions[j] with respect to philosophies[i]
+    (1 moral, 0 undecided, -1 immoral, MISSING_VALUE if not scored), and
+    reasons[reason_codes[i, j]] is the reason given for it ("" if not scored).
+    """
+
+    def __init__(
+        self,
+        philosophies: np.ndarray,
+        actions: np.ndarray,
+        values: np.ndarray,
+        reason_codes: np.ndarray,
+        reasons: np.ndarray,
+    ):
+        self.philosophies = philosophies
+        self.actions = actions
+        self.values = values
+        self.reason_codes = reason_codes
+        self.reasons = reasons
+
+    def get_counts(self) -> np.ndarray:
+        """Count the moral, undecided and immoral actions of every philosophy.
+
+        Returns:
+            np.ndarray: An (n_philosophies, 3) array of moral, undecided and immoral counts.
+        """
+        return np.stack(
+            [(self.values == value).sum(axis=1) for value in [1, 0, -1]],
+            axis=1,
+        )
+
+    def get_philosophy_ranking(self) -> np.ndarray:
+        """Rank philosophies by number of moral, then undecided, then immoral actions.
+
+        Returns:
+            np.ndarray: Philosophy indices, from the highest ranked to the lowest.
+        """
+        counts = self.get_counts()
+        # lexsort sorts by the last key first; negate for descending order
+        return np.lexsort((-counts[:, 2], -counts[:, 1], -counts[:, 0]))
+
+    def reorder(
+        self,
+        philosophy_order: Optional[np.ndarray] = None,
+        actions: Optional[List[str]] = None,
+    ) -> "ScoreMatrix":
+        """Reorder the rows and columns of the matrix.
+
+        Args:
+            philosophy_order (Optional[np.ndarray], optional): Philosophy indices, in the new order. Defaults to None (keep).
+            actions (Optional[List[str]], optional): Actions, in the new order. Defaults to None (keep).
+
+        Returns:
+            ScoreMatrix: The reordered matrix.
+        """
+        rows = np.arange(len(self.philosophies)) if philosophy_order is None else philosophy_order
+        columns = np.arange(len(self.actions))
+        if actions is not None:
+            import pandas as pd
+
+            action_to_index = pd.Index(self.actions)
+            columns = action_to_index.get_indexer(actions)
+            if (columns < 0).any():
+                raise ValueError("Some actions are not in the score matrix.")
+        return ScoreMatrix(
+            philosophies=self.philosophies[rows],
+            actions=self.actions[columns],
+            values=self.values[np.ix_(rows, columns)],
+            reason_codes=self.reason_codes[np.ix_(rows, columns)],
+            reasons=self.reasons,
+        )
+
+    def get_hover_text(
+        self,
+        philosophy_to_description: dict,
+        action_to_note: Optional[dict] = None,
+    ) -> np.ndarray:
+        """Build the heatmap hover text of every cell.
+
+        Args:
+            philosophy_to_description (dict): Philosophy names to descriptions.
+            action_to_note (Optional[dict], optional): Text to show after some actions, e.g. the
+                actions merged into them. Defaults to None.
+
+        Returns:
+            np.ndarray: An (n_philosophies, n_actions) array of strings.
+        """
+        descriptions = np.array(
+            [philosophy_to_description.get(p, "") for p in self.philosophies], dtype=object
+        )
+        row_text = "philosophy: " + self.philosophies + "<br>philosophy description: " + descriptions
+        actions = self.actions
+        if action_to_note:
+            actions = actions + np.array([action_to_note.get(a, "") for a in actions], dtype=object)
+        column_text = "<br>action: " + actions + "<br>reason: "
+        # Object arrays broadcast str concatenation without a Python-level loop per cell
+        return row_text[:, None] + column_text[None, :] + self.reasons[self.reason_codes]
+
+    def to_frame(self) -> "pd.DataFrame":
+        """Get the values as a DataFrame with philosophies as index and actions as columns.
+
+        Returns:
+            pd.DataFrame: The values.
+        """
+        import pandas as pd
+
+        return pd.DataFrame(
+            self.values,
+            index=pd.Index(self.philosophies, name="philosophy"),
+            columns=pd.Index(self.actions, name="action"),
+        )
+
+    def to_long_frame(self) -> "pd.DataFrame":
+        """Get one row per scored cell, with its philosophy, action, value and reason.
+
+        Returns:
+            pd.DataFrame: The scored cells.
+        """
+        import pandas as pd
+
+        rows, columns = np.nonzero(self.values != MISSING_VALUE)
+        return pd.DataFrame(
+            {
+                "philosophy": self.philosophies[rows],
+                "action": self.actions[columns],
+                "morality_value": self.values[rows, columns],
+                "reason": self.reasons[self.reason_codes[rows, columns]],
+            }
+        )
+
+
+def get_majority_scores(candidates: List[list]) -> Tuple[list, List[float]]:
+    """Vote on the morality of every philosophy across candidate score_action responses.
+
+    Every philosophy gets the label most candidates gave it, ties going to the label given
+    first, and the reason of the first candidate that gave that label.
+
+    Args:
+        candidates (List[list]): Parsed score_action responses, lists of dictionaries with
+            "philosophy", "morality" and "reason" keys.
+
+    Returns:
+        Tuple[list, List[float]]: The voted scores, in the order the philosophies first appear,
+            and the share of the votes the winning label got, per philosophy.
+    """
+    votes = {}
+    for candidate in candidates:
+        for d in candidate:
+            if isinstance(d, dict) and isinstance(d.get("philosophy"), str):
+                votes.setdefault(d["philosophy"], []).append(d)
+    scores, agreement = [], []
+    for philosophy_votes in votes.values():
+        labels = [d.get("morality") for d in philosophy_votes]
+        # max keeps the first of the most common labels
+        label = max(labels, key=labels.count)
+        scores.append(next(d for d in philosophy_votes if d.get("morality") == label))
+        agreement.append(labels.count(label) / len(labels))
+    return scores, agreement
+
+
+class StringTable:
+    """Interned strings, each stored once and referred to by its integer ID."""
+
+    __slots__ = ("strings", "ids")
+
+    def __init__(self, strings: Iterable[str] = ()):
+        """Create the table.
+
+        Args:
+            strings (Iterable[str], optional): Distinct strings, given IDs in order. Defaults to ().
+        """
+        self.strings = []
+        self.ids = {}
+        for string in strings:
+            self.add(string)
+
+    def add(self, string: str) -> int:
+        """Get the ID of a string, adding it if it is new.
+
+        Args:
+            string (str): The string.
+
+        Returns:
+            int: The ID.
+        """
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string = sys.intern(string)
+            string_id = len(self.strings)
+            self.strings.append(string)
+            self.ids[string] = string_id
+        return string_id
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def __getitem__(self, string_id: int) -> str:
+        return self.strings[string_id]
+
+
+class ScoreStore:
+    """The action scores, stored by column.
+
+    Actions, philosophies, reasons and clusters are interned in string tables, and every row
+    holds their integer IDs and an int8 morality value, instead of a dictionary repeating the
+    strings. Rows are kept in the order they were added, duplicates included, so that the
+    list of dictionaries they came from can be rebuilt exactly with to_dicts.
+    """
+
+    def __init__(self):
+        self.actions = StringTable()
+        self.philosophies = StringTable()
+        self.reasons = StringTable()
+        self.clusters = StringTable()
+        self.action_ids = array("i")
+        self.philosophy_ids = array("i")
+        # MORALITY_TO_VALUE values, MISSING_VALUE if the label is missing or unknown
+        self.moralities = array("b")
+        self.reason_ids = array("i")
+        # The cluster ID of every action ID, ABSENT if unknown
+        self.action_cluster_ids = array("i")
+        # The fields of rows that do not fit the columns (other keys, values that are not
+        # strings, unknown morality labels), by row
+        self.extras = {}
+
+    @classmethod
+    def from_records(cls, action_scores: Iterable[dict]) -> "ScoreStore":
+        """Build the store from action scores.
+
+        Args:
+            action_scores (Iterable[dict]): Dictionaries with "action", "philosophy", "morality" and "reason" keys.
+
+        Returns:
+            ScoreStore: The store.
+        """
+        store = cls()
+        store.extend(action_scores)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.action_ids)
+
+    def add(self, record: dict) -> None:
+        """Add an action score.
+
+        Args:
+            record (dict): A dictionary with "action", "philosophy", "morality" and "reason" keys.
+        """
+        extras = {k: v for k, v in record.items() if k not in SCORE_FIELDS}
+
+        def get_id(field: str, table: StringTable) -> int:
+            value = record.get(field)
+            if isinstance(value, str):
+                return table.add(value)
+            if field in record:
+                extras[field] = value
+            return ABSENT
+
+        self.action_ids.append(get_id("action", self.actions))
+        self.philosophy_ids.append(get_id("philosophy", self.philosophies))
+        self.reason_ids.append(get_id("reason", self.reasons))
+        morality = record.get("morality")
+        value = MORALITY_TO_VALUE.get(morality) if isinstance(morality, str) else None
+        if value is None:
+            value = MISSING_VALUE
+            if "morality" in record:
+                extras["morality"] = morality
+        self.moralities.append(value)
+        if extras:
+            self.extras[len(self) - 1] = extras
+
+    def extend(self, action_scores: Iterable[dict]) -> None:
+        """Add action scores.
+
+        Args:
+            action_scores (Iterable[dict]): Dictionaries with "action", "philosophy", "morality" and "reason" keys.
+        """
+        for record in action_scores:
+            self.add(record)
+
+    def get_string(self, table: StringTable, string_id: int) -> Optional[str]:
+        """Look an ID up in a string table.
+
+        Args:
+            table (StringTable): The table.
+            string_id (int): The ID.
+
+        Returns:
+            Optional[str]: The string, None if the ID is ABSENT.
+        """
+        return None if string_id == ABSENT else table[string_id]
+
+    def get_dict(self, row: int) -> dict:
+        """Get a row as the dictionary it was added from.
+
+        Args:
+            row (int): The row.
+
+        Returns:
+            dict: The action score.
+        """
+        out = {}
+        if self.action_ids[row] != ABSENT:
+            out["action"] = self.actions[self.action_ids[row]]
+        if self.philosophy_ids[row] != ABSENT:
+            out["philosophy"] = self.philosophies[self.philosophy_ids[row]]
+        if self.moralities[row] != MISSING_VALUE:
+            out["morality"] = VALUE_TO_MORALITY[self.moralities[row]]
+        if self.reason_ids[row] != ABSENT:
+            out["reason"] = self.reasons[self.reason_ids[row]]
+        out.update(self.extras.get(row, {}))
+        return out
+
+    def to_dicts(self) -> List[dict]:
+        """Get the rows as the list of dictionaries they were added from.
+
+        The list and its dictionaries are new on every call, so modifying them does not change
+        the store; add rows with add or extend.
+
+        Returns:
+            List[dict]: The action scores.
+        """
+        return [self.get_dict(row) for row in range(len(self))]
+
+    def set_action_clusters(self, action_to_cluster: dict) -> None:
+        """Set the clusters of the actions.
+
+        Args:
+            action_to_cluster (dict): Actions to cluster labels.
+        """
+        self.action_cluster_ids = array("i", [ABSENT] * len(self.actions))
+        for action, cluster in action_to_cluster.items():
+            action_id = self.actions.ids.get(action)
+            if action_id is not None:
+                self.action_cluster_ids[action_id] = self.clusters.add(cluster)
+
+    def get_score_matrix(self) -> ScoreMatrix:
+        """Build the score matrix.
+
+        Philosophies and actions are sorted alphabetically, and rows without an action or a
+        philosophy are left out. If a cell is scored more than once, its value is the rounded
+        mean and its reasons are joined with ", ".
+
+        Returns:
+            ScoreMatrix: The matrix.
+        """
+        action_ids = np.frombuffer(self.action_ids, dtype=np.intc).astype(np.int64)
+        philosophy_ids = np.frombuffer(self.philosophy_ids, dtype=np.intc).astype(np.int64)
+        moralities = np.frombuffer(self.moralities, dtype=np.int8)
+        reasons = list(self.reasons.strings)
+        reason_ids = np.frombuffer(self.reason_ids, dtype=np.intc).astype(np.int64)
+        # Reasons that are not strings are shown as strings
+        for row, extras in self.extras.items():
+            if extras.get("reason") is not None:
+                reason_ids[row] = len(reasons)
+                reasons.append(str(extras["reason"]))
+        valid = (action_ids != ABSENT) & (philosophy_ids != ABSENT)
+        action_ids, philosophy_ids = action_ids[valid], philosophy_ids[valid]
+        moralities, reason_ids = moralities[valid], reason_ids[valid]
+
+        def get_sorted(table: StringTable, ids: np.ndarray):
+            # The strings used, sorted, and the index of every ID in them
+            used = np.unique(ids)
+            strings = np.array([table[i] for i in used], dtype=object)
+            order = np.argsort(strings, kind="stable")
+            index = np.zeros(len(table), dtype=np.int64)
+            index[used[order]] = np.arange(len(used))
+            return strings[order], index
+
+        philosophies, philosophy_index = get_sorted(self.philosophies, philosophy_ids)
+        actions, action_index = get_sorted(self.actions, action_ids)
+        n_cells = len(philosophies) * len(actions)
+        cells = philosophy_index[philosophy_ids] * len(actions) + action_index[action_ids]
+
+        # Mean morality per cell, ignoring unknown labels
+        scored = moralities != MISSING_VALUE
+        totals = np.bincount(cells[scored], weights=moralities[scored], minlength=n_cells)
+        counts = np.bincount(cells[scored], minlength=n_cells)
+        values = np.full(n_cells, MISSING_VALUE, dtype=np.int8)
+        has_value = counts > 0
+        values[has_value] = np.round(totals[has_value] / counts[has_value])
+
+        # Reasons, joined for the rare cells that were scored more than once
+        duplicated = np.bincount(cells, minlength=n_cells)[cells] > 1
+        joined = {}
+        for cell, reason_id in zip(cells[duplicated].tolist(), reason_ids[duplicated].tolist()):
+            joined.setdefault(cell, []).append("" if reason_id == ABSENT else reasons[reason_id])
+        reason_codes = np.zeros(n_cells, dtype=np.int32)
+        reason_codes[cells[~duplicated]] = reason_ids[~duplicated]
+        for cell, cell_reasons in joined.items():
+            reason_codes[cell] = len(reasons)
+            reasons.append(", ".join(cell_reasons))
+        # The last code is the empty reason of unscored cells, and of rows without a reason
+        reasons.append("")
+        is_empty = np.ones(n_cells, dtype=bool)
+        is_empty[cells] = False
+        is_empty[cells[~duplicated][reason_ids[~duplicated] == ABSENT]] = True
+        reason_codes[is_empty] = len(reasons) - 1
+
+        return ScoreMatrix(
+            philosophies=philosophies,
+            actions=actions,
+            values=values.reshape(len(philosophies), len(actions)),
+            reason_codes=reason_codes.reshape(len(philosophies), len(actions)),
+            reasons=np.array(reasons, dtype=object),
+        )
+
+    def to_columns(self) -> dict:
+        """Get the store as a JSON-serializable dictionary of columns, e.g. for checkpoints.
+
+        Returns:
+            dict: The string tables and the ID columns.
+        """
+        return {
+            "actions": self.actions.strings,
+            "philosophies": self.philosophies.strings,
+            "reasons": self.reasons.strings,
+            "clusters": self.clusters.strings,
+            "action_ids": self.action_ids.tolist(),
+            "philosophy_ids": self.philosophy_ids.tolist(),
+            "moralities": self.moralities.tolist(),
+            "reason_ids": self.reason_ids.tolist(),
+            "action_cluster_ids": self.action_cluster_ids.tolist(),
+            "extras": [[row, extras] for row, extras in self.extras.items()],
+        }
+
+    @classmethod
+    def from_columns(cls, columns: dict) -> "ScoreStore":
+        """Rebuild a store from to_columns.
+
+        Args:
+            columns (dict): The output of to_columns.
+
+        Returns:
+            ScoreStore: The store.
+        """
+        store = cls()
+        store.actions = StringTable(columns["actions"])
+        store.philosophies = StringTable(columns["philosophies"])
+        store.reasons = StringTable(columns["reasons"])
+        store.clusters = StringTable(columns["clusters"])
+        store.action_ids = array("i", columns["action_ids"])
+        store.philosophy_ids = array("i", columns["philosophy_ids"])
+        store.moralities = array("b", columns["moralities"])
+        store.reason_ids = array("i", columns["reason_ids"])
+        store.action_cluster_ids = array("i", columns["action_cluster_ids"])
+        store.extras = {row: extras for row, extras in columns["extras"]}
+        return store
+
+    def to_arrow(self) -> "pa.Table":
+        """Get the store as an Arrow table with one row per action score.
+
+        The action, philosophy, reason and cluster columns are dictionary encoded, so every
+        string is stored once. Needs pyarrow.
+
+        Returns:
+            pa.Table: The table, with a null where a row has no value.
+        """
+        import pyarrow as pa
+
+        def get_column(ids: np.ndarray, table: StringTable) -> pa.DictionaryArray:
+            indices = pa.array(ids, mask=ids == ABSENT, type=pa.int32())
+            dictionary = pa.array(table.strings, type=pa.string())
+            return pa.DictionaryArray.from_arrays(indices, dictionary)
+
+        action_ids = np.frombuffer(self.action_ids, dtype=np.intc)
+        action_cluster_ids = np.full(len(self.actions), ABSENT, dtype=np.intc)
+        action_cluster_ids[: len(self.action_cluster_ids)] = self.action_cluster_ids
+        cluster_ids = np.where(action_ids == ABSENT, ABSENT, action_cluster_ids[action_ids])
+        philosophy_ids = np.frombuffer(self.philosophy_ids, dtype=np.intc)
+        reason_ids = np.frombuffer(self.reason_ids, dtype=np.intc)
+        moralities = np.frombuffer(self.moralities, dtype=np.int8)
+        extras = [None] * len(self)
+        for row, row_extras in self.extras.items():
+            extras[row] = json.dumps(row_extras)
+        return pa.table(
+            {
+                "action": get_column(action_ids, self.actions),
+                "philosophy": get_column(philosophy_ids, self.philosophies),
+                "morality": pa.array(moralities, mask=moralities == MISSING_VALUE, type=pa.int8()),
+                "reason": get_column(reason_ids, self.reasons),
+                "cluster": get_column(cluster_ids, self.clusters),
+                "extras": pa.array(extras, type=pa.string()),
+            }
+        )
+
+    @classmethod
+    def from_arrow(cls, table: "pa.Table") -> "ScoreStore":
+        """Rebuild a store from to_arrow.
+
+        Args:
+            table (pa.Table): The table.
+
+        Returns:
+            ScoreStore: The store.
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        store = cls()
+
+        def get_ids(name: str) -> tuple:
+            column = table.column(name)
+            if not pa.types.is_dictionary(column.type):
+                column = column.dictionary_encode()
+            # Give every chunk the same dictionary, then make a single chunk
+            column = column.unify_dictionaries().combine_chunks() if column.num_chunks else None
+            if column is None:
+                return np.zeros(0, dtype=np.intc), StringTable()
+            ids = pc.fill_null(column.indices, ABSENT).to_numpy().astype(np.intc)
+            return ids, StringTable(column.dictionary.to_pylist())
+
+        action_ids, store.actions = get_ids("action")
+        philosophy_ids, store.philosophies = get_ids("philosophy")
+        reason_ids, store.reasons = get_ids("reason")
+        cluster_ids, store.clusters = get_ids("cluster")
+        store.action_ids = array("i", action_ids.tobytes())
+        store.philosophy_ids = array("i", philosophy_ids.tobytes())
+        store.reason_ids = array("i", reason_ids.tobytes())
+        moralities = pc.fill_null(table.column("morality"), MISSING_VALUE).to_numpy()
+        store.moralities = array("b", moralities.astype(np.int8).tobytes())
+        action_cluster_ids = np.full(len(store.actions), ABSENT, dtype=np.intc)
+        has_action = action_ids != ABSENT
+        action_cluster_ids[action_ids[has_action]] = cluster_ids[has_action]
+        store.action_cluster_ids = array("i", action_cluster_ids.tobytes())
+        for row, row_extras in enumerate(table.column("extras").to_pylist()):
+            if row_extras is not None:
+                store.extras[row] = json.loads(row_extras)
+        return store
+
+    def save(self, path: str) -> None:
+        """Write the store as Parquet (.parquet) or as an Arrow IPC file (.arrow or .feather).
+
+        Needs pyarrow.
+
+        Args:
+            path (str): The file to write.
+
+        Raises:
+            ValueError: Unknown file extension.
+        """
+        import pyarrow as pa
+
+        table = self.to_arrow()
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, path)
+        elif path.endswith((".arrow", ".feather")):
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            raise ValueError(f"Unknown score store file extension: {path}")
+
+    @staticmethod
+    def read_table(path: str, memory_map: bool = True) -> "pa.Table":
+        """Read a file written by save as an Arrow table, e.g. to analyze it with pyarrow or pandas.
+
+        Arrow IPC files are memory-mapped without copying, so even large files open at once.
+
+        Args:
+            path (str): The file.
+            memory_map (bool, optional): If true, memory-map the file instead of reading it. Defaults to True.
+
+        Raises:
+            ValueError: Unknown file extension.
+
+        Returns:
+            pa.Table: The table, as written by to_arrow.
+        """
+        import pyarrow as pa
+
+        if path.endswith(".parquet"):
+            import pyarrow.parquet as pq
+
+            return pq.read_table(path, memory_map=memory_map)
+        if path.endswith((".arrow", ".feather")):
+            source = pa.memory_map(path) if memory_map else pa.OSFile(path)
+            return pa.ipc.open_file(source).read_all()
+        raise ValueError(f"Unknown score store file extension: {path}")
+
+    @classmethod
+    def load(cls, path: str, memory_map: bool = True) -> "ScoreStore":
+        """Load a store written by save.
+
+        Args:
+            path (str): The file.
+            memory_map (bool, optional): If true, memory-map the file instead of reading it. Defaults to True.
+
+        Returns:
+            ScoreStore: The store.
+        """
+        return cls.from_arrow(cls.read_table(path, memory_map=memory_map))
@@ -0,0 +1,177 @@
+from typing import Any, List
+from philo.utils import parse_structured_output
+
+# The bracket that closes every bracket
+CLOSING = {"[": "]", "{": "}", "(": ")"}
+
+
+def is_word(c: str) -> bool:
+    """Whether a character is a word character, as \\w matches."""
+    return c.isalnum() or c == "_"
+
+
+class IncrementalParser:
+    """Parses a structured response while it streams in, one top-level item at a time.
+
+    Accepts what parse_structured_output accepts: a python literal or JSON list or
+    dictionary, optionally after a "#" scratchpad and inside code fences. Every item of
+    the list, or every key and value of the dictionary, is parsed as soon as it is
+    complete, and the response is known to be unparsable as soon as an item fails to
+    parse or text appears where no literal can follow, well before the response ends.
+    """
+
+    def __init__(self):
+        # The text received so far
+        self.text = ""
+        # The index of the next character to scan
+        self.position = 0
+        # The brackets open at the scan position, the outermost first
+        self.stack = []
+        # The quote of the string the scan position is in, if any
+        self.quote = None
+        self.escaped = False
+        # True while skipping a comment, or a scratchpad or fence line, up to the newline
+        self.skipping = False
+        self.at_line_start = True
+        # Where the current top-level item starts, once the outermost bracket is open
+        self.item_start = None
+        # The outermost bracket, "[" or "{", and whether it was closed
+        self.outer = None
+        self.closed = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """Add text and parse the items it completes.
+
+        Args:
+            chunk (str): The next part of the response.
+
+        Raises:
+            ValueError: The response can no longer be parsed.
+
+        Returns:
+            List[Any]: The items completed by the chunk: list elements, or (key, value) tuples
+                of a dictionary.
+        """
+        self.text += chunk
+        return self.scan(final=False)
+
+    def close(self) -> List[Any]:
+        """End the response.
+
+        Raises:
+            ValueError: The response ended before its list or dictionary was closed.
+
+        Returns:
+            List[Any]: The items completed by the end of the response.
+        """
+        items = self.scan(final=True)
+        if not self.closed:
+            raise ValueError("The response ended before its list or dictionary was closed.")
+        return items
+
+    def scan(self, final: bool) -> List[Any]:
+        """Scan the text received since the last call.
+
+        Args:
+            final (bool): True if no more text will be received.
+
+        Raises:
+            ValueError: The response can no longer be parsed.
+
+        Returns:
+            List[Any]: The items completed.
+        """
+        items = []
+        text = self.text
+        while self.position < len(text):
+            i = self.position
+            c = text[i]
+            if self.skipping:
+                if c == "\n":
+                    self.skipping = False
+                    self.at_line_start = True
+                self.position += 1
+                continue
+            if self.quote is not None:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == self.quote:
+                    if c == "'" and i > 0 and is_word(text[i - 1]):
+                        # An apostrophe ("it's") if a letter follows
+                        if i + 1 == len(text) and not final:
+                            break
+                        if i + 1 < len(text) and is_word(text[i + 1]):
+                            self.position += 1
+                            continue
+                    self.quote = None
+                self.position += 1
+                continue
+            if self.at_line_start and c in "#`":
+                # A scratchpad or fence line, skipped like clean_structured_output does
+                self.skipping = True
+                self.position += 1
+                continue
+            if c == "`":
+                # Wait to see whether it is a code fence
+                if len(text) - i < 3 and not final:
+                    break
+                if text.startswith("```", i):
+                    self.position += 3
+                    continue
+            self.at_line_start = c == "\n"
+            self.position += 1
+            if c.isspace():
+                continue
+            if c == "#":
+                self.skipping = True
+            elif self.closed:
+                raise ValueError(f"Unexpected text after the end of the response: {c!r}")
+            elif self.outer is None:
+                if c not in "[{":
+                    raise ValueError(f"The response does not start with a list or a dict: {c!r}")
+                self.outer = c
+                self.stack.append(c)
+                self.item_start = i + 1
+            elif c in "\"'":
+                self.quote = c
+            elif c in CLOSING:
+                self.stack.append(c)
+            elif c in "]})":
+                if CLOSING[self.stack.pop()] != c:
+                    raise ValueError(f"Unexpected {c!r} in the response.")
+                if len(self.stack) == 1:
+                    # A list element or a dictionary value is complete
+                    items += self.parse_item(i + 1)
+                elif not self.stack:
+                    items += self.parse_item(i)
+                    self.closed = True
+            elif c == "," and len(self.stack) == 1:
+                items += self.parse_item(i)
+                self.item_start = i + 1
+        return items
+
+    def parse_item(self, end: int) -> List[Any]:
+        """Parse the top-level item ending at end.
+
+        Args:
+            end (int): The index of the end of the item.
+
+        Raises:
+            ValueError: The item cannot be parsed.
+
+        Returns:
+            List[Any]: The item, or nothing if only whitespace and comments were left.
+        """
+        item_text = self.text[self.item_start : end]
+        self.item_start = end
+        try:
+            if self.outer == "[":
+                parsed = parse_structured_output("[" + item_text + "\n]")
+            else:
+                parsed = list(parse_structured_output("{" + item_text + "\n}").items())
+        except Exception as e:
+            raise ValueError(f"Unparsable item in the response: {item_text.strip()!r}") from e
+        return parsed
+
@@ -0,0 +1,189 @@
+import math
+import os
+from ast import literal_eval
+from typing import List, Optional
+from philo.fake_chat import MORALITIES, FakeChat, FakeResponder
+from philo.history import JSONHistory
+
+# The words of synthetic actions, combined into up to 12 x 12 x 20 distinct actions before
+# they are numbered
+SYNTHETIC_VERBS = [
+    "Lying to",
+    "Helping",
+    "Stealing from",
+    "Donating to",
+    "Protecting",
+    "Betraying",
+    "Forgiving",
+    "Threatening",
+    "Teaching",
+    "Ignoring",
+    "Rescuing",
+    "Deceiving",
+]
+SYNTHETIC_OBJECTS = [
+    "a friend",
+    "a stranger",
+    "a rival",
+    "a charity",
+    "the state",
+    "a family member",
+    "a colleague",
+    "a neighbour",
+    "a child",
+    "an animal",
+    "a patient",
+    "a customer",
+]
+SYNTHETIC_CONTEXTS = [
+    "at work",
+    "in public",
+    "online",
+    "during a crisis",
+    "for money",
+    "out of spite",
+    "to save a life",
+    "under pressure",
+    "in secret",
+    "on a whim",
+    "after a promise",
+    "against the law",
+    "for a reward",
+    "without consent",
+    "in wartime",
+    "at school",
+    "in court",
+    "at home",
+    "abroad",
+    "in an election",
+]
+
+
+def get_synthetic_actions(n_actions: int) -> List[str]:
+    """Make up distinct, realistic looking actions.
+
+    Args:
+        n_actions (int): The number of actions.
+
+    Returns:
+        List[str]: The actions, the same for the same n_actions.
+    """
+    actions = []
+    n_combinations = len(SYNTHETIC_VERBS) * len(SYNTHETIC_OBJECTS) * len(SYNTHETIC_CONTEXTS)
+    for i in range(n_actions):
+        k = i % n_combinations
+        verb = SYNTHETIC_VERBS[k % len(SYNTHETIC_VERBS)]
+        k //= len(SYNTHETIC_VERBS)
+        obj = SYNTHETIC_OBJECTS[k % len(SYNTHETIC_OBJECTS)]
+        context = SYNTHETIC_CONTEXTS[k // len(SYNTHETIC_OBJECTS)]
+        action = f"{verb} {obj} {context}"
+        if i >= n_combinations:
+            action += f" (case {i // n_combinations + 1})"
+        actions.append(action)
+    return actions
+
+
+def get_synthetic_philosophies(n_philosophies: int) -> List[dict]:
+    """Make up philosophies, named as FakeResponder names them.
+
+    Args:
+        n_philosophies (int): The number of philosophies.
+
+    Returns:
+        List[dict]: The philosophies, with "name" and "description" keys.
+    """
+    return FakeResponder(n_philosophies=n_philosophies).get_philosophies("")
+
+
+class SyntheticResponder(FakeResponder):
+    """A FakeResponder whose philosophies list n_actions distinct actions between them."""
+
+    def __init__(self, n_actions: int = 100, n_philosophies: int = 5):
+        """Create the responder.
+
+        Args:
+            n_actions (int, optional): The number of distinct actions. Defaults to 100.
+            n_philosophies (int, optional): The number of philosophies. Defaults to 5.
+        """
+        super().__init__(
+            n_philosophies=n_philosophies,
+            n_actions_per_philosophy=math.ceil(n_actions / n_philosophies),
+        )
+        self.actions = get_synthetic_actions(n_actions)
+
+    def get_action_from_philosophy(self, user_input: str) -> list:
+        """Hand every n_philosophies-th action to the philosophy."""
+        name = literal_eval(user_input)["name"]
+        i = int(name.rsplit(" ", 1)[-1]) - 1
+        return [
+            {"action": action, "morality": MORALITIES[j % 3], "reason": f"Because of {name}."}
+            for j, action in enumerate(self.actions[i :: self.n_philosophies])
+        ]
+
+
+def generate_history(
+    n_actions: int,
+    n_philosophies: int = 5,
+    history_filename_suffix: str = "_synthetic",
+    history_backend: str = "json",
+    max_concurrency: int = 8,
+    chatbot: Optional[FakeChat] = None,
+    verbose: bool = False,
+    structured_output: bool = False,
+):
+    """Run every prompt of a pipeline against a fake chatbot, writing a synthetic history file.
+
+    The history is written to history{suffix}.jsonl as the responses arrive, then converted
+    to history{suffix}.json with the "json" backend, since rewriting the whole JSON file after
+    every response would dominate the run at large scales.
+
+    Args:
+        n_actions (int): The number of distinct actions, e.g. from 10 to 10000.
+        n_philosophies (int, optional): The number of philosophies. Defaults to 5.
+        history_filename_suffix (str, optional): The suffix of the history file. Defaults to "_synthetic".
+        history_backend (str, optional): "json" or "jsonl", the format of the history file. Defaults to "json".
+        max_concurrency (int, optional): Maximum number of per-action requests in flight at once. Defaults to 8.
+        chatbot (Optional[FakeChat], optional): The chatbot, e.g. with latency or errors. Defaults to None
+            (a FakeChat answering with a SyntheticResponder).
+        verbose (bool, optional): If true, keep the questioner's log messages. Defaults to False.
+        structured_output (bool, optional): If true, ask for responses constrained to the output
+            schemas, see Questioner. Defaults to False.
+
+    Raises:
+        ValueError: Invalid history backend.
+
+    Returns:
+        Questioner: The questioner, with every stage but the scorecard set.
+    """
+    from philo.questioner import Questioner
+
+    if history_backend not in ("json", "jsonl"):
+        raise ValueError(f"Invalid history backend: {history_backend}")
+    q = Questioner(
+        history_filename_suffix=history_filename_suffix,
+        fresh_start=True,
+        max_concurrency=max_concurrency,
+        structured_output=structured_output,
+    )
+    if not verbose:
+        q.log = lambda text: None
+    if chatbot is None:
+        chatbot = FakeChat(responder=SyntheticResponder(n_actions, n_philosophies))
+    q.set_chatbot(chatbot=chatbot)
+    q.set_philosophies(prompt_version_number=1)
+    q.set_all_actions_from_philosophies()
+    q.set_all_actions()
+    q.set_cluster_labels(prompt_version_number=0)
+    q.set_action_clusters(prompt_version_number=0)
+    q.set_action_scores(prompt_version_number=0)
+    if history_backend == "json":
+        q.history.close()
+        history = JSONHistory(q.legacy_history_file_path)
+        history.data.update(q.history.data)
+        history.save()
+        os.remove(q.history_file_path)
+        # Keep the questioner on the file it now reads from
+        q.history = history
+        q.history_backend = "json"
+        q.history_file_path = q.legacy_history_file_path
+    return q
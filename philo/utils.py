@@ -1,6 +1,7 @@
 import os
 import json
 from typing import List, Dict
+from philo.history import read_jsonl_history
 
 MessageType = List[Dict[str, str]]
 
@@ -19,52 +20,127 @@ def get_repo_root() -> str:
 import re
 from ast import literal_eval
 
+# Everything clean_structured_output has to look at, in one alternation. Strings are matched
+# whole so that "#" and newlines inside them are kept apart from comments and line breaks.
+# Single-quoted strings may contain apostrophes between two word characters ("it's").
+STRUCTURED_OUTPUT_TOKEN = re.compile(
+    r"""
+    (?P<skip>^[\#`][^\n]*)
+    | (?P<string>"[^"\\]*(?:\\[\s\S][^"\\]*)*"
+        |'[^'\\]*(?:(?:\\[\s\S]|(?<=\w)'(?=\w))[^'\\]*)*')
+    | (?P<comment>\#[^\n]*)
+    | (?P<fence>```)
+    """,
+    re.MULTILINE | re.VERBOSE,
+)
+APOSTROPHE = re.compile(r"(?<=\w)'(?=\w)")
+
+
+def clean_structured_output_token(match: re.Match) -> str:
+    """Replacement for a single STRUCTURED_OUTPUT_TOKEN match.
+
+    Args:
+        match (re.Match): The match.
+
+    Returns:
+        str: The string with newlines removed and apostrophes escaped, or "" for anything else.
+    """
+    if match.lastgroup != "string":
+        return ""
+    token = match.group()
+    if "\n" in token:
+        token = token.replace("\n", "")
+    if token[0] == "'" and "'" in token[1:-1]:
+        token = "'" + APOSTROPHE.sub("\\\\'", token[1:-1]) + "'"
+    return token
+
+
+def clean_structured_output(text: str) -> str:
+    """Strip the non-literal parts of a chatbot response in a single pass.
+
+    Drops lines starting with "#" or "`", comments and code fences, removes newlines
+    inside strings and escapes apostrophes inside single-quoted strings.
+
+    Args:
+        text (str): The text to clean
+
+    Returns:
+        str: The text, ready for literal_eval
+    """
+    return STRUCTURED_OUTPUT_TOKEN.sub(clean_structured_output_token, text).strip()
+
+
+# The errors of a response that cannot be parsed, or that does not match its schema
+PARSE_ERRORS = (ValueError, SyntaxError)
+
 
 # Convert a string of text to a list of dictionaries
 def parse_structured_output(text: str) -> any:
     """Parse a string of text into python objects
 
+    Accepts python literals, optionally surrounded by a "#" scratchpad and code fences, and JSON.
+
     Args:
         text (str): The text to parse
 
+    Raises:
+        ValueError, SyntaxError: The text cannot be parsed, see PARSE_ERRORS.
+
     Returns:
         any: The parsed text as a python object
     """
-    out = text
-    # Remove all lines that start with "#" and "`"
-    # and remove any comments from the end of a line
-    collect = []
-    for line in out.split("\n"):
-        if line.startswith("#") or line.startswith("`"):
+    if not isinstance(text, str):
+        # e.g. the empty content of a refusal
+        raise ValueError(f"Expected a text response, got {text!r}.")
+    # Fast path for responses that are already plain JSON
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    out = clean_structured_output(text)
+    # json.loads is much faster than literal_eval, and fails fast on single quotes
+    try:
+        return json.loads(out)
+    except ValueError:
+        return literal_eval(out)
+
+
+def get_numbered_items(parsed: dict) -> dict:
+    """Key a parsed dictionary of numbered items, e.g. batched scores, by integer.
+
+    Python literal responses have integer keys and JSON responses string keys, {1: ...} and
+    {"1": ...}, so both are read the same way.
+
+    Args:
+        parsed (dict): The parsed response.
+
+    Returns:
+        dict: The items by number. Keys that are not numbers are dropped.
+    """
+    items = {}
+    for key, value in parsed.items():
+        try:
+            items[int(key)] = value
+        except (TypeError, ValueError):
             continue
-        else:
-            parsed_line = line
-            if "#" in parsed_line:
-                parsed_line = line[: line.index("#")]
-            collect.append(parsed_line)
-    out = "\n".join(collect)
-    pattern = r"(\w)'(\w)"
-    replacement = r"\1APOSTROPHEAPOSTROPHE\2"
-    # Remove newlines
-    out = out.replace("\n", "")
-    # Replace single quotes with escaped single quotes
-    out = re.sub(pattern, replacement, out)
-    # Replace 'APOTROPHEAPOSTROPHE' with escaped single quotes
-    out = out.replace("APOSTROPHEAPOSTROPHE", "\\'")
-    out = out.replace("```", "")
-    out = literal_eval(out)
-    return out
+    return items
 
 
 def load_history(suffix: str = "") -> dict:
     """Load the history from a file
 
+    Reads the append-only history{suffix}.jsonl log if it exists, and the
+    history{suffix}.json file otherwise.
+
     Args:
         suffix (str, optional): Use for different histories. Defaults to "".
 
     Returns:
         dict: The history
     """
+    history_file_path = os.path.join(get_repo_root(), f"history{suffix}.jsonl")
+    if os.path.exists(history_file_path):
+        return read_jsonl_history(history_file_path)
     history_file_path = os.path.join(get_repo_root(), f"history{suffix}.json")
     with open(history_file_path, "r") as f:
         history = json.load(f)
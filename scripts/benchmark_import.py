@@ -0,0 +1,70 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Dependencies that a cached run should not need to import
+HEAVY_MODULES = ["pandas", "plotly", "openai", "tqdm"]
+
+
+def get_import_times(module: str) -> dict:
+    """Import a module in a fresh interpreter and read its -X importtime report.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        dict: The cumulative import time of every imported module, in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the import of philo modules.")
+    parser.add_argument(
+        "modules", nargs="*", default=["philo.questioner", "philo.cli"], help="Modules to import"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="Number of fresh interpreters per module"
+    )
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=None,
+        help="Exit with an error if a module takes longer than this to import",
+    )
+    args = parser.parse_args()
+
+    too_slow = False
+    for module in args.modules:
+        runs = [get_import_times(module) for _ in range(args.repeat)]
+        total = statistics.median(run[module] for run in runs) / 1e3
+        heavy = [m for m in HEAVY_MODULES if m in runs[0]]
+        print(f"{module}")
+        print(f"  median import:  {total:.1f} ms")
+        print(f"  heavy modules:  {', '.join(heavy) or 'none'}")
+        slowest = sorted(runs[0].items(), key=lambda item: item[1], reverse=True)
+        slowest = [(name, microseconds) for name, microseconds in slowest if name != module]
+        for name, microseconds in slowest[: args.top]:
+            print(f"  {microseconds / 1e3:8.1f} ms  {name}")
+        too_slow = too_slow or (args.max_ms is not None and total > args.max_ms)
+    if too_slow:
+        sys.exit(f"An import took longer than {args.max_ms} ms.")
+
+
+if __name__ == "__main__":
+    main()
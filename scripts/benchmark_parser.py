@@ -0,0 +1,40 @@
+import argparse
+import time
+from philo.utils import load_history, parse_structured_output
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time parse_structured_output over the responses in a history file."
+    )
+    parser.add_argument("--suffix", default="", help="History file suffix, as in history{suffix}.jsonl")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of passes over the responses")
+    args = parser.parse_args()
+
+    responses = [value["response"] for value in load_history(args.suffix).values()]
+    n_failed = 0
+    timings = []
+    for response in responses:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            try:
+                parse_structured_output(response)
+            except Exception:
+                n_failed += 1
+        timings.append((time.perf_counter() - start) / args.repeat)
+    timings.sort()
+    n_bytes = sum(len(response) for response in responses)
+    total = sum(timings)
+    print(f"responses:       {len(responses)} ({n_bytes / 1e6:.2f} MB)")
+    print(f"unparsable:      {n_failed // args.repeat}")
+    if not timings:
+        return
+    print(f"total per pass:  {total * 1e3:.1f} ms")
+    print(f"mean:            {total / len(timings) * 1e6:.1f} us")
+    print(f"median:          {timings[len(timings) // 2] * 1e6:.1f} us")
+    print(f"p99:             {timings[int(len(timings) * 0.99)] * 1e6:.1f} us")
+    print(f"throughput:      {n_bytes / total / 1e6:.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
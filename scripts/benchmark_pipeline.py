@@ -0,0 +1,271 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+from philo.fake_chat import FakeChat
+from philo.prompts import PromptConstructor
+from philo.questioner import Questioner
+from philo.synthetic import SyntheticResponder, generate_history
+from philo.utils import get_repo_root, parse_structured_output
+
+
+def measure(function: Callable[[], int], repeat: int) -> dict:
+    """Time a benchmark, then measure its peak memory in one more run.
+
+    The runs are timed without tracemalloc, which slows allocations down.
+
+    Args:
+        function (Callable[[], int]): Runs the benchmark and returns its number of calls.
+        repeat (int): The number of timed runs; the fastest one is kept.
+
+    Returns:
+        dict: The seconds per run, the calls per run, the microseconds per call and the
+            peak memory allocated during a run, in MB.
+    """
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        n_calls = function()
+        timings.append(time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds = min(timings)
+    return {
+        "seconds": seconds,
+        "calls": n_calls,
+        "us_per_call": seconds / max(n_calls, 1) * 1e6,
+        "peak_memory_mb": peak / 1e6,
+    }
+
+
+def get_chatbot(args: argparse.Namespace, n_actions: int) -> FakeChat:
+    """Get a fake chatbot answering for n_actions actions, with the latency and errors asked for."""
+    return FakeChat(
+        responder=SyntheticResponder(n_actions, args.philosophies),
+        latency=args.latency,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+    )
+
+
+def run_scale(args: argparse.Namespace, n_actions: int, output_dir: str) -> dict:
+    """Run every benchmark on a synthetic history of n_actions actions.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        n_actions (int): The number of actions.
+        output_dir (str): The directory to write the scorecards to.
+
+    Returns:
+        dict: The measurements, by benchmark.
+    """
+    suffix = f"_benchmark_{n_actions}"
+    results = {}
+    parse_failures = []
+
+    def run_generate_history():
+        q = generate_history(
+            n_actions,
+            args.philosophies,
+            history_filename_suffix=suffix,
+            max_concurrency=args.max_concurrency,
+            chatbot=get_chatbot(args, n_actions),
+            structured_output=args.structured_output,
+        )
+        parse_failures.append(sum(record["parse_failures"] for record in q.metrics.records))
+        return 1
+
+    results["generate_history"] = measure(run_generate_history, 1)
+    # The responses that had to be retried because they could not be parsed
+    results["generate_history"]["parse_failures"] = parse_failures[0]
+
+    # A questioner reading the history back, as a cached run would
+    q = Questioner(
+        history_filename_suffix=suffix,
+        max_concurrency=args.max_concurrency,
+        structured_output=args.structured_output,
+    )
+    q.log = lambda text: None
+    q.set_chatbot(chatbot=get_chatbot(args, n_actions))
+    q.set_philosophies(prompt_version_number=1)
+    q.set_all_actions_from_philosophies()
+    q.set_all_actions()
+    q.set_cluster_labels(prompt_version_number=0)
+    q.set_action_clusters(prompt_version_number=0)
+    q.set_action_scores(prompt_version_number=0)
+    records = [(key, record["prompt"], record["response"]) for key, record in q.history.items()]
+
+    def run_send_receive_cached():
+        for key, prompt, _ in records:
+            q.send_receive(prompt, key)
+        return len(records)
+
+    def run_send_receive_fake():
+        for key, prompt, _ in records:
+            q.send_receive(prompt, key, force_refresh=True)
+        return len(records)
+
+    def run_parse_structured_output():
+        for _, _, response in records:
+            parse_structured_output(response)
+        return len(records)
+
+    pc = PromptConstructor("score_action")
+
+    def run_get_prompt():
+        for action in q.all_actions:
+            q.get_action_score_prompt(action, pc)
+        return len(q.all_actions)
+
+    def run_set_cluster_to_actions_dict():
+        q.set_cluster_to_actions_dict()
+        return 1
+
+    def run_create_scorecard():
+        q.set_sorted_actions()
+        q.create_scorecard(include_plotlyjs="cdn", output_dir=output_dir)
+        return 1
+
+    results["send_receive_cached"] = measure(run_send_receive_cached, args.repeat)
+    results["send_receive_fake"] = measure(run_send_receive_fake, args.repeat)
+    results["parse_structured_output"] = measure(run_parse_structured_output, args.repeat)
+    results["get_prompt"] = measure(run_get_prompt, args.repeat)
+    results["set_cluster_to_actions_dict"] = measure(run_set_cluster_to_actions_dict, args.repeat)
+    results["create_scorecard"] = measure(run_create_scorecard, args.repeat)
+
+    q.history.close()
+    if not args.keep_history:
+        for extension in ["json", "jsonl"]:
+            path = os.path.join(get_repo_root(), f"history{suffix}.{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+    return results
+
+
+def get_commit() -> str:
+    """Get the short hash of the checked out commit, to tell results apart."""
+    result = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=get_repo_root()
+    )
+    return result.stdout.strip() or "unknown"
+
+
+def compare(results: dict, baseline: dict, max_slowdown: float) -> bool:
+    """Print the time of every benchmark relative to a baseline.
+
+    Args:
+        results (dict): The results of this run.
+        baseline (dict): The results of an earlier run.
+        max_slowdown (float): The ratio to the baseline time above which a benchmark regressed.
+
+    Returns:
+        bool: True if a benchmark regressed.
+    """
+    regressed = False
+    print(f"compared to {baseline['commit']}:")
+    for scale, benchmarks in results["scales"].items():
+        for name, result in benchmarks.items():
+            old = baseline["scales"].get(scale, {}).get(name)
+            if old is None:
+                continue
+            ratio = result["seconds"] / max(old["seconds"], 1e-9)
+            flag = "  REGRESSED" if ratio > max_slowdown else ""
+            regressed = regressed or bool(flag)
+            print(f"  {scale:>6} {name:<28} {ratio:6.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time the pipeline stages offline, on synthetic histories and a fake chatbot."
+    )
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000],
+        help="Numbers of actions to benchmark, e.g. 10 100 1000 10000",
+    )
+    parser.add_argument("--philosophies", type=int, default=5, help="Number of philosophies")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per benchmark")
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Fake chatbot latency, in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Fake chatbot transient error rate"
+    )
+    parser.add_argument(
+        "--malformed-rate", type=float, default=0.0, help="Fake chatbot malformed response rate"
+    )
+    parser.add_argument(
+        "--structured-output",
+        action="store_true",
+        help="Ask for responses constrained to the output schemas",
+    )
+    parser.add_argument(
+        "--max-concurrency", type=int, default=8, help="Maximum number of requests in flight"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="JSON file to write (default: results/benchmarks/pipeline-<commit>.json)",
+    )
+    parser.add_argument("--compare", default=None, help="JSON file of an earlier run to compare to")
+    parser.add_argument(
+        "--max-slowdown",
+        type=float,
+        default=1.5,
+        help="Exit with an error if a benchmark is this many times slower than in --compare",
+    )
+    parser.add_argument(
+        "--keep-history", action="store_true", help="Keep the synthetic history files"
+    )
+    args = parser.parse_args()
+
+    results = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "philosophies": args.philosophies,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "malformed_rate": args.malformed_rate,
+        "structured_output": args.structured_output,
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as output_dir:
+        for n_actions in args.scales:
+            results["scales"][str(n_actions)] = run_scale(args, n_actions, output_dir)
+            for name, result in results["scales"][str(n_actions)].items():
+                print(
+                    f"{n_actions:>6} {name:<28} {result['seconds'] * 1e3:10.1f} ms"
+                    f" {result['us_per_call']:10.1f} us/call {result['peak_memory_mb']:8.1f} MB"
+                )
+
+    output = args.output
+    if output is None:
+        output = os.path.join("results", "benchmarks", f"pipeline-{results['commit']}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.max_slowdown):
+            sys.exit(f"A benchmark is more than {args.max_slowdown}x slower than in {args.compare}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import argparse
+import os
+from philo.batch import OpenAIBatchClient, wait_for_batch
+from philo.chatbots import DEFAULT_MODEL, DEFAULT_SCORE_MODEL
+from philo.questioner import Questioner
+from philo.rate_limit import RateLimiter
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score actions and assign them to clusters in one Batch API job."
+    )
+    parser.add_argument(
+        "--model", default=DEFAULT_MODEL, help="The model of every prompt but the scores."
+    )
+    parser.add_argument(
+        "--score-model", default=DEFAULT_SCORE_MODEL, help="The model of the score_action prompts."
+    )
+    parser.add_argument(
+        "--max-rpm",
+        type=float,
+        default=None,
+        help="Send at most this many requests per minute outside the batch.",
+    )
+    parser.add_argument(
+        "--max-tpm",
+        type=float,
+        default=None,
+        help="Send at most this many prompt tokens per minute outside the batch.",
+    )
+    args = parser.parse_args()
+    q = Questioner(rate_limiter=RateLimiter(args.max_rpm, args.max_tpm))
+    # Route the prompts as the philo command line does, so that it finds the batched responses
+    # in history: the model is part of the request hash
+    q.set_run_chatbots(model=args.model, score_model=args.score_model)
+    ### Get the philosophies, actions and cluster labels ###
+    ###
+    print("Getting philosophies, actions and cluster labels...")
+    q.set_philosophies(prompt_version_number=1)
+    q.set_all_actions_from_philosophies()
+    q.set_all_actions()
+    q.set_cluster_labels(prompt_version_number=0)
+    ### Send every pending score_action and action_cluster prompt as one batch
+    ###
+    if not os.path.exists("results"):
+        os.makedirs("results")
+    request_file_path = os.path.join("results", "batch_requests.jsonl")
+    result_file_path = os.path.join("results", "batch_results.jsonl")
+    print("Scoring actions in a batch...")
+    if q.write_batch_file(request_file_path, prompt_version_number=0) > 0:
+        client = OpenAIBatchClient()
+        batch_id = q.submit_batch(client, request_file_path)
+        print(f"Submitted batch {batch_id}; waiting for it to complete...")
+        status = wait_for_batch(client, batch_id)
+        if status != "completed":
+            raise RuntimeError(f"Batch {batch_id} ended with status {status}.")
+        client.download(batch_id, result_file_path)
+        print(f"Stored {q.ingest_batch_results(request_file_path, result_file_path)} responses.")
+    print("Run scripts/run_all.py to assign clusters and create the scorecard from history.")
+
+
+if __name__ == "__main__":
+    main()
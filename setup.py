@@ -9,7 +9,7 @@ setup(
     version="0.1",
     packages=find_packages(),
     install_requires=requirements,
-    # entry_points={"console_scripts": ["my_package=my_package.__main__:main"]},
+    entry_points={"console_scripts": ["philo=philo.cli:main"]},
     author="James Stankowicz",
     author_email="jj.stankowicz@gmail.com",
     description="Learn about philosophy with ChatGPT.",
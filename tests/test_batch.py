@@ -0,0 +1,75 @@
+import unittest
+import json
+import os
+import tempfile
+from unittest.mock import patch
+from philo.batch import LocalBatchClient, read_batch_results, wait_for_batch
+from philo.fake_chat import FakeChat, FakeResponder
+from philo.questioner import Questioner
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.request_file_path = os.path.join(self.tmp_dir.name, "requests.jsonl")
+        self.result_file_path = os.path.join(self.tmp_dir.name, "results.jsonl")
+        with open(self.request_file_path, "w") as f:
+            for e, question in enumerate(["Hello", "Goodbye"]):
+                request = {
+                    "custom_id": f"request-{e}",
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": question}]},
+                }
+                f.write(json.dumps(request) + "\n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_local_batch_round_trip(self):
+        client = LocalBatchClient(lambda body: body["messages"][-1]["content"].upper())
+        batch_id = client.submit(self.request_file_path)
+        self.assertEqual(wait_for_batch(client, batch_id, poll_seconds=0), "completed")
+        client.download(batch_id, self.result_file_path)
+        results = read_batch_results(self.result_file_path)
+        self.assertEqual(results, {"request-0": "HELLO", "request-1": "GOODBYE"})
+
+    @patch("philo.questioner.OpenAIChat", lambda model, **kwargs: FakeChat(model=model))
+    def test_batch_then_cli_run(self):
+        # scripts/run_batch.py and the command line route the prompts the same way, so a
+        # run after a batch finds every batched response in history
+        q = Questioner(history_filename_suffix="_test_batch", fresh_start=True)
+        q.log = lambda text: None
+        try:
+            q.set_run_chatbots()
+            q.set_philosophies(prompt_version_number=1)
+            q.set_all_actions_from_philosophies()
+            q.set_all_actions()
+            q.set_cluster_labels(prompt_version_number=0)
+            n_requests = q.write_batch_file(self.request_file_path, prompt_version_number=0)
+            responder = FakeResponder()
+            client = LocalBatchClient(lambda body: responder(body["messages"][-1]["content"]))
+            client.download(client.submit(self.request_file_path), self.result_file_path)
+            stored = q.ingest_batch_results(self.request_file_path, self.result_file_path)
+            self.assertEqual(stored, n_requests)
+            q.history.close()
+
+            q = Questioner(history_filename_suffix="_test_batch")
+            q.log = lambda text: None
+            q.set_run_chatbots()
+            q.set_philosophies(prompt_version_number=1)
+            q.set_all_actions_from_philosophies()
+            q.set_all_actions()
+            q.set_cluster_labels(prompt_version_number=0)
+            q.set_clusters_to_actions(prompt_version_number=0)
+            q.set_action_scores(prompt_version_number=0)
+            self.assertEqual(q.chatbot.calls + q.prompt_chatbots["score_action"].calls, 0)
+        finally:
+            q.history.close()
+            os.remove(q.history_file_path)
+
+    def test_failed_results_are_skipped(self):
+        with open(self.result_file_path, "w") as f:
+            f.write(json.dumps({"custom_id": "request-0", "response": None, "error": {"code": "x"}}))
+        self.assertEqual(read_batch_results(self.result_file_path), {})
@@ -1,5 +1,10 @@
+import os
 import unittest
+from unittest.mock import MagicMock, patch
+import httpx
+import openai
 from philo.chatbots import OpenAIChat
+from philo.questioner import Questioner
 
 
 class TestOpenAIChat(unittest.TestCase):
@@ -22,3 +27,93 @@ class TestOpenAIChat(unittest.TestCase):
         self.chatbot.reset_messages()
         # Check that the messages have been reset
         self.assertEqual(self.chatbot.messages, [original_first_message])
+
+
+class TestOpenAIChatStateless(unittest.TestCase):
+    def setUp(self):
+        # Replace the OpenAI client so no request leaves the process
+        client = MagicMock()
+        self.chatbot = OpenAIChat(model="gpt-3.5-turbo", stateless=True, client=client)
+        create = client.chat.completions.create
+        create.return_value.choices = [MagicMock()]
+        create.return_value.choices[0].message.content = "Hi"
+        self.create = create
+
+    def test_stateless_send_receive(self):
+        self.chatbot.send_receive("Hello")
+        self.chatbot.send_receive("Hello again")
+        # Check that only the system role and the current question were sent
+        sent_messages = self.create.call_args.kwargs["messages"]
+        self.assertEqual(len(sent_messages), 2)
+        self.assertEqual(sent_messages[0]["role"], "system")
+        self.assertEqual(sent_messages[1]["content"], "Hello again")
+        # Check that the chat history was not updated
+        self.assertEqual(len(self.chatbot.messages), 1)
+
+    def test_conversation_opt_in(self):
+        self.chatbot.send_receive("Hello", stateless=False)
+        self.assertEqual(self.chatbot.messages[-1]["role"], "assistant")
+        self.assertEqual(self.chatbot.messages[-1]["content"], "Hi")
+
+    def test_other_servers(self):
+        # Servers other than the OpenAI API serve models of their own
+        chatbot = OpenAIChat(model="llama3", base_url="http://localhost:8000/v1", client=MagicMock())
+        self.assertEqual(chatbot.model, "llama3")
+        with self.assertRaises(ValueError):
+            OpenAIChat(model="llama3")
+
+    def test_candidates(self):
+        choices = [MagicMock(), MagicMock()]
+        choices[0].message.content, choices[1].message.content = "A", "B"
+        self.create.return_value.choices = choices
+        candidates = self.chatbot.send_receive_candidates("Hello", n=2, temperature=0.5)
+        self.assertEqual(candidates, ["A", "B"])
+        self.assertEqual(self.create.call_args.kwargs["n"], 2)
+        # A single completion is requested as before
+        self.assertNotIn("n", self.chatbot.get_request_body("Hello"))
+
+    def test_response_format(self):
+        response_format = {"type": "json_schema", "json_schema": {"name": "x", "schema": {}}}
+        self.create.return_value.choices[0].message.content = "{}"
+        self.chatbot.send_receive("Hello", response_format=response_format)
+        self.assertEqual(self.create.call_args.kwargs["response_format"], response_format)
+        # Free text requests are sent, and hashed, as before
+        self.assertNotIn("response_format", self.chatbot.get_request_body("Hello"))
+
+    def test_usage_after_failed_attempt(self):
+        def get_response(prompt_tokens, completion_tokens):
+            response = MagicMock()
+            response.choices[0].message.content = "[1]"
+            response.usage.model_dump.return_value = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+            }
+            return response
+
+        error = openai.APIConnectionError(request=httpx.Request("POST", "http://localhost"))
+        self.create.side_effect = [get_response(1000, 500), error, get_response(10, 5)]
+        q = Questioner(history_filename_suffix="_test_chatbots", fresh_start=True)
+        q.log = lambda text: None
+        q.set_chatbot(chatbot=self.chatbot)
+        try:
+            with patch("philo.questioner.time.sleep"):
+                q.send_receive("First", "score_action||0||first")
+                q.send_receive("Second", "score_action||0||second")
+        finally:
+            q.history.close()
+            os.remove(q.history_file_path)
+        # The failed attempt counts no tokens, not those of the request before it
+        self.assertEqual(q.metrics.records[-1]["retries"], 1)
+        self.assertEqual(q.metrics.records[-1]["prompt_tokens"], 10)
+        self.assertEqual(q.metrics.records[-1]["completion_tokens"], 5)
+
+    def test_stream_response(self):
+        chunks = [MagicMock(usage=None), MagicMock(usage=None), MagicMock(choices=[])]
+        chunks[0].choices[0].delta.content = "[1, "
+        chunks[1].choices[0].delta.content = "2]"
+        chunks[2].usage.model_dump.return_value = {"prompt_tokens": 3, "completion_tokens": 2}
+        self.create.return_value = MagicMock(__iter__=lambda self: iter(chunks))
+        self.assertEqual("".join(self.chatbot.stream_response("Hello")), "[1, 2]")
+        self.assertTrue(self.create.call_args.kwargs["stream"])
+        self.assertEqual(self.chatbot.get_last_usage()["completion_tokens"], 2)
+        self.create.return_value.close.assert_called_once()
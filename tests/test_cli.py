@@ -0,0 +1,41 @@
+import subprocess
+import sys
+import unittest
+from philo.cli import STAGE_COMMANDS, get_parser
+
+
+class TestCli(unittest.TestCase):
+
+    def test_parser(self):
+        args = get_parser().parse_args(["action_scores", "--resume", "--dedup-threshold", "0.6"])
+        self.assertEqual(args.command, "action_scores")
+        self.assertTrue(args.resume)
+        self.assertEqual(args.dedup_threshold, 0.6)
+        self.assertEqual(args.cluster_backend, "llm")
+        self.assertEqual(args.candidates, 1)
+        self.assertFalse(args.vote)
+        self.assertFalse(args.structured_output)
+        self.assertIsNone(args.max_rpm)
+        args = get_parser().parse_args(["run", "--max-rpm", "500", "--max-tpm", "80000"])
+        self.assertEqual((args.max_rpm, args.max_tpm), (500, 80000))
+        for command in ["run"] + STAGE_COMMANDS:
+            self.assertEqual(get_parser().parse_args([command]).command, command)
+
+    def test_lazy_imports(self):
+        # Importing the questioner and creating a chatbot must not load the heavy dependencies
+        code = (
+            "import sys\n"
+            "from philo.chatbots import OpenAIChat\n"
+            "import philo.questioner\n"
+            "OpenAIChat()\n"
+            "heavy = ['pandas', 'plotly', 'openai', 'tqdm']\n"
+            "print(' '.join(m for m in heavy if m in sys.modules))\n"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        )
+        self.assertEqual(result.stdout.strip(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from philo.chatbots import OpenAIChat
+from philo.clients import close_clients, get_openai_client, pool_limits, set_pool_limits
+
+
+class TestClients(unittest.TestCase):
+
+    def setUp(self):
+        self.limits = dict(pool_limits)
+
+    def tearDown(self):
+        set_pool_limits(**self.limits)
+        close_clients()
+
+    def test_shared_client(self):
+        client = get_openai_client(api_key="sk-test")
+        self.assertIs(get_openai_client(api_key="sk-test"), client)
+        self.assertIsNot(get_openai_client("http://localhost:8000/v1", "sk-test"), client)
+        # Chatbots of different models share the client of their server
+        first = OpenAIChat(model="llama3", base_url="http://localhost:8000/v1")
+        second = OpenAIChat(model="mistral", base_url="http://localhost:8000/v1")
+        self.assertIs(first.client, second.client)
+
+    def test_pool_limits(self):
+        client = get_openai_client(api_key="sk-test")
+        set_pool_limits(max_connections=4, max_keepalive_connections=4)
+        self.assertEqual(pool_limits["max_connections"], 4)
+        self.assertEqual(pool_limits["keepalive_expiry"], self.limits["keepalive_expiry"])
+        # Clients created before are replaced
+        self.assertIsNot(get_openai_client(api_key="sk-test"), client)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+from philo.clustering import cluster_actions, get_ngram_counts, get_tfidf_matrix, kmeans
+
+
+class TestClustering(unittest.TestCase):
+
+    def setUp(self):
+        self.actions = [
+            "Lying to protect a loved one.",
+            "Lying to a friend.",
+            "Donating to a cause you do not believe in.",
+            "Donating to any charitable cause.",
+            "Killing five people to save one.",
+            "Killing in self defense.",
+        ]
+
+    def test_ngram_counts(self):
+        self.assertEqual(get_ngram_counts("Ab, ab"), {" ab": 2, "ab ": 2, "b a": 1})
+
+    def test_tfidf_matrix(self):
+        matrix = get_tfidf_matrix(self.actions, max_features=50)
+        self.assertEqual(matrix.shape, (6, 50))
+        np.testing.assert_allclose(np.linalg.norm(matrix, axis=1), 1, rtol=1e-5)
+
+    def test_kmeans(self):
+        vectors = np.array([[1, 0], [0.9, 0.1], [0, 1], [0.1, 0.9]], dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        labels, centroids = kmeans(vectors, 2)
+        self.assertEqual(labels[0], labels[1])
+        self.assertEqual(labels[2], labels[3])
+        self.assertNotEqual(labels[0], labels[2])
+        self.assertEqual(centroids.shape, (2, 2))
+
+    def test_kmeans_empty_clusters(self):
+        # Duplicate vectors leave clusters empty, which are dropped
+        vectors = np.array([[1, 0], [1, 0], [1, 0], [0, 1]], dtype=np.float32)
+        labels, centroids = kmeans(vectors, 3)
+        self.assertEqual(sorted(set(labels.tolist())), list(range(len(centroids))))
+        self.assertEqual(len(centroids), 2)
+
+    def test_cluster_actions(self):
+        labels, similarities = cluster_actions(self.actions, n_clusters=3)
+        # Each pair of actions shares its first word
+        self.assertEqual(len(set(labels)), 3)
+        for i in range(0, 6, 2):
+            self.assertEqual(labels[i], labels[i + 1])
+        self.assertTrue(((similarities > 0) & (similarities <= 1 + 1e-5)).all())
+        # More clusters than actions are capped
+        labels, _ = cluster_actions(self.actions[:2], n_clusters=5)
+        self.assertEqual(len(labels), 2)
+        labels, similarities = cluster_actions([])
+        self.assertEqual((len(labels), len(similarities)), (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+from philo.dedup import (
+    MinHashLSH,
+    deduplicate_actions,
+    get_guard,
+    get_lsh_bands,
+    get_shingles,
+    get_words,
+    normalize_action,
+)
+
+
+class TestDedup(unittest.TestCase):
+
+    def setUp(self):
+        self.actions = [
+            "Donating to charity",
+            "Lying to protect a friend",
+            "Donating to charities.",
+            "Stealing food to feed a starving family",
+            "lying to protect friends!",
+            "Donating to charity",
+        ]
+
+    def test_normalize_action(self):
+        self.assertEqual(normalize_action("  Lying, to protect friends!"), "lying to protect friends")
+        self.assertEqual(get_words("Don't lie"), ["do", "not", "lie"])
+        self.assertEqual(get_shingles(get_words("Donating to charities")), {"donat", "chari"})
+        self.assertEqual(get_shingles(["to", "a"]), {"to a"})
+        self.assertEqual(get_guard(get_words("Not helping a friend")), ("helpi", {"not"}))
+
+    def test_lsh_bands(self):
+        bands, rows = get_lsh_bands(0.6, 128)
+        self.assertEqual(bands * rows, 128)
+        self.assertLessEqual((1 / bands) ** (1 / rows), 0.6)
+
+    def test_deduplicate_actions(self):
+        kept, aliases = deduplicate_actions(self.actions, threshold=0.6)
+        self.assertEqual(
+            kept,
+            [
+                "Donating to charity",
+                "Lying to protect a friend",
+                "Stealing food to feed a starving family",
+            ],
+        )
+        self.assertEqual(
+            aliases,
+            {
+                "Donating to charities.": "Donating to charity",
+                "lying to protect friends!": "Lying to protect a friend",
+            },
+        )
+
+    def test_threshold(self):
+        actions = ["Donating to charity", "Donating to any charitable cause"]
+        kept, aliases = deduplicate_actions(actions)
+        self.assertEqual(aliases, {"Donating to any charitable cause": "Donating to charity"})
+        kept, aliases = deduplicate_actions(actions, threshold=0.95)
+        self.assertEqual(kept, actions)
+
+    def test_different_meanings(self):
+        pairs = [
+            ("Helping a friend", "Not helping a friend"),
+            ("Telling the truth", "Not telling the truth"),
+            ("Keeping a promise", "Never keeping a promise"),
+            ("Paying taxes", "Refusing to pay taxes"),
+            ("Helping a friend", "Don't help a friend"),
+            ("Stealing food to feed your family", "Stealing food to feed yourself"),
+            ("Helping a family member to save a life", "Lying to a family member to save a life"),
+        ]
+        for pair in pairs:
+            kept, aliases = deduplicate_actions(pair)
+            self.assertEqual(aliases, {}, pair)
+
+    def test_query(self):
+        index = MinHashLSH(threshold=0.6)
+        self.assertIsNone(index.query("Donating to charity", add=True))
+        self.assertEqual(index.query("Donating to charities"), "Donating to charity")
+        self.assertIsNone(index.query("Stealing food"))
+        self.assertNotIn("Stealing food", index.shingles)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import asyncio
+import unittest
+import threading
+import time
+from philo.engine import iter_concurrently, run_concurrently, run_streaming
+
+
+class TestEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def slow_square(self, x):
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.01 * (x % 3))
+        with self.lock:
+            self.in_flight -= 1
+        return x * x
+
+    def test_run_concurrently_keeps_order(self):
+        items = list(range(20))
+        out = run_concurrently(self.slow_square, items, max_concurrency=4)
+        self.assertEqual(out, [x * x for x in items], "Results are not in input order")
+        self.assertLessEqual(self.max_in_flight, 4, "More calls in flight than allowed")
+
+    def test_run_concurrently_in_event_loop(self):
+        # As from Jupyter or an async caller, where asyncio.run would fail
+        async def main():
+            return run_concurrently(self.slow_square, range(10), max_concurrency=4)
+
+        out = asyncio.run(main())
+        self.assertEqual(out, [x * x for x in range(10)])
+
+    def test_run_serially(self):
+        out = run_concurrently(self.slow_square, [1, 2, 3], max_concurrency=1)
+        self.assertEqual(out, [1, 4, 9])
+        self.assertEqual(self.max_in_flight, 1, "Serial mode ran calls concurrently")
+
+    def test_iter_concurrently(self):
+        out = list(iter_concurrently(self.slow_square, range(10), max_concurrency=4))
+        self.assertEqual(sorted(out), [x * x for x in range(10)])
+        self.assertLessEqual(self.max_in_flight, 4, "More calls in flight than allowed")
+
+    def test_run_streaming_starts_before_items_end(self):
+        started = threading.Event()
+
+        def items():
+            yield 1
+            # The first item is processed while the generator waits for the next one
+            self.assertTrue(started.wait(timeout=5), "First item was not started")
+            yield 2
+
+        def square(x):
+            started.set()
+            return x * x
+
+        out = run_streaming(square, items(), max_concurrency=2)
+        self.assertEqual(out, [1, 4])
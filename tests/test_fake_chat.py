@@ -0,0 +1,72 @@
+import os
+import unittest
+from philo.fake_chat import FakeChat
+from philo.questioner import Questioner
+from philo.utils import parse_structured_output
+
+
+class TestFakeChat(unittest.TestCase):
+
+    def setUp(self):
+        self.questioner = Questioner(history_filename_suffix="_test_fake_chat", fresh_start=True)
+        self.questioner.log = lambda text: None
+        self.chatbot = FakeChat()
+        self.questioner.set_chatbot(chatbot=self.chatbot)
+
+    def tearDown(self):
+        if os.path.exists(self.questioner.history_file_path):
+            os.remove(self.questioner.history_file_path)
+
+    def test_deterministic(self):
+        prompt = self.questioner.get_action_score_prompt(
+            "Lying to a friend",
+            self.get_score_action_pc(),
+            philosophies=[{"name": "Stoicism", "description": "Virtue is enough."}],
+        )
+        response = self.chatbot.send_receive(prompt)
+        self.assertEqual(FakeChat().send_receive(prompt), response)
+        self.assertEqual(parse_structured_output(response)[0]["philosophy"], "Stoicism")
+        usage = self.chatbot.get_last_usage()
+        self.assertGreater(usage["prompt_tokens"], usage["completion_tokens"])
+
+    def test_injected_errors(self):
+        chatbot = FakeChat(error_rate=0.5, malformed_rate=0.5)
+        prompt = self.get_score_action_pc().get_prompt("{\n\t'action':'x'\n\t'philosophies':[]\n}")
+        outcomes = []
+        for _ in range(20):
+            try:
+                parse_structured_output(chatbot.send_receive(prompt))
+                outcomes.append("ok")
+            except ConnectionError:
+                outcomes.append("error")
+            except Exception:
+                outcomes.append("malformed")
+        self.assertEqual(set(outcomes), {"ok", "error", "malformed"})
+        # The same attempts fail again in a new chatbot
+        chatbot = FakeChat(error_rate=0.5, malformed_rate=0.5)
+        for outcome in outcomes:
+            try:
+                parse_structured_output(chatbot.send_receive(prompt))
+                self.assertEqual(outcome, "ok")
+            except ConnectionError:
+                self.assertEqual(outcome, "error")
+            except Exception:
+                self.assertEqual(outcome, "malformed")
+
+    def test_stream_response(self):
+        prompt = self.get_score_action_pc().get_prompt("{\n\t'action':'x'\n\t'philosophies':[]\n}")
+        chatbot = FakeChat(chunk_size=4)
+        chunks = list(chatbot.stream_response(prompt))
+        # The chunks add up to the response, and the usage is known once they were all read
+        self.assertEqual("".join(chunks), FakeChat().send_receive(prompt))
+        self.assertEqual(chatbot.chunks, len(chunks))
+        self.assertEqual(chatbot.calls, 1)
+        self.assertIsNotNone(chatbot.get_last_usage())
+
+    def get_score_action_pc(self):
+        from philo.prompts import PromptConstructor
+
+        return PromptConstructor("score_action")
+
+if __name__ == "__main__":
+    unittest.main()
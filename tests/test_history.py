@@ -0,0 +1,86 @@
+import unittest
+import json
+import os
+import tempfile
+from philo.history import (
+    JSONHistory,
+    JSONLHistory,
+    hash_request,
+    open_history,
+    read_jsonl_history,
+)
+
+
+class TestHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "history_test.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_jsonl_round_trip(self):
+        history = JSONLHistory(self.path)
+        history["a"] = {"prompt": "p", "response": "r"}
+        history["b"] = {"prompt": "p2", "response": "r2"}
+        del history["a"]
+        history.close()
+        # Verify that reopening replays sets and deletes
+        reopened = JSONLHistory(self.path)
+        self.assertEqual(dict(reopened), {"b": {"prompt": "p2", "response": "r2"}})
+        reopened.close()
+
+    def test_jsonl_is_append_only(self):
+        history = JSONLHistory(self.path, compact_min_stale=10**6)
+        history["a"] = 1
+        size = os.path.getsize(self.path)
+        history["b"] = 2
+        with open(self.path, "r") as f:
+            self.assertEqual(len(f.read(size)), size)
+        self.assertEqual(read_jsonl_history(self.path), {"a": 1, "b": 2})
+        history.close()
+
+    def test_jsonl_torn_line(self):
+        with open(self.path, "w") as f:
+            f.write(json.dumps({"key": "a", "value": 1}) + "\n")
+            f.write('{"key": "b", "val')
+        history = JSONLHistory(self.path)
+        self.assertEqual(dict(history), {"a": 1})
+        history["c"] = 3
+        history.close()
+        self.assertEqual(read_jsonl_history(self.path), {"a": 1, "c": 3})
+
+    def test_jsonl_compaction(self):
+        history = JSONLHistory(self.path, compact_min_stale=5)
+        for i in range(20):
+            history["a"] = i
+        history.close()
+        with open(self.path, "r") as f:
+            n_lines = len(f.readlines())
+        self.assertLess(n_lines, 20, "The log was never compacted")
+        self.assertEqual(read_jsonl_history(self.path), {"a": 19})
+
+    def test_import_legacy_json(self):
+        legacy_path = os.path.join(self.tmp_dir.name, "history_test.json")
+        with open(legacy_path, "w") as f:
+            json.dump({"a": {"prompt": "p", "response": "r"}}, f)
+        history = open_history(self.path, backend="jsonl", legacy_path=legacy_path)
+        self.assertIn("a", history)
+        history.close()
+        self.assertIn("a", read_jsonl_history(self.path))
+
+    def test_json_backend(self):
+        path = os.path.join(self.tmp_dir.name, "history_test.json")
+        history = JSONHistory(path)
+        history["a"] = 1
+        history.save()
+        with open(path, "r") as f:
+            self.assertEqual(json.load(f), {"a": 1})
+
+    def test_hash_request(self):
+        request_body = {"model": "gpt-4", "messages": [{"role": "user", "content": "q"}], "seed": 1}
+        reordered = {"seed": 1, "messages": [{"role": "user", "content": "q"}], "model": "gpt-4"}
+        self.assertEqual(hash_request(request_body), hash_request(reordered))
+        changed = dict(request_body, seed=2)
+        self.assertNotEqual(hash_request(request_body), hash_request(changed))
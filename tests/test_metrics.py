@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+from philo.engine import run_concurrently
+from philo.metrics import MetricsRecorder, current_stage, get_usage_tokens
+
+
+def get_fields(prompt_name, prompt_tokens, cache_hit=False):
+    return {
+        "prompt_name": prompt_name,
+        "cache_hit": cache_hit,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": 1,
+        "retries": 0,
+        "parse_failures": 0,
+        "seconds": 0.5,
+    }
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_record_stage(self):
+        metrics = MetricsRecorder()
+        self.assertIsNone(metrics.record(**get_fields("a", 1))["stage"])
+        token = current_stage.set("actions")
+        try:
+            self.assertEqual(metrics.record(**get_fields("a", 1))["stage"], "actions")
+        finally:
+            current_stage.reset(token)
+
+    def test_stage_in_worker_threads(self):
+        metrics = MetricsRecorder()
+        token = current_stage.set("scores")
+        try:
+            run_concurrently(
+                lambda i: metrics.record(**get_fields("a", i)), range(4), max_concurrency=2
+            )
+        finally:
+            current_stage.reset(token)
+        self.assertEqual([r["stage"] for r in metrics.records], ["scores"] * 4)
+
+    def test_summary(self):
+        metrics = MetricsRecorder()
+        metrics.record(**get_fields("small", 5))
+        metrics.record(**get_fields("big", 10))
+        metrics.record(**get_fields("big", 20, cache_hit=True))
+        summary = metrics.get_summary()
+        self.assertEqual([row["prompt_name"] for row in summary], ["big", "small"])
+        self.assertEqual(summary[0]["calls"], 2)
+        self.assertEqual(summary[0]["cache_hits"], 1)
+        self.assertEqual(summary[0]["prompt_tokens"], 30)
+        self.assertEqual(summary[0]["seconds"], 1.0)
+        self.assertEqual(len(metrics.format_summary().splitlines()), 3)
+
+    def test_export(self):
+        metrics = MetricsRecorder()
+        metrics.record(**get_fields("a", 1))
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "metrics.jsonl")
+            metrics.export(path)
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+        self.assertEqual(records, metrics.records)
+
+    def test_usage_tokens(self):
+        self.assertEqual(get_usage_tokens(None), (0, 0))
+        self.assertEqual(get_usage_tokens({"prompt_tokens": 3, "completion_tokens": None}), (3, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
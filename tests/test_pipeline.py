@@ -0,0 +1,125 @@
+import unittest
+import os
+import tempfile
+import threading
+from philo.fake_chat import FakeChat
+from philo.pipeline import Pipeline, Stage, get_questioner_stages
+from philo.questioner import Questioner
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = os.path.join(self.tmp_dir.name, "checkpoints")
+        self.calls = []
+        self.state = {}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def get_stages(self, barrier=None):
+        def run(name, output):
+            def run_stage():
+                self.calls.append(name)
+                if barrier is not None and name in ["left", "right"]:
+                    # Only passes if both stages run at the same time
+                    barrier.wait(timeout=5)
+                return output
+
+            return run_stage
+
+        def restore(name):
+            return lambda output: self.state.__setitem__(name, output)
+
+        return [
+            Stage("root", run("root", 1), restore=restore("root")),
+            Stage("left", run("left", 2), ["root"], restore=restore("left")),
+            Stage("right", run("right", 3), ["root"], restore=restore("right")),
+            Stage("join", run("join", None), ["left", "right"]),
+        ]
+
+    def test_independent_stages_overlap(self):
+        pipeline = Pipeline(self.get_stages(barrier=threading.Barrier(2)))
+        outputs = pipeline.run()
+        self.assertEqual(outputs, {"root": 1, "left": 2, "right": 3, "join": None})
+        self.assertEqual(self.calls[0], "root")
+        self.assertEqual(self.calls[-1], "join")
+
+    def test_resume(self):
+        Pipeline(self.get_stages(), checkpoint_dir=self.checkpoint_dir).run()
+        self.calls = []
+        # Stages without a checkpoint run again, and so does everything after them
+        os.remove(os.path.join(self.checkpoint_dir, "left.json"))
+        Pipeline(self.get_stages(), checkpoint_dir=self.checkpoint_dir).run(resume=True)
+        self.assertEqual(sorted(self.calls), ["join", "left"])
+        self.assertEqual(self.state, {"root": 1, "right": 3})
+
+    def test_targets(self):
+        outputs = Pipeline(self.get_stages()).run(targets=["left"])
+        self.assertEqual(outputs, {"root": 1, "left": 2})
+        self.assertEqual(self.calls, ["root", "left"])
+        with self.assertRaises(ValueError):
+            Pipeline(self.get_stages()).run(targets=["missing"])
+
+    def test_invalid_graph(self):
+        with self.assertRaises(ValueError):
+            Pipeline([Stage("a", lambda: None, ["b"]), Stage("b", lambda: None, ["a"])])
+        with self.assertRaises(ValueError):
+            Pipeline([Stage("a", lambda: None, ["missing"])])
+
+    def test_failure(self):
+        def fail():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            Pipeline([Stage("a", fail), Stage("b", lambda: None, ["a"])]).run()
+
+
+class TestQuestionerStages(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.checkpoint_dir = os.path.join(self.tmp_dir.name, "checkpoints")
+        self.questioner = Questioner(history_filename_suffix="_test_pipeline", fresh_start=True)
+
+    def tearDown(self):
+        self.questioner.history.close()
+        os.remove(self.questioner.history_file_path)
+        self.tmp_dir.cleanup()
+
+    def test_stream(self):
+        q = self.questioner
+        q.log = lambda text: None
+        q.set_chatbot(chatbot=FakeChat())
+        pipeline = Pipeline(get_questioner_stages(q, stream=True))
+        # Streamed scores are fed by the actions stage, as in the command line
+        pipeline.run(targets=["actions", "action_scores"])
+        streamed_actions, streamed_scores = q.all_actions, q.action_scores
+        # The same actions and scores as without streaming, without duplicate actions
+        q.set_all_actions_from_philosophies()
+        q.set_all_actions()
+        self.assertEqual(streamed_actions, list(dict.fromkeys(q.all_actions)))
+        q.all_actions = streamed_actions
+        q.set_action_scores(prompt_version_number=0)
+        self.assertEqual(streamed_scores, q.action_scores)
+
+    def run_stages(self, resume: bool = False) -> int:
+        q = self.questioner
+        q.log = lambda text: None
+        q.set_chatbot(chatbot=FakeChat())
+        q.metrics.records.clear()
+        pipeline = Pipeline(get_questioner_stages(q), checkpoint_dir=self.checkpoint_dir)
+        pipeline.run(resume=resume, targets=["action_clusters"])
+        return sum(r["prompt_name"] == "determine_clusters" for r in q.metrics.records)
+
+    def test_cluster_labels_asked_once(self):
+        q = self.questioner
+        self.assertEqual(self.run_stages(), 1)
+        self.assertEqual(len(q.collect_action_clusters), len(q.all_actions))
+        # Resuming restores the labels from their checkpoint instead of asking again
+        self.assertEqual(self.run_stages(resume=True), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
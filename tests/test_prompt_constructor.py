@@ -1,7 +1,11 @@
+import os
+import shutil
+import tempfile
 import unittest
 from philo.chatbots import OpenAIChat
 from philo.utils import parse_structured_output
 from philo.prompts import PromptConstructor
+from philo.prompts.prompt_constructor import clear_prompt_cache, compiled_prompts
 
 
 class TestPromptConstructor(unittest.TestCase):
@@ -15,6 +19,8 @@ class TestPromptConstructor(unittest.TestCase):
             "determine_clusters",
             "action_cluster",
             "score_action",
+            "score_action_batch",
+            "name_clusters",
         ]
         return super().__init__()
 
@@ -41,3 +47,33 @@ class TestPromptConstructor(unittest.TestCase):
             # Only test for user input if it is in the prompt
             if "user_input" in pc.prompt_parts:
                 self.assertIn(test_user_input, prompt, "User input not found in prompt.")
+
+    def test_get_prompt_matches_replace(self):
+        # Verify that the compiled prompt renders like the substitutions done one by one
+        for prompt_name in self.prompt_titles:
+            pc = PromptConstructor(prompt_name=prompt_name, prompt_version_number=0)
+            pc.set_prompt_parts()
+            expected = pc.prompt_parts["base"]
+            for prompt_modifier in pc.prompt_modifiers:
+                if prompt_modifier in pc.prompt_parts:
+                    flag = "{{ " + prompt_modifier.upper() + " }}"
+                    expected = expected.replace(flag, pc.prompt_parts[prompt_modifier])
+            expected = expected.replace("{{ USER_INPUT }}", "SOME {{ TEST }} STRING")
+            self.assertEqual(pc.get_prompt("SOME {{ TEST }} STRING"), expected)
+
+    def test_prompt_cache(self):
+        # Verify that prompts are compiled once and recompiled when a file changes
+        clear_prompt_cache()
+        first = PromptConstructor("score_action").get_compiled_prompt()
+        self.assertIs(PromptConstructor("score_action").get_compiled_prompt(), first)
+        self.assertEqual(len(compiled_prompts), 1)
+        with tempfile.TemporaryDirectory() as folder:
+            pc = PromptConstructor("score_action")
+            pc.full_prompt_path = os.path.join(folder, "v0")
+            shutil.copytree(PromptConstructor("score_action").full_prompt_path, pc.full_prompt_path)
+            self.assertEqual(pc.get_prompt("ACTION"), first.render("ACTION"))
+            path = os.path.join(pc.full_prompt_path, "base.prompt")
+            with open(path, "w") as f:
+                f.write("Changed {{ USER_STRING }}")
+            os.utime(path, ns=(0, 0))
+            self.assertTrue(pc.get_prompt("ACTION").startswith("Changed"))
@@ -0,0 +1,414 @@
+import json
+import os
+import re
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import openai
+import pandas as pd
+from philo.fake_chat import FakeChat
+from philo.questioner import Questioner
+from philo.utils import parse_structured_output
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+HISTORY_SUFFIX = "_test_questioner_offline"
+
+
+class TestQuestionerOffline(unittest.TestCase):
+
+    def setUp(self):
+        self.questioner = Questioner(history_filename_suffix=HISTORY_SUFFIX, fresh_start=True)
+        self.questioner.log = lambda text: None
+        self.chatbot = FakeChat()
+        self.questioner.set_chatbot(chatbot=self.chatbot)
+
+    def tearDown(self):
+        if os.path.exists(self.questioner.history_file_path):
+            os.remove(self.questioner.history_file_path)
+
+    def test_every_prompt_family(self):
+        q = self.questioner
+        q.set_philosophies(prompt_version_number=1)
+        self.assertEqual(len(q.philosophies), 5)
+        q.set_all_actions_from_philosophies()
+        q.set_all_actions()
+        q.set_cluster_labels(prompt_version_number=0)
+        q.set_clusters_to_actions(prompt_version_number=0)
+        self.assertEqual(len(q.collect_action_clusters), len(q.all_actions))
+        q.set_action_scores(prompt_version_number=0)
+        q.set_action_scores(prompt_version_number=0, batch_size=4, force_refresh=True)
+        self.assertEqual(len(q.action_scores), len(q.all_actions) * len(q.philosophies))
+        q.set_clusters_to_actions(prompt_version_number=0, backend="local", force_refresh=True)
+        self.assertEqual(len(q.collect_action_clusters), len(q.all_actions))
+        # Without a chatbot judgement, the local backend leaves reason and aligned unset
+        for ac in q.collect_action_clusters:
+            self.assertIsNone(ac["reason"])
+            self.assertIsNone(ac["aligned"])
+            self.assertGreaterEqual(ac["similarity"], -1.0)
+        for actions in q.cluster_to_actions_dict.values():
+            similarities = [d["similarity"] for d in actions]
+            self.assertEqual(similarities, sorted(similarities, reverse=True))
+
+    def test_local_clusters(self):
+        q = self.questioner
+        # Duplicate actions leave k-means clusters empty; only clusters with actions are named
+        q.all_actions = ["Lying to a friend"] * 3 + ["Donating to charity"]
+        q.set_clusters_to_actions(prompt_version_number=0, backend="local", n_clusters=3)
+        self.assertEqual(len(q.cluster_labels), 2)
+        clusters = set(d["cluster"] for d in q.collect_action_clusters)
+        self.assertEqual(clusters, set(q.cluster_labels))
+        # Without actions, nothing is sent
+        calls = self.chatbot.calls
+        q.all_actions = []
+        q.set_clusters_to_actions(prompt_version_number=0, backend="local", force_refresh=True)
+        self.assertEqual((q.cluster_labels, q.collect_action_clusters), ([], []))
+        self.assertEqual(self.chatbot.calls, calls)
+
+    def test_scorecard(self):
+        q = self.questioner
+        q.set_philosophies(prompt_version_number=1)
+        q.set_all_actions_from_philosophies()
+        q.set_all_actions()
+        q.set_clusters_to_actions(prompt_version_number=0, backend="local")
+        q.set_action_scores(prompt_version_number=0)
+        export_formats = ("csv", "parquet") if pyarrow is not None else ("csv",)
+        with tempfile.TemporaryDirectory() as output_dir:
+            q.create_scorecard(
+                compact=True,
+                include_plotlyjs="cdn",
+                max_actions_per_page=5,
+                export_formats=export_formats,
+                output_dir=output_dir,
+            )
+            # One page per cluster, or per 5 actions of a cluster, linked from the index page
+            n_pages = sum(-(-len(d) // 5) for d in q.cluster_to_actions_dict.values())
+            pages = sorted(f for f in os.listdir(output_dir) if f.endswith(".html"))
+            self.assertEqual(len(pages), n_pages + 1)
+            with open(os.path.join(output_dir, "action_scores_heatmap.html")) as f:
+                links = re.findall(r'href="([^"]+)"', f.read())
+            expected = [f"action_scores_heatmap_{i + 1:03d}.html" for i in range(n_pages)]
+            self.assertEqual(links, expected)
+            # Every scored cell, with its cluster
+            columns = ["philosophy", "action", "cluster", "morality_value", "reason"]
+            for export_format in export_formats:
+                path = os.path.join(output_dir, f"action_scores.{export_format}")
+                df = pd.read_csv(path) if export_format == "csv" else pd.read_parquet(path)
+                self.assertEqual(list(df.columns), columns)
+                cells = {(d["philosophy"], d["action"]) for d in q.action_scores}
+                self.assertEqual(len(df), len(cells))
+            # Compact pages store reason codes, and the reasons once, in the lookup of the script
+            with open(os.path.join(output_dir, links[0])) as f:
+                page = f.read()
+            customdata = json.loads(re.search(r'"customdata":(\[\[.*?\]\])', page).group(1))
+            lookup = json.loads(re.search(r"var lookup = (.*);\n", page).group(1))
+            codes = {code for row in customdata for code in row}
+            self.assertTrue(all(isinstance(code, int) for code in codes))
+            self.assertLessEqual(max(codes), len(lookup["reasons"]) - 1)
+            self.assertEqual(len(customdata), len(lookup["philosophies"]))
+            self.assertNotIn("philosophy description:", page.split("var lookup")[0])
+
+    def test_action_scores_view(self):
+        q = self.questioner
+        scores = [{"action": "Lying", "philosophy": "P0", "morality": "immoral", "reason": "r"}]
+        q.action_scores = scores
+        # The list is a copy of the store: changing it changes nothing, assigning it does
+        q.action_scores.append({"action": "Helping", "philosophy": "P0", "morality": "moral"})
+        q.action_scores[0]["morality"] = "moral"
+        self.assertEqual(q.action_scores, scores)
+        self.assertEqual(len(q.score_store), 1)
+        q.action_scores = scores * 2
+        self.assertEqual(len(q.score_store), 2)
+
+    def test_iter_actions_from_philosophies(self):
+        q = self.questioner
+        q.set_philosophies(prompt_version_number=1)
+        q.set_all_actions_from_philosophies()
+        q.set_all_actions()
+        # Philosophies share some actions; streaming names each of them once
+        expected = list(dict.fromkeys(q.all_actions))
+        self.assertLess(len(expected), len(q.all_actions))
+        self.assertEqual(list(q.iter_actions_from_philosophies()), expected)
+        self.assertEqual(q.all_actions, expected)
+        # Concurrent responses arrive in any order, but all_actions keeps the philosophy order
+        q.max_concurrency = 4
+        q.set_chatbot(chatbot=FakeChat(latency=0.01, latency_jitter=0.01))
+        actions = list(q.iter_actions_from_philosophies())
+        self.assertEqual(sorted(actions), sorted(expected))
+        self.assertEqual(q.all_actions, expected)
+
+    def test_batched_json_scores(self):
+        # FakeResponder answers in JSON, so the action numbers of a batch are string keys
+        q = self.questioner
+        q.set_philosophies(prompt_version_number=1)
+        q.set_all_actions_from_philosophies()
+        q.set_all_actions()
+        q.set_action_scores(prompt_version_number=0, batch_size=4)
+        self.assertEqual(len(q.action_scores), len(q.all_actions) * len(q.philosophies))
+        # Every action was scored from its batch, none one by one
+        sent = [r["prompt_name"] for r in q.metrics.records if not r["cache_hit"]]
+        self.assertIn("score_action_batch", sent)
+        self.assertNotIn("score_action", sent)
+
+    def test_batch_split_per_action(self):
+        from philo.prompts import PromptConstructor
+
+        q = self.questioner
+        q.set_philosophies(prompt_version_number=1)
+        pc = PromptConstructor("score_action_batch")
+        score_action_pc = PromptConstructor("score_action")
+        actions = ["Lying to a stranger", "Helping a friend", "Breaking a promise"]
+        responder = self.chatbot.responder
+
+        def drop_second_action(prompt):
+            # The response leaves out the second action of the batch
+            out = json.loads(responder(prompt))
+            out.pop("2", None)
+            return json.dumps(out)
+
+        self.chatbot.responder = drop_second_action
+        n_calls = self.chatbot.calls
+        q.set_action_scores_from_batch(actions, pc, score_action_pc)
+        self.assertEqual(self.chatbot.calls, n_calls + 1, "The batch was not sent as one prompt")
+        # Each action in the response is stored under its own score_action key
+        for action in [actions[0], actions[2]]:
+            record = q.history[q.get_key("score_action", 0, action)]
+            self.assertEqual(
+                json.loads(record["response"]), responder.get_scores(action, q.philosophies)
+            )
+        self.assertNotIn(q.get_key("score_action", 0, actions[1]), q.history)
+        # The stored actions are read back one (philosophy, action) cell at a time, unsent
+        self.chatbot.responder = responder
+        scores = q.get_action_scores(actions[0], score_action_pc)
+        self.assertEqual(self.chatbot.calls, n_calls + 1)
+        expected = responder.get_scores(actions[0], q.philosophies)
+        self.assertEqual(scores, [{"action": actions[0], **d} for d in expected])
+        # The missing action is scored on its own
+        q.get_action_scores(actions[1], score_action_pc)
+        self.assertEqual(self.chatbot.calls, n_calls + 2)
+
+    def test_incremental_scores(self):
+        q = self.questioner
+        q.set_philosophies(prompt_version_number=1)
+        q.set_all_actions_from_philosophies()
+        q.set_all_actions()
+        q.all_actions = q.all_actions[:3]
+        q.set_action_scores(prompt_version_number=0)
+        before = {(d["philosophy"], d["action"]): d for d in q.action_scores}
+        n_records = len(q.metrics.records)
+        # One new philosophy and one new action
+        q.philosophies.append({"name": "Philosophy 6", "description": "The newest philosophy."})
+        q.all_actions.append("Lying to a stranger")
+        q.set_action_scores(prompt_version_number=0, incremental=True)
+        # Only the missing cells were sent: the new philosophy for every old action, and the new
+        # action against every philosophy
+        sent = [r["history_key"] for r in q.metrics.records[n_records:] if not r["cache_hit"]]
+        expected = [q.get_key("score_action", 0, a, "Philosophy 6") for a in q.all_actions[:3]]
+        expected.append(q.get_key("score_action", 0, "Lying to a stranger"))
+        self.assertEqual(sorted(sent), sorted(expected))
+        # The merged scores follow the actions, then the philosophies, and keep the old cells
+        names = [p["name"] for p in q.philosophies]
+        cells = [(d["philosophy"], d["action"]) for d in q.action_scores]
+        self.assertEqual(cells, [(name, a) for a in q.all_actions for name in names])
+        for d in q.action_scores:
+            if (d["philosophy"], d["action"]) in before:
+                self.assertEqual(d, before[(d["philosophy"], d["action"])])
+        with self.assertRaises(ValueError):
+            q.set_action_scores(prompt_version_number=0, incremental=True, batch_size=4)
+
+    def test_request_cache(self):
+        scores = json.dumps([{"philosophy": "P0", "morality": "moral", "reason": "r"}])
+        chatbot = FakeChat(responder=lambda prompt: scores)
+        q = self.questioner
+        q.set_chatbot(chatbot=chatbot)
+        key = "score_action||0||x"
+        q.send_receive("Score it.", key)
+        # The same request is read from history
+        q.send_receive("Score it.", key)
+        self.assertEqual(chatbot.calls, 1)
+        # A changed prompt is sent again
+        q.send_receive("Score it again.", key)
+        self.assertEqual(chatbot.calls, 2)
+        # So is the same prompt to another model
+        other_chatbot = FakeChat(model="other", responder=lambda prompt: scores)
+        q.set_chatbot(chatbot=other_chatbot)
+        q.send_receive("Score it again.", key)
+        self.assertEqual((chatbot.calls, other_chatbot.calls), (2, 1))
+
+    def test_request_cache_other_key(self):
+        # A response to the same request under another key is reused, and copied under the key
+        chatbot = FakeChat(responder=lambda prompt: json.dumps(["Stoicism"]))
+        q = self.questioner
+        q.set_chatbot(chatbot=chatbot)
+        first_key, second_key = "philosophies||0||", "philosophies||1||"
+        out = q.send_receive("Name them.", first_key)
+        self.assertEqual(q.send_receive("Name them.", second_key), out)
+        self.assertEqual(chatbot.calls, 1)
+        request_hash = q.get_request_hash("Name them.", first_key)
+        self.assertEqual(q.history[second_key]["request_hash"], request_hash)
+
+    def test_request_cache_legacy_record(self):
+        # Records written before request hashes are reused only for the same prompt
+        chatbot = FakeChat(responder=lambda prompt: json.dumps(["Hedonism"]))
+        q = self.questioner
+        q.set_chatbot(chatbot=chatbot)
+        key = "philosophies||0||"
+        q.history[key] = {"prompt": "Name them.", "response": json.dumps(["Stoicism"])}
+        self.assertEqual(json.loads(q.send_receive("Name them.", key)), ["Stoicism"])
+        self.assertEqual(chatbot.calls, 0)
+        self.assertEqual(json.loads(q.send_receive("Name them all.", key)), ["Hedonism"])
+        self.assertEqual(chatbot.calls, 1)
+
+    def test_candidates(self):
+        # The single response and the first candidate are malformed, the second is not
+        answers = iter(["[{", "[{", '[{"philosophy": "Stoicism", "morality": "moral"}]'])
+        chatbot = FakeChat(responder=lambda prompt: next(answers))
+        q = self.questioner
+        q.n_candidates = 2
+        q.set_chatbot(chatbot=chatbot)
+        out = q.send_receive("Score it.", "score_action||0||x")
+        self.assertEqual(parse_structured_output(out)[0]["morality"], "moral")
+        # One request for the single response, one for both candidates
+        self.assertEqual(chatbot.calls, 2)
+        self.assertEqual(q.metrics.records[-1]["parse_failures"], 2)
+
+    def test_majority_vote(self):
+        answers = iter(["moral", "immoral", "immoral"])
+
+        def responder(prompt):
+            return json.dumps(
+                [{"philosophy": "Stoicism", "morality": next(answers), "reason": "r"}]
+            )
+
+        q = Questioner(history_filename_suffix=HISTORY_SUFFIX, n_candidates=3, majority_vote=True)
+        q.log = lambda text: None
+        q.philosophies = [{"name": "Stoicism", "description": "Virtue is enough."}]
+        q.set_chatbot(chatbot=FakeChat(responder=responder))
+        scores = q.get_action_scores("Lying", self.get_score_action_pc())
+        self.assertEqual(scores[0]["morality"], "immoral")
+        record = q.history[q.get_key("score_action", 0, "Lying")]
+        self.assertEqual(record["agreement"], [2 / 3])
+        with self.assertRaises(ValueError):
+            q.set_action_scores(prompt_version_number=0, batch_size=4)
+
+    def test_stream_responses(self):
+        # The first response has a bad item early on, the retry is fine
+        scores = [{"philosophy": f"P{i}", "morality": "moral", "reason": "r"} for i in range(20)]
+        bad = '[{"philosophy": "P0"}, {"philosophy": oops}, ' + "x" * 2000
+        answers = iter([bad, json.dumps(scores)])
+        chatbot = FakeChat(responder=lambda prompt: next(answers))
+        q = Questioner(history_filename_suffix=HISTORY_SUFFIX, stream_responses=True)
+        q.log = lambda text: None
+        q.set_chatbot(chatbot=chatbot)
+        items = []
+        out = q.send_receive(
+            "Score it.", "score_action||0||x", on_item=lambda index, _: items.append(index)
+        )
+        self.assertEqual(parse_structured_output(out), scores)
+        # The retry hands the items over again from the start
+        self.assertEqual(items, [0] + list(range(20)))
+        # The bad response was aborted after a few chunks
+        self.assertLess(chatbot.chunks, 10 + len(out) // chatbot.chunk_size)
+        self.assertEqual(q.metrics.records[-1]["parse_failures"], 1)
+        self.assertIsNotNone(q.metrics.records[-1]["first_item_seconds"])
+
+    def test_item_callback_error(self):
+        # An exception in on_item is the caller's, so the prompt is not sent again
+        def on_item(index, item):
+            raise KeyError(index)
+
+        for stream_responses in [False, True]:
+            chatbot = FakeChat(responder=lambda prompt: json.dumps(["Stoicism", "Hedonism"]))
+            q = Questioner(
+                history_filename_suffix=HISTORY_SUFFIX, stream_responses=stream_responses
+            )
+            q.log = lambda text: None
+            q.set_chatbot(chatbot=chatbot)
+            with self.assertRaises(KeyError):
+                q.send_receive("Name them.", None, force_refresh=True, on_item=on_item)
+            self.assertEqual(chatbot.calls, 1)
+
+    def test_duplicate_requests_in_flight(self):
+        # Concurrent callers of the same uncached request send it once and share the response
+        scores = [{"philosophy": "P0", "morality": "moral", "reason": "r"}]
+        chatbot = FakeChat(latency=0.05, responder=lambda prompt: json.dumps(scores))
+        q = Questioner(history_filename_suffix=HISTORY_SUFFIX)
+        q.log = lambda text: None
+        q.set_chatbot(chatbot=chatbot)
+        keys = [f"score_action||0||{i % 2}" for i in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            outs = list(executor.map(lambda key: q.send_receive("Score it.", key), keys))
+        self.assertEqual(chatbot.calls, 1)
+        self.assertEqual([parse_structured_output(out) for out in outs], [scores] * 4)
+        self.assertEqual(sum(not r["cache_hit"] for r in q.metrics.records), 1)
+        self.assertEqual(q.requests_in_flight, {})
+
+    def test_errors_not_retried(self):
+        # An invalid API key or a bug fails the same way every time, so the prompt is sent once
+        request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+        auth_error = openai.AuthenticationError(
+            "Invalid API key.", response=httpx.Response(401, request=request), body=None
+        )
+        for error in [auth_error, KeyError("bug")]:
+
+            def responder(prompt):
+                raise error
+
+            chatbot = FakeChat(responder=responder)
+            q = Questioner(history_filename_suffix=HISTORY_SUFFIX)
+            q.log = lambda text: None
+            q.set_chatbot(chatbot=chatbot)
+            with self.assertRaises(type(error)):
+                q.send_receive("Score it.", "score_action||0||x")
+            self.assertEqual(chatbot.calls, 1)
+            self.assertTrue(q.metrics.records[-1]["failed"])
+            self.assertEqual(q.metrics.records[-1]["parse_failures"], 0)
+
+    def test_structured_output(self):
+        # Constrained responses are never malformed, so nothing is retried
+        chatbot = FakeChat(malformed_rate=0.5)
+        q = Questioner(history_filename_suffix=HISTORY_SUFFIX, structured_output=True)
+        q.log = lambda text: None
+        q.set_chatbot(chatbot=chatbot)
+        q.set_philosophies(prompt_version_number=1)
+        q.set_all_actions_from_philosophies()
+        q.set_all_actions()
+        q.set_cluster_labels(prompt_version_number=0)
+        q.set_clusters_to_actions(prompt_version_number=0, backend="local")
+        self.assertEqual(len(q.collect_action_clusters), len(q.all_actions))
+        q.set_action_scores(prompt_version_number=0, batch_size=4)
+        self.assertEqual(len(q.action_scores), len(q.all_actions) * len(q.philosophies))
+        self.assertEqual(sum(record["parse_failures"] for record in q.metrics.records), 0)
+        # Every batched response was split between its actions
+        sent = [r["prompt_name"] for r in q.metrics.records if not r["cache_hit"]]
+        self.assertNotIn("score_action", sent)
+        # The history stores the parsed response, without the scratchpad
+        record = q.history[q.get_key("score_action", 0, q.all_actions[0])]
+        scores = parse_structured_output(record["response"])
+        self.assertEqual(scores[0]["philosophy"], "Philosophy 1")
+        with self.assertRaises(ValueError):
+            Questioner(structured_output=True, stream_responses=True)
+
+    def test_structured_output_off_schema(self):
+        # A response that is valid JSON but breaks the schema is retried
+        scores = [{"philosophy": "A", "morality": "moral", "reason": "r"}]
+        answers = iter([json.dumps([{**scores[0], "morality": "good"}]), json.dumps(scores)])
+        chatbot = FakeChat(responder=lambda prompt: next(answers))
+        q = Questioner(history_filename_suffix=HISTORY_SUFFIX, structured_output=True)
+        q.log = lambda text: None
+        q.set_chatbot(chatbot=chatbot)
+        out = q.send_receive("Score it.", "score_action||0||x")
+        self.assertEqual(json.loads(out), scores)
+        self.assertEqual(q.metrics.records[-1]["parse_failures"], 1)
+
+    def get_score_action_pc(self):
+        from philo.prompts import PromptConstructor
+
+        return PromptConstructor("score_action")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import time
+import httpx
+import openai
+from philo.rate_limit import (
+    RateLimiter,
+    get_backoff_delay,
+    get_retry_after,
+    is_rate_limit_error,
+    is_transient_error,
+)
+
+
+class TestRateLimit(unittest.TestCase):
+
+    def setUp(self):
+        self.request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+
+    def test_unlimited(self):
+        limiter = RateLimiter()
+        start = time.monotonic()
+        for _ in range(100):
+            limiter.acquire(10_000)
+        self.assertLess(time.monotonic() - start, 1.0, "An unlimited limiter should not wait")
+
+    def test_requests_per_minute(self):
+        # One request per 50ms, with a bucket of 1200 requests that starts full
+        limiter = RateLimiter(requests_per_minute=1200)
+        limiter.available_requests = 0
+        start = time.monotonic()
+        limiter.acquire()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_pause(self):
+        limiter = RateLimiter()
+        limiter.pause(0.1)
+        start = time.monotonic()
+        limiter.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_backoff_delay(self):
+        for attempt in range(1, 10):
+            delay = get_backoff_delay(attempt, base=1.0, cap=8.0)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, min(8.0, 2 ** (attempt - 1)))
+
+    def test_errors(self):
+        response = httpx.Response(429, headers={"retry-after": "3"}, request=self.request)
+        rate_limit_error = openai.RateLimitError("Rate limited", response=response, body=None)
+        self.assertTrue(is_transient_error(rate_limit_error))
+        self.assertTrue(is_rate_limit_error(rate_limit_error))
+        self.assertEqual(get_retry_after(rate_limit_error), 3.0)
+        timeout_error = openai.APITimeoutError(request=self.request)
+        self.assertTrue(is_transient_error(timeout_error))
+        self.assertFalse(is_rate_limit_error(timeout_error))
+        self.assertIsNone(get_retry_after(timeout_error))
+        self.assertFalse(is_transient_error(SyntaxError("unexpected EOF")))
+        self.assertTrue(is_transient_error(ConnectionError("Connection reset")))
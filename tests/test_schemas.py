@@ -0,0 +1,61 @@
+import json
+import os
+import unittest
+from philo.prompts import PromptConstructor
+from philo.schemas import compile_validator, get_output_schema
+from philo.utils import get_repo_root
+
+
+class TestOutputSchema(unittest.TestCase):
+
+    def test_every_prompt_family(self):
+        prompts_path = os.path.join(get_repo_root(), "philo", "prompts")
+        for prompt_name in os.listdir(prompts_path):
+            if not os.path.isdir(os.path.join(prompts_path, prompt_name)) or prompt_name[0] == "_":
+                continue
+            output_schema = PromptConstructor(prompt_name).get_output_schema()
+            self.assertIsNotNone(output_schema, prompt_name)
+            response_format = output_schema.get_response_format()
+            self.assertTrue(response_format["json_schema"]["strict"])
+            # Strict structured outputs need an object at the root with every property required
+            schema = response_format["json_schema"]["schema"]
+            self.assertEqual(schema["type"], "object")
+            self.assertEqual(schema["required"], list(schema["properties"]))
+            self.assertFalse(schema["additionalProperties"])
+
+    def test_parse(self):
+        output_schema = get_output_schema("score_action")
+        scores = [{"philosophy": "A", "morality": "moral", "reason": "r"}]
+        text = json.dumps({"scratchpad": "# A: fine", "response": scores})
+        self.assertEqual(output_schema.parse(text), scores)
+        self.assertEqual(json.loads(output_schema.get_response(text)), scores)
+        bad = [
+            '{"scratchpad": "# A", "response": [',
+            json.dumps({"response": scores}),
+            json.dumps({"scratchpad": "", "response": [{**scores[0], "morality": "good"}]}),
+            json.dumps({"scratchpad": "", "response": [{**scores[0], "extra": 1}]}),
+            json.dumps({"scratchpad": "", "response": scores[0]}),
+        ]
+        for text in bad:
+            with self.assertRaises(ValueError):
+                output_schema.parse(text)
+
+    def test_dictionaries(self):
+        # Numbered groups are sent as a list and parsed back to a dictionary
+        output_schema = get_output_schema("name_clusters")
+        text = output_schema.to_structured({1: "cluster 1", 2: "cluster 2"})
+        self.assertEqual(json.loads(text)["response"][1], {"group": 2, "label": "cluster 2"})
+        self.assertEqual(output_schema.parse(text), {1: "cluster 1", 2: "cluster 2"})
+
+    def test_validator(self):
+        validate = compile_validator({"type": ["integer", "null"]})
+        validate(1, "x")
+        validate(None, "x")
+        for value in [True, 1.5, "1"]:
+            with self.assertRaises(ValueError):
+                validate(value, "x")
+        compile_validator({"type": "boolean"})(True, "x")
+
+
+if __name__ == "__main__":
+    unittest.main()
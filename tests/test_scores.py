@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+from philo.scores import MISSING_VALUE, ScoreStore, get_majority_scores
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestScoreMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.action_scores = [
+            {"action": "Lying", "philosophy": "Kantianism", "morality": "immoral", "reason": "r1"},
+            {"action": "Lying", "philosophy": "Hedonism", "morality": "moral", "reason": "r2"},
+            {"action": "Donating", "philosophy": "Hedonism", "morality": "undecided", "reason": "r3"},
+        ]
+        self.score_matrix = ScoreStore.from_records(self.action_scores).get_score_matrix()
+
+    def test_values(self):
+        self.assertEqual(self.score_matrix.philosophies.tolist(), ["Hedonism", "Kantianism"])
+        self.assertEqual(self.score_matrix.actions.tolist(), ["Donating", "Lying"])
+        self.assertEqual(self.score_matrix.values.dtype, np.int8)
+        np.testing.assert_array_equal(self.score_matrix.values, [[0, 1], [MISSING_VALUE, -1]])
+        # Unscored cells have an empty reason
+        reasons = self.score_matrix.reasons[self.score_matrix.reason_codes]
+        self.assertEqual(reasons.tolist(), [["r3", "r2"], ["", "r1"]])
+
+    def test_philosophy_ranking(self):
+        # Hedonism has one moral action, Kantianism none
+        ranking = self.score_matrix.get_philosophy_ranking()
+        self.assertEqual(self.score_matrix.philosophies[ranking].tolist(), ["Hedonism", "Kantianism"])
+
+    def test_reorder(self):
+        reordered = self.score_matrix.reorder(philosophy_order=np.array([1, 0]), actions=["Lying", "Donating"])
+        np.testing.assert_array_equal(reordered.values, [[-1, MISSING_VALUE], [1, 0]])
+        with self.assertRaises(ValueError):
+            self.score_matrix.reorder(actions=["Stealing"])
+
+    def test_hover_text(self):
+        hover_text = self.score_matrix.get_hover_text({"Hedonism": "Pleasure first."})
+        self.assertEqual(hover_text.shape, (2, 2))
+        self.assertEqual(
+            hover_text[0, 1],
+            "philosophy: Hedonism<br>philosophy description: Pleasure first.<br>action: Lying<br>reason: r2",
+        )
+
+    def test_duplicate_cells(self):
+        action_scores = self.action_scores + [
+            {"action": "Lying", "philosophy": "Kantianism", "morality": "immoral", "reason": "r4"}
+        ]
+        score_matrix = ScoreStore.from_records(action_scores).get_score_matrix()
+        self.assertEqual(score_matrix.values[1, 1], -1)
+        self.assertEqual(score_matrix.reasons[score_matrix.reason_codes[1, 1]], "r1, r4")
+
+    def test_majority_scores(self):
+        candidates = [
+            [{"philosophy": "Stoicism", "morality": "moral", "reason": "a"}],
+            [
+                {"philosophy": "Stoicism", "morality": "immoral", "reason": "b"},
+                {"philosophy": "Hedonism", "morality": "moral", "reason": "c"},
+            ],
+            [{"philosophy": "Stoicism", "morality": "immoral", "reason": "d"}, "not a score"],
+        ]
+        scores, agreement = get_majority_scores(candidates)
+        self.assertEqual([d["reason"] for d in scores], ["b", "c"])
+        self.assertEqual(agreement, [2 / 3, 1.0])
+        # Ties go to the label given first
+        scores, _ = get_majority_scores(candidates[:2])
+        self.assertEqual(scores[0]["reason"], "a")
+
+    def test_long_frame(self):
+        long_frame = self.score_matrix.to_long_frame()
+        # The unscored cell is left out
+        self.assertEqual(len(long_frame), 3)
+        self.assertEqual(list(long_frame.columns), ["philosophy", "action", "morality_value", "reason"])
+        self.assertNotIn(MISSING_VALUE, long_frame["morality_value"].tolist())
+
+
+class TestScoreStore(unittest.TestCase):
+
+    def setUp(self):
+        self.action_scores = [
+            {"action": "Lying", "philosophy": "Kantianism", "morality": "immoral", "reason": "r1"},
+            {"action": "Lying", "philosophy": "Hedonism", "morality": "moral", "reason": "r2"},
+            {"action": "Donating", "philosophy": "Hedonism", "morality": "undecided", "reason": "r3"},
+            {"action": "Lying", "philosophy": "Kantianism", "morality": "immoral", "reason": "r4"},
+            # Irregular rows, as a model may return them
+            {"action": "Stealing", "philosophy": "Hedonism", "morality": "unsure", "reason": None},
+            {"action": "Stealing", "philosophy": "Stoicism", "morality": "immoral"},
+            {"action": "Helping", "philosophy": "Stoicism", "morality": "moral", "reason": 3, "x": 1},
+        ]
+        self.store = ScoreStore.from_records(self.action_scores)
+
+    def test_to_dicts(self):
+        self.assertEqual(self.store.to_dicts(), self.action_scores)
+        # The dictionaries are copies of the rows
+        self.store.to_dicts()[0]["morality"] = "moral"
+        self.store.to_dicts().append({})
+        self.assertEqual(self.store.to_dicts(), self.action_scores)
+        self.assertEqual(len(self.store.actions), 4)
+        self.assertEqual(self.store.moralities.itemsize, 1)
+
+    def test_score_matrix(self):
+        score_matrix = self.store.get_score_matrix()
+        self.assertEqual(score_matrix.philosophies.tolist(), ["Hedonism", "Kantianism", "Stoicism"])
+        self.assertEqual(score_matrix.actions.tolist(), ["Donating", "Helping", "Lying", "Stealing"])
+        # Unknown labels are not scored, and reasons that are not strings are shown as strings
+        M = MISSING_VALUE
+        np.testing.assert_array_equal(
+            score_matrix.values, [[0, M, 1, M], [M, M, -1, M], [M, 1, M, -1]]
+        )
+        self.assertEqual(
+            score_matrix.reasons[score_matrix.reason_codes].tolist(),
+            [["r3", "", "r2", ""], ["", "", "r1, r4", ""], ["", "3", "", ""]],
+        )
+        self.assertEqual(ScoreStore().get_score_matrix().values.shape, (0, 0))
+
+    def test_columns(self):
+        self.store.set_action_clusters({"Lying": "Honesty", "Helping": "Care"})
+        store = ScoreStore.from_columns(json.loads(json.dumps(self.store.to_columns())))
+        self.assertEqual(store.to_dicts(), self.action_scores)
+        self.assertEqual(store.to_columns(), self.store.to_columns())
+        self.assertEqual(store.clusters.strings, ["Honesty", "Care"])
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_save_load(self):
+        self.store.set_action_clusters({"Lying": "Honesty", "Helping": "Care"})
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for filename in ["scores.parquet", "scores.arrow"]:
+                path = os.path.join(tmpdir, filename)
+                self.store.save(path)
+                store = ScoreStore.load(path)
+                self.assertEqual(store.to_dicts(), self.action_scores)
+                table = ScoreStore.read_table(path)
+                clusters = ["Honesty", "Honesty", None, "Honesty", None, None, "Care"]
+                self.assertEqual(table.column("cluster").to_pylist(), clusters)
+                self.assertEqual(store.to_arrow().column("cluster").to_pylist(), clusters)
+            with self.assertRaises(ValueError):
+                self.store.save(os.path.join(tmpdir, "scores.csv"))
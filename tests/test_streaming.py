@@ -0,0 +1,52 @@
+import unittest
+from philo.streaming import IncrementalParser
+from philo.utils import parse_structured_output
+
+
+def parse_in_chunks(text: str, chunk_size: int) -> list:
+    parser = IncrementalParser()
+    items = []
+    for start in range(0, len(text), chunk_size):
+        items += parser.feed(text[start : start + chunk_size])
+    return items + parser.close()
+
+
+class TestIncrementalParser(unittest.TestCase):
+
+    def test_items(self):
+        texts = [
+            '[{"philosophy": "A", "morality": "moral"}, {"philosophy": "B", "morality": "bad"}]',
+            # A scratchpad, code fences, comments, apostrophes and a trailing comma
+            "# A: it's fine\n```python\n[\n    {'philosophy': 'A', 'reason': 'It's ok # really'},"
+            "  # a comment ]\n    {'philosophy': 'B', 'reason': 'No'},\n]\n```\n",
+            '["cluster 1", "cluster 2"]',
+        ]
+        for text in texts:
+            for chunk_size in [1, 3, 1000]:
+                self.assertEqual(parse_in_chunks(text, chunk_size), parse_structured_output(text))
+        # Dictionaries are handed over one (key, value) pair at a time
+        self.assertEqual(parse_in_chunks('{1: [{"a": 1}], 2: []}', 2), [(1, [{"a": 1}]), (2, [])])
+
+    def test_items_as_soon_as_complete(self):
+        parser = IncrementalParser()
+        self.assertEqual(parser.feed('[{"philosophy": "A"}, {"philo'), [{"philosophy": "A"}])
+        self.assertEqual(parser.feed('sophy": "B"}'), [{"philosophy": "B"}])
+        self.assertEqual(parser.feed("]"), [])
+        self.assertEqual(parser.close(), [])
+
+    def test_early_abort(self):
+        parser = IncrementalParser()
+        parser.feed('[{"philosophy": "A"}, ')
+        # The bad item is detected before the rest of the response arrives
+        with self.assertRaises(ValueError):
+            parser.feed('{"philosophy": oops}, ')
+        with self.assertRaises(ValueError):
+            IncrementalParser().feed("Sure! Here are the scores:")
+        with self.assertRaises(ValueError):
+            parse_in_chunks('[{"philosophy": "A"}', 4)
+        with self.assertRaises(ValueError):
+            parse_in_chunks("[1] and more", 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import unittest
+from philo.synthetic import generate_history, get_synthetic_actions
+from philo.utils import get_repo_root, load_history
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def tearDown(self):
+        for extension in ["json", "jsonl"]:
+            path = os.path.join(get_repo_root(), f"history_test_synthetic.{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_synthetic_actions(self):
+        actions = get_synthetic_actions(5000)
+        self.assertEqual(len(set(actions)), 5000)
+        self.assertEqual(get_synthetic_actions(10), actions[:10])
+
+    def test_generate_history(self):
+        q = generate_history(23, n_philosophies=4, history_filename_suffix="_test_synthetic")
+        self.assertEqual(len(q.philosophies), 4)
+        self.assertEqual(sorted(q.all_actions), sorted(get_synthetic_actions(23)))
+        self.assertEqual(len(q.action_scores), 23 * 4)
+        self.assertEqual(len(q.collect_action_clusters), 23)
+        # The history is written as history{suffix}.json
+        self.assertTrue(q.history_file_path.endswith("history_test_synthetic.json"))
+        self.assertFalse(os.path.exists(q.history_file_path + "l"))
+        history = load_history("_test_synthetic")
+        self.assertEqual(len(history), len(q.history))
+        self.assertIn("score_action||0||" + q.all_actions[0], history)
+
+
+if __name__ == "__main__":
+    unittest.main()
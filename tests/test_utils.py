@@ -1,5 +1,11 @@
 import unittest
-from philo.utils import parse_structured_output, load_history, get_repo_root
+from philo.utils import (
+    PARSE_ERRORS,
+    get_numbered_items,
+    parse_structured_output,
+    load_history,
+    get_repo_root,
+)
 
 
 class TestUtils(unittest.TestCase):
@@ -16,6 +22,30 @@ class TestUtils(unittest.TestCase):
         self.history = load_history()
         self.assertIsInstance(self.history, dict, "History is not a dictionary")
 
+    def test_get_numbered_items(self):
+        self.assertEqual(get_numbered_items({1: "a", "2": "b", "x": "c"}), {1: "a", 2: "b"})
+
     def test_get_repo_root(self):
         rr = get_repo_root()
         self.assertIsInstance(rr, str, "Repo root is not a string")
+
+    def test_parse_structured_output_scratchpad(self):
+        text = "### Scratchpad\n# Kant's view\n```\n[\n    {'name': 'C# fans', 'aligned': True}, # comment\n]\n```"
+        self.assertEqual(parse_structured_output(text), [{"name": "C# fans", "aligned": True}])
+
+    def test_parse_structured_output_json(self):
+        text = '{"reason": "It\'s fine", "aligned": false, "extra": null}'
+        self.assertEqual(
+            parse_structured_output(text),
+            {"reason": "It's fine", "aligned": False, "extra": None},
+        )
+
+    def test_parse_structured_output_multiline_string(self):
+        text = "{'reason': 'The action is about\n    lying'}"
+        self.assertEqual(parse_structured_output(text), {"reason": "The action is about    lying"})
+
+    def test_parse_structured_output_errors(self):
+        # Every unparsable response raises one of PARSE_ERRORS
+        for text in [None, "[{'a': 1", "Sorry, I can't help with that."]:
+            with self.assertRaises(PARSE_ERRORS):
+                parse_structured_output(text)